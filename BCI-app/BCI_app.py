@@ -1,19 +1,44 @@
 #%% imports
+# pyarrow and plotly are imported by the outputs using them, see startup_timing.LAZY_MODULES
+import startup_timing
 import faicons as fa
-import plotly.express as px
-import numpy as np
-import pandas as pd
 # Load data and compute static values
 from shinywidgets import render_plotly
 # from functools import partial # used for creating navigation bars
-from shiny import reactive, render
+from shiny import reactive, render, req
 from shiny.express import input, ui
+from shiny.session import get_current_session
 # from shiny.ui import page_navbar # used for creating navigation bars
-import duckdb
 #import ibis
-#import helpers
+import helpers
 #import os
+import asyncio
+import json
+import tempfile
 from pathlib import Path
+import MCI_calculations as mc
+import building_aggregates
+import change_feed
+import ddf_scores as ddf
+from database import BuildingDatabase, default_db_path, get_database
+import migrations
+import products
+import ingest
+import result_cache
+from result_cache import RESULTS
+import sensitivity
+import uncertainty
+import write_queue
+import optimizer
+import portfolio
+import charts
+import lca
+import mfa
+import rate_limit
+import scenarios
+import profiling
+
+startup_timing.mark("imports")
 
 #%%
 # Defining project paths
@@ -27,9 +52,34 @@ data_dir = app_dir / "data"
 
 database = True
 
-# open connection to a building database file 'building_data.db'
+# shared building database file 'building_data.db' (or BCI_DB), each session queries it through its own cursor
+# set BCI_READ_ONLY=1 to serve read-only dashboards
 if database:
-    con = duckdb.connect(data_dir / "building_data.db")
+    db = get_database(default_db_path)
+    if db.read_only:
+        # read-only files cannot be migrated, the views below need the latest schema
+        with db.cursor() as con:
+            version = migrations.applied_version(con)
+        if version < migrations.LATEST:
+            raise RuntimeError(
+                f"{db.path.name} has schema version {version} and the app needs version {migrations.LATEST}, migrate "
+                f"it with `python migrations.py --db {db.path}` before serving it read-only (BCI_READ_ONLY=1)"
+            )
+    else:
+        # existing files are migrated in place to the latest schema
+        db.setup(migrations.migrate)
+else:
+    # in-memory demo inventory
+    db = BuildingDatabase(":memory:")
+    with db.write() as con:
+        migrations.migrate(con)
+        products.upsert_rows(con, [
+            ("Product 1", 0.1, 0.2, 0.3, 0.4, "Building 1", 1.0),
+            ("Product 2", 0.25, 0.25, 0.25, 0.25, "Building 1", 1.0),
+            ("Product 3", 0.9, 0, 0.1, 0, "Building 1", 1.0),
+        ])
+
+startup_timing.mark("database")
 
 
 #%%
@@ -136,46 +186,37 @@ ICONS = {
     "gear": fa.icon_svg("gears", "solid"),
 }
 
-if database:
-    R_strategies = con.table("r_strategies").df()
-    # R_strategies.drop(columns=["Product"], inplace=True)
-    print(R_strategies)
-
-    default_building_data = pd.DataFrame(
-        {"Product": "Product "+str(len(R_strategies)+1), "Virgin": 0.0, "Reused": 0.0, "Recycled": 0.0, "Repurposed": 0.0},
-        index=["Product"]
-    )
-
-else:
-    R_strategies = pd.DataFrame(
-        np.array([[0.1, 0.2, 0.3, 0.4],[0.25, 0.25, 0.25, 0.25],[0.9, 0, 0.1, 0]]),
-        columns=["Virgin", "Reused", "Recycled", "Repurposed"])
-    # ,index=["Product 1", "Product 2", "Product 3"]
-    # )
-    print(R_strategies)
+# bumped by the change feed (see the end of the file) on every change of the products, whichever session made it
+products_version = reactive.value(0)
+# narrower signals, so that a change only refetches the views it can show on
+membership_version = reactive.value(0)  # products inserted or deleted
+grid_version = reactive.value(0)  # changes of the products on the current page of the grid
+pie_version = reactive.value(0)  # changes of the product of the pie chart
+grid_products = set()
 
 
+# outputs use render.text/render.ui rather than render.express, whose source transformation runs for every session
 with ui.layout_columns(fill=False):
     with ui.value_box(showcase=ICONS["building"]):
         "Building Circularity Indicator"
 
-        @render.express
+        @render.text
         def building_circularity_score():
-            f"""{bci():.1%}"""
+            return f"{bci_shown():.1%}"
 
     with ui.value_box(showcase=ICONS["MCI/BCI"]):
         "Material Circularity Indicator"
 
-        @render.express
+        @render.text
         def material_circularity():
-            f"""{mci():.1%}"""
+            return f"{mci_shown():.1%}"
 
     with ui.value_box(showcase=ICONS["cost"]):
         "Project cost"
 
-        @render.express
+        @render.text
         def average_bill():
-            f"""${project_cost():.2f}"""
+            return f"${cost_shown():.2f}"
 
 
 ui.markdown(
@@ -192,11 +233,49 @@ with ui.layout_columns():
     with ui.card(full_screen=True):
         ui.card_header("Circular strategies for each product")
 
+        # only the visible page is fetched, sorting and filtering run in DuckDB
+        with ui.layout_columns(col_widths=[6, 3, 3]):
+            ui.input_text("product_search", None, placeholder="Filter by product or building")
+            ui.input_select("product_sort", None, products.SORT_COLUMNS)
+            ui.input_switch("product_desc", "Descending")
+
         @render.data_frame
         def table():
-            return render.DataGrid(R_strategies, editable=True)
-
-        if database:
+            grid_version()
+            with db.cursor() as con:
+                rows = products.product_page(
+                    con,
+                    page=input.product_page() or 1,
+                    page_size=int(input.page_size()),
+                    sort=input.product_sort(),
+                    descending=input.product_desc(),
+                    search=input.product_search(),
+                )
+            grid_products.clear()
+            grid_products.update(rows.column("Product").to_pylist())
+            return render.DataGrid(rows)
+
+        with ui.layout_columns(col_widths=[4, 4, 4]):
+            ui.input_numeric("product_page", "Page", value=1, min=1)
+            ui.input_select("page_size", "Rows per page", [str(size) for size in products.PAGE_SIZES])
+
+            @render.text
+            def page_info():
+                return f"of {products.page_count(n_products(), int(input.page_size()))} ({n_products()} products)"
+
+        @render.download_button(label="Export matching products (Parquet)", filename="products.parquet")
+        def export_products():
+            # written batch by batch, the inventory is never held in memory as a whole. The file is streamed from a
+            # temporary directory removed once the download is sent or abandoned.
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "products.parquet"
+                with db.cursor() as con:
+                    products.export_products(con, path, search=input.product_search())
+                with open(path, "rb") as f:
+                    while chunk := f.read(1 << 20):
+                        yield chunk
+
+        if database and not db.read_only:
 
             ui.markdown(
                 """
@@ -206,32 +285,51 @@ with ui.layout_columns():
 
             @render.data_frame
             def building_data_input():
+                import pyarrow as pa
+
+                default_building_data = pa.table(
+                    {"Product": ["Product "+str(n_all_products()+1)], "Virgin": [0.0], "Reused": [0.0],
+                     "Recycled": [0.0], "Repurposed": [0.0], "Building": ["Building 1"], "Mass": [1.0]}
+                )
                 return render.DataGrid(default_building_data, editable=True)
 
 
             ui.input_action_button("storing_data", "Store new product data")
 
+            ui.input_file(
+                "product_upload",
+                "Import products from CSV or Parquet files (see data/R_strategies.csv for the columns)",
+                accept=[".csv", ".parquet"],
+                multiple=True,
+                width="100%",
+            )
+
     with ui.card(full_screen=True):
         with ui.card_header(class_="d-flex justify-content-between align-items-center"):
             "Product circularity pie chart"
             with ui.popover(title="Product to display", placement="top"):
                 ICONS["MCI/BCI"]
-                ui.input_radio_buttons(
+                # choices are the first products matching the grid filter, see update_plot_choices()
+                ui.input_selectize(
                     "plot_selection",
                     None,
-                    ["Product " + str(prod+1) for prod in list(R_strategies.index)],
-                    inline=True,
+                    [],
+                    options={"placeholder": "Search a product"},
                 )
 
         @render_plotly
         def scatterplot():
-            product_data = table.data_view().loc[int(input.plot_selection()[-1:])-1]
-            return px.pie(
-                product_data,
-                values=product_data.values,
-                names=product_data.index,
-                title=f"Strategies for {input.plot_selection()}",
-            )
+            import plotly.graph_objects as go
+
+            req(input.plot_selection())
+            pie_version()
+            with db.cursor() as con:
+                product_data = products.product_strategies(con, input.plot_selection())
+            req(product_data)
+            # graph objects take the values as they are, plotly express would build a DataFrame first
+            fig = go.Figure(go.Pie(values=list(product_data.values()), labels=list(product_data)))
+            fig.update_layout(title=f"Strategies for {input.plot_selection()}")
+            return fig
 
 
 ui.markdown(
@@ -249,94 +347,20 @@ with ((ui.layout_columns())):
     with ui.card(full_screen=True):
         ui.card_header("Determining Disassembly factors (DDFs)")
         with ui.div(style="max-height: 400px; overflow-y: auto;"):
-            ui.markdown(
-                """
-                **Accessibility to connection**
-                """
-            )
-            ui.input_radio_buttons(
-                "Accessibility",
-                "",
-                [
-                    "Accessible",
-                    "Accessible with additional operation which causes no damage",
-                    "Accessible with additional operation which is reparable damage",
-                    "Accessible with additional operation which causes damage",
-                    "Not accessible, total damage"
-                ],
-                inline=False,
-                width="100%",
-            )
-            ui.markdown(
-                """
-                **Type of connection**
-                """
-            )
-            ui.input_radio_buttons(
-                "Type",
-                "",
-                [
-                    "Accessory external connection or connection system",
-                    "Direct connection with additional fixing devices",
-                    "Direct integral connection with inserts (pin)",
-                    "Filled soft chemical connection",
-                    "Filled hard chemical connection",
-                    "Direct chemical connection"
-                ],
-                inline=False,
-                width="100%",
-            )
-            ui.markdown(
-                """
-                **Independency**
-                """
-            )
-            ui.input_radio_buttons(
-                "Independency",
-                "",
-                [
-                    "Modular zoning",
-                    "Planned interpenetrating",
-                    "Planned for one solution",
-                    "Unplanned interpenetrating",
-                    "Total dependence"
-                ],
-                inline=False,
-                width="100%",
-            )
-            ui.markdown(
-                """
-                **Method of fabrication**
-                """
-            )
-            ui.input_radio_buttons(
-                "Method",
-                "",
-                [
-                    "Pre-made geometry",
-                    "Half standardized geometry",
-                    "Geometry made on construction site"
-                ],
-                inline=False,
-                width="100%",
-            )
-            ui.markdown(
-                """
-                **Type of relational pattern**
-                """
-            )
-            ui.input_radio_buttons(
-                "Pattern",
-                "",
-                [
-                    "One or two connections",
-                    "Three connections",
-                    "Four connections",
-                    "Five or more connections"
-                ],
-                inline=False,
-                width="100%",
-            )
+            # one radio button group per DDF, labels are read from data/ddf_scores.csv
+            for factor in ddf.FACTORS:
+                ui.markdown(
+                    f"""
+                    **{ddf.DDF_TABLE[factor]["name"]}**
+                    """
+                )
+                ui.input_radio_buttons(
+                    factor,
+                    "",
+                    ddf.DDF_TABLE[factor]["labels"],
+                    inline=False,
+                    width="100%",
+                )
 
     with ui.card(full_screen=True):
         ui.card_header("Disassembly Potential")
@@ -349,10 +373,14 @@ with ((ui.layout_columns())):
 
         @render.data_frame
         def disassembly_potential():
+            import pyarrow as pa
 
-            df = pd.DataFrame(ddf_input(), columns=["Determining Disassembly Factor", "Score"])
+            scores = pa.table({
+                "Determining Disassembly Factor": [ddf.DDF_TABLE[factor]["name"] for factor in ddf.FACTORS],
+                "Score": ddf.factor_scores(ddf_input())[0],
+            })
 
-            return render.DataGrid(df)
+            return render.DataGrid(scores)
 
         ui.markdown(
             """
@@ -363,9 +391,9 @@ with ((ui.layout_columns())):
         with ui.value_box(showcase=ICONS["gear"]):
             "Disassembly Score"
 
-            @render.express
+            @render.text
             def disassembly_score():
-                f"{dis_pot():.1%}"
+                return f"{dis_pot():.1%}"
 
 ui.markdown(
     """
@@ -385,9 +413,32 @@ with ((ui.layout_columns())):
             "Whole Building Circularity Indicator"
 
 
-            @render.express
+            @render.text
             def building_indicator():
-                f"{bci():.1%}"
+                return f"{bci_shown():.1%}"
+
+        if database:
+            ui.markdown(
+                """
+                `Mass-weighted scores of the products stored for each building:`
+                """
+            )
+
+            @render.data_frame
+            def building_scores():
+                # read from the running per-building score sums, products without a DDF assessment take the
+                # disassembly score of Section 2
+                products_version()
+                with db.cursor() as con:
+                    scores = building_aggregates.building_indicators(con, efficiency=slider_values()["E"]/100,
+                                                                     dis_pot=dis_pot()).to_arrow_table()
+                # embodied carbon does not depend on the sliders, it is only recomputed when the products change
+                gwp = building_gwp()
+                buildings = scores.column("Building").to_pylist()
+                for column in ["GWP", "Avoided GWP"]:
+                    values = [gwp.get(building, {}).get(column) for building in buildings]
+                    scores = scores.append_column(f"{column} (kg CO2e)", [values])
+                return render.DataGrid(helpers.round_table(scores))
 
     with ui.card(full_screen=True):
         ui.card_header("Potential Tracks for Improvement")
@@ -400,71 +451,548 @@ with ((ui.layout_columns())):
             """
         )
 
+if database:
+    # charts are aggregated in DuckDB, their size does not grow with the number of products
+    with ui.layout_columns(col_widths=[3, 9]):
+        with ui.card():
+            ui.card_header("Inventory charts")
+            ui.input_select("chart_building", "Building", {"": "All buildings"})
+            ui.input_numeric("chart_top_n", "Products and buildings shown", value=15, min=1, max=50)
+            ui.input_slider("chart_bins", "Histogram bins", min=5, max=100, value=40)
+            ui.input_radio_buttons("chart_score", "Score", ["MCI", "BCI"], inline=True)
+            ui.input_select("lca_dataset", "Emission factors", [lca.DEFAULT_DATASET])
+
+        with ui.navset_card_underline():
+            with ui.nav_panel("Strategy mix"):
+                @render_plotly
+                def chart_strategies():
+                    import plotly.graph_objects as go
+
+                    with db.cursor() as con:
+                        data = charts.strategy_distribution(con, chart_building(), chart_top_n())
+                    fig = go.Figure([go.Bar(x=data["label"], y=data[s], name=s) for s in charts.STRATEGIES])
+                    fig.update_layout(barmode="stack", yaxis_title="Mass", xaxis_title=None)
+                    return fig
+
+            with ui.nav_panel("Score distribution"):
+                @render_plotly
+                def chart_histogram():
+                    import plotly.graph_objects as go
+
+                    bins = input.chart_bins()
+                    with db.cursor() as con:
+                        data = charts.score_histogram(con, chart_building(), input.chart_score(), bins,
+                                                      slider_values()["E"]/100, dis_pot())
+                    fig = go.Figure(go.Bar(x=[(b + 0.5)/bins for b in data["bin"]], y=data["products"],
+                                           width=1/bins, customdata=data["mass"],
+                                           hovertemplate="%{y} products, mass %{customdata:.1f}<extra></extra>"))
+                    fig.update_layout(xaxis_title=input.chart_score(), yaxis_title="Products", xaxis_range=[0, 1],
+                                      xaxis_tickformat=".0%")
+                    return fig
+
+            with ui.nav_panel("Mass and score"):
+                @render_plotly
+                def chart_scatter():
+                    import numpy as np
+                    import plotly.graph_objects as go
+
+                    with db.cursor() as con:
+                        data, total = charts.score_sample(con, chart_building(), efficiency=slider_values()["E"]/100,
+                                                          dis_pot=dis_pot())
+                    score = input.chart_score()
+                    # WebGL scatter of at most a few thousand sampled points, numpy arrays are sent as binary
+                    fig = go.Figure(go.Scattergl(x=np.asarray(data["Mass"], dtype=np.float32),
+                                                 y=np.asarray(data[score], dtype=np.float32), text=data["Product"],
+                                                 mode="markers", marker={"size": 4, "opacity": 0.6}))
+                    shown = f"{len(data['Product']):,} of {total:,} products" if total > len(data["Product"]) else ""
+                    fig.update_layout(xaxis_title="Mass", yaxis_title=score, yaxis_tickformat=".0%", title=shown)
+                    return fig
+
+            with ui.nav_panel("Embodied carbon"):
+                @render_plotly
+                def chart_gwp():
+                    import plotly.graph_objects as go
+
+                    with db.cursor() as con:
+                        data = lca.gwp_distribution(con, chart_building(), chart_top_n(), lca_dataset())
+                    fig = go.Figure([go.Bar(x=data["label"], y=data[s], name=s) for s in charts.STRATEGIES])
+                    fig.update_layout(barmode="stack", yaxis_title="GWP (kg CO2e)", xaxis_title=None)
+                    return fig
+
+            with ui.nav_panel("Material flows"):
+                @render_plotly
+                def chart_flows():
+                    import plotly.graph_objects as go
+
+                    # the use stage is split into the heaviest products (or buildings), the node count stays bounded
+                    with db.cursor() as con:
+                        data, balanced = mfa.building_flows(con, chart_building(), slider_values()["E"]/100,
+                                                            chart_top_n())
+                    fig = go.Figure(go.Sankey(node={"label": data["labels"], "pad": 12},
+                                              link={"source": data["source"], "target": data["target"],
+                                                    "value": data["value"]}))
+                    if balanced:
+                        fig.update_layout(title=f"{balanced:,} products with fractions above 100% scaled down")
+                    return fig
+
+            with ui.nav_panel("Portfolio"):
+                @render_plotly
+                def chart_portfolio():
+                    import plotly.graph_objects as go
+
+                    products_version()
+                    with db.cursor() as con:
+                        data = charts.portfolio_rollup(con, chart_top_n())
+                    fig = go.Figure(go.Treemap(ids=data["id"], parents=data["parent"], labels=data["label"],
+                                               values=data["mass"], branchvalues="total"))
+                    return fig
+
+ui.markdown(
+    """
+    ## Section 4: Parameter Sensitivity
+
+    The following section sweeps the MCI parameters around the current slider values, to find the design levers that
+    matter most. Surfaces are evaluated in batch for the whole parameter grid.
+
+    """
+)
+
+with ui.layout_columns():
+    with ui.card(full_screen=True):
+        with ui.card_header(class_="d-flex justify-content-between align-items-center"):
+            "Circularity surface"
+            with ui.popover(title="Surface parameters", placement="top"):
+                ICONS["gear"]
+                sweep_choices = {p: label for p, (label, _, _) in sensitivity.PARAMETERS.items()}
+                ui.input_select("sweep_x", "Horizontal axis", sweep_choices, selected="F_R")
+                ui.input_select("sweep_y", "Vertical axis", sweep_choices, selected="C_R")
+                ui.input_radio_buttons("sweep_indicator", "Indicator", ["MCI", "BCI"], inline=True)
+                ui.input_slider("sweep_resolution", "Resolution", min=10, max=500, value=100)
+
+        @render_plotly
+        def sensitivity_surface():
+            import plotly.graph_objects as go
+
+            x, y = input.sweep_x(), input.sweep_y()
+            req(x != y)
+            x_axis, y_axis, mci_surface, bci_surface = sensitivity.surface(
+                x, y, base=slider_values(), resolution=input.sweep_resolution(), dis_pot=dis_pot()
+            )
+            fig = go.Figure(go.Heatmap(
+                x=x_axis, y=y_axis, z=mci_surface if input.sweep_indicator() == "MCI" else bci_surface,
+                zmin=0, zmax=1, colorscale="Viridis", colorbar={"title": input.sweep_indicator()},
+            ))
+            fig.update_layout(xaxis_title=sensitivity.PARAMETERS[x][0], yaxis_title=sensitivity.PARAMETERS[y][0])
+            return fig
+
+    with ui.card(full_screen=True):
+        ui.card_header("One-at-a-time sensitivity")
+        ui.markdown(
+            """
+            `Each parameter is swept over its full range while the others keep their slider value.`
+            """
+        )
+
+        @render.data_frame
+        def sensitivity_indices():
+            import pyarrow as pa
+
+            indices = pa.Table.from_pylist(sensitivity.one_at_a_time(slider_values()))
+            return render.DataGrid(helpers.round_table(indices))
+
+ui.markdown(
+    """
+    ## Section 5: Uncertainty
+
+    The following section propagates the uncertainty of the parameters and of the disassembly score with a Monte Carlo
+    simulation. Each value varies along a triangular distribution around its current setting, results are updated as
+    samples are drawn.
+
+    """
+)
+
+with ui.layout_columns(col_widths=[4, 4, 4]):
+    with ui.card():
+        ui.card_header("Monte Carlo settings")
+        ui.input_numeric("mc_samples", "Number of samples", value=1_000_000, min=uncertainty.MIN_SAMPLES,
+                         max=uncertainty.MAX_SAMPLES, step=100_000)
+        ui.input_slider("mc_spread", "Relative uncertainty", min=0, max=50, value=10, post="%")
+        ui.input_numeric("mc_seed", "Random seed", value=0, min=0)
+        ui.input_action_button("mc_run", "Run simulation")
+
+        @render.text
+        def mc_progress():
+            summary = mc_summary()
+            req(summary)
+            return f"{summary['samples']:,} / {summary['total']:,} samples ({summary['infeasible']:,} infeasible)"
+
+    with ui.value_box(showcase=ICONS["MCI/BCI"]):
+        "Material Circularity Indicator (median)"
+
+        @render.ui
+        def mc_mci():
+            summary = req(mc_summary())
+            if summary["MCI"] is None:
+                return ui.TagList("No feasible samples", ui.p("The input or output fractions exceed 100%"))
+            return ui.TagList(
+                f"{summary['MCI'][50]:.1%}",
+                ui.p(f"90% interval: {summary['MCI'][5]:.1%} to {summary['MCI'][95]:.1%}"),
+            )
+
+    with ui.value_box(showcase=ICONS["building"]):
+        "Building Circularity Indicator (median)"
+
+        @render.ui
+        def mc_bci():
+            summary = req(mc_summary())
+            if summary["BCI"] is None:
+                return ui.TagList("No feasible samples", ui.p("The input or output fractions exceed 100%"))
+            return ui.TagList(
+                f"{summary['BCI'][50]:.1%}",
+                ui.p(f"90% interval: {summary['BCI'][5]:.1%} to {summary['BCI'][95]:.1%}"),
+            )
+
+ui.markdown(
+    """
+    ## Section 6: Cost-Constrained Strategy Mix
+
+    The following section searches, for every product of a building, the mix of virgin, reused, recycled and
+    repurposed material giving the best circularity for its cost. The Pareto front shows the highest BCI reachable for
+    each budget, prices come from the price catalog and default to the values below.
+
+    """
+)
+
+with ui.layout_columns(col_widths=[4, 8]):
+    with ui.card():
+        ui.card_header("Optimization settings")
+        ui.input_select("opt_building", "Building", [])
+        ui.input_radio_buttons(
+            "opt_mode", None, {"budget": "Maximize BCI under a budget", "target": "Minimize cost for a target BCI"}
+        )
+        ui.input_numeric("opt_budget", "Budget (USD)", value=10_000, min=0, step=1_000)
+        ui.input_slider("opt_target", "Target BCI", min=0, max=100, value=70, post="%")
+        ui.input_slider("opt_max_reused", "Available reused and repurposed share", min=0, max=100, value=50, post="%")
+        ui.input_slider("opt_max_recycled", "Available recycled share", min=0, max=100, value=100, post="%")
+        with ui.accordion(open=False):
+            with ui.accordion_panel("Default prices (USD/kg)"):
+                for strategy, price in optimizer.DEFAULT_PRICES.items():
+                    ui.input_numeric(f"opt_price_{strategy}", strategy, value=price, min=0, step=0.5)
+
+        @render.text
+        def opt_result():
+            _, _, point = opt_point()
+            if point is None:
+                return "No mix satisfies the constraint, see the Pareto front for the reachable range."
+            return f"BCI {point['bci']:.1%} (MCI {point['mci']:.1%}) for ${point['cost']:,.2f}"
+
+    with ui.navset_card_underline():
+        with ui.nav_panel("Pareto front"):
+            @render_plotly
+            def opt_front_plot():
+                import numpy as np
+                import plotly.graph_objects as go
+
+                _, front, point = opt_point()
+                # a large building has one supported point per hull segment of every product, at most 2000 are drawn
+                shown = np.unique(np.linspace(0, len(front["cost"]) - 1, 2000).astype(int))
+                fig = go.Figure(go.Scatter(x=front["cost"][shown], y=front["bci"][shown], mode="lines",
+                                           name="Pareto front"))
+                if point is not None:
+                    fig.add_trace(go.Scatter(x=[point["cost"]], y=[point["bci"]], mode="markers",
+                                             marker={"size": 14, "symbol": "star"}, name="Selected mix"))
+                fig.update_layout(xaxis_title="Cost (USD)", yaxis_title="BCI", yaxis_tickformat=".0%")
+                return fig
+
+        with ui.nav_panel("Product mix"):
+            @render.data_frame
+            def opt_mix():
+                import pyarrow as pa
+
+                (names, mass, _, prices), front, point = opt_point()
+                req(point is not None)
+                mix = pa.Table.from_pylist(optimizer.mix_table(front, point, names, mass, prices))
+                return render.DataGrid(helpers.round_table(mix))
+
+if database:
+    ui.markdown(
+        """
+        ## Section 7: Scenarios
+
+        Scenarios are named variants of a building inventory, saved with the slider settings. Only their differences
+        from the products of the building are stored. Edit the inventory below and save it as a scenario, the
+        scenarios of the building are scored side by side with the current settings.
+
+        """
+    )
+
+    with ui.layout_columns(col_widths=[4, 8]):
+        with ui.card():
+            ui.card_header("Scenario")
+            ui.input_select("scenario_building", "Building", [])
+            ui.input_select("scenario_selected", "Saved scenarios", [])
+            ui.input_action_button("scenario_load", "Load into the editor and sliders")
+            if not db.read_only:
+                ui.input_text("scenario_name", "Save the editor as", placeholder="Scenario name")
+                ui.input_text("scenario_description", None, placeholder="Description (optional)")
+                ui.input_action_button("scenario_save", "Save scenario")
+                ui.input_action_button("scenario_delete", "Delete the selected scenario")
+
+        with ui.card(full_screen=True):
+            ui.card_header("Scenario comparison")
+
+            @render.data_frame
+            def scenario_comparison():
+                # scenarios are overlaid on the inventory and scored in a single query
+                products_version()
+                scenarios_version()
+                req(input.scenario_building())
+                with db.cursor() as con:
+                    scores = scenarios.compare(con, input.scenario_building(), efficiency=slider_values()["E"]/100,
+                                               dis_pot=dis_pot()).to_arrow_table()
+                return render.DataGrid(helpers.round_table(scores))
+
+    with ui.navset_card_underline():
+        with ui.nav_panel("Inventory editor"):
+            @render.text
+            def scenario_editing():
+                return f"Editing {editor_scenario() or scenarios.BASE} of {input.scenario_building()}"
+
+            @render.data_frame
+            def scenario_editor():
+                products_version()
+                req(input.scenario_building())
+                with db.cursor() as con:
+                    query, params = scenarios.materialize_sql(input.scenario_building(),
+                                                              [editor_scenario() or scenarios.BASE])
+                    inventory = con.execute(f'SELECT * EXCLUDE ("Scenario") FROM ({query}) ORDER BY "Product"',
+                                            params).to_arrow_table()
+                return render.DataGrid(inventory, editable=not db.read_only)
+
+        with ui.nav_panel("Stored changes"):
+            @render.data_frame
+            def scenario_stored_changes():
+                scenarios_version()
+                req(input.scenario_building(), input.scenario_selected())
+                with db.cursor() as con:
+                    stored = scenarios.changes(con, input.scenario_building(), input.scenario_selected())
+                    return render.DataGrid(stored.to_arrow_table())
+
+    ui.markdown(
+        """
+        ## Section 8: Portfolio
+
+        The buildings of the database ranked by circularity, cost or disassembly potential. Rankings are read from
+        per-building rollups updated with every product change, costs use the default prices of Section 6.
+
+        """
+    )
+
+    with ui.layout_columns(fill=False):
+        with ui.value_box(showcase=ICONS["building"]):
+            "Buildings"
+
+            @render.text
+            def portfolio_buildings():
+                summary = portfolio_summary()
+                return f"{summary['buildings']:,} ({summary['products']:,} products)"
+
+        with ui.value_box(showcase=ICONS["MCI/BCI"]):
+            "Portfolio BCI (mass-weighted)"
+
+            @render.text
+            def portfolio_bci():
+                summary = portfolio_summary()
+                return f"{summary['BCI'] or 0:.1%} (MCI {summary['MCI'] or 0:.1%})"
+
+        with ui.value_box(showcase=ICONS["cost"]):
+            "Portfolio cost"
+
+            @render.text
+            def portfolio_cost():
+                return f"${portfolio_summary()['cost']:,.2f}"
+
+    with ui.card(full_screen=True):
+        ui.card_header("Building ranking")
+        with ui.layout_columns(col_widths=[6, 3, 3]):
+            ui.input_text("portfolio_search", None, placeholder="Filter buildings")
+            ui.input_select("portfolio_sort", None, portfolio.SORT_COLUMNS)
+            ui.input_switch("portfolio_desc", "Descending", value=True)
+
+        @render.data_frame
+        def portfolio_ranking():
+            # one page of one row per building, whatever the number of products
+            products_version()
+            with db.cursor() as con:
+                page = portfolio.ranking_page(con, input.portfolio_sort(), input.portfolio_desc(),
+                                              input.portfolio_search(), input.portfolio_page() or 1,
+                                              **portfolio_settings())
+            return render.DataGrid(helpers.round_table(page))
+
+        with ui.layout_columns(col_widths=[4, 8]):
+            ui.input_numeric("portfolio_page", "Page", value=1, min=1)
+
+            @render.text
+            def portfolio_page_info():
+                return f"of {products.page_count(n_portfolio_buildings(), portfolio.PAGE_SIZE)}"
+
+
+if profiling.ENABLED:
+    # hidden panel, shown by opening the app with ?diagnostics
+    with ui.panel_conditional("window.location.search.indexOf('diagnostics') >= 0"):
+        ui.markdown(
+            """
+            ## Diagnostics
+
+            Execution statistics of the reactive calcs, effects, render functions and database queries of all sessions
+            served by this worker (BCI_PROFILE=1). Times include the calcs called from within.
+
+            """
+        )
+
+        with ui.card(full_screen=True):
+            ui.card_header("Profile")
+
+            @render.data_frame
+            def profile_table():
+                import pandas as pd
+
+                reactive.invalidate_later(2)
+                input.profile_reset()
+                df = pd.DataFrame(profiling.PROFILER.stats(), columns=["kind", "name"] + profiling.FIELDS)
+                return render.DataGrid(pd.DataFrame({
+                    "Kind": df["kind"],
+                    "Name": df["name"],
+                    "Calls": df["calls"],
+                    "Total (ms)": (df["seconds"]*1000).round(1),
+                    "Mean (ms)": (df["seconds"]/df["calls"].clip(lower=1)*1000).round(2),
+                    "Max (ms)": (df["max_seconds"]*1000).round(1),
+                    "Invalidations": df["invalidations"],
+                    "Mean fan-out": (df["fanout"]/df["invalidations"].clip(lower=1)).round(1),
+                }), filters=True)
+
+            with ui.layout_columns(col_widths=[4, 4, 4]):
+                @render.download_button(label="Prometheus metrics", filename="bci-metrics.prom")
+                def profile_prometheus():
+                    yield profiling.PROFILER.prometheus_text()
+
+                @render.download_button(label="Chrome trace", filename="bci-trace.json")
+                def profile_trace():
+                    yield json.dumps(profiling.PROFILER.chrome_trace())
+
+                ui.input_action_button("profile_reset", "Reset statistics")
+
+        with ui.card():
+            ui.card_header("Worker counters")
+
+            @render.text
+            def cache_stats():
+                # results are shared by all sessions of this worker
+                reactive.invalidate_later(2)
+                stats = RESULTS.stats()
+                return f"Cached results: {stats['size']}, hits: {stats['hits']}, misses: {stats['misses']}"
+
+            @render.text
+            def recompute_stats():
+                # slider bursts merged by rate_limit.coalesce(), for all sessions of this worker
+                reactive.invalidate_later(2)
+                stats = rate_limit.STATS.stats()
+                return (f"Slider updates: {stats['changes']}, recomputes: {stats['recomputes']} "
+                        f"({stats['saved']} saved), unchanged results: {stats['unchanged']}")
+
 
 # Add CSS styles to the app
 ui.include_css(app_dir / "styles.css")
 
-# explicitly close the connection
-#con.close()
+startup_timing.mark("layout")
+
+# the shared database is closed at interpreter exit, see database.close_all()
 
 #%%
 # Reactive calculations and effects
 
 
+@reactive.calc
+def n_products():
+    membership_version()
+    if input.product_search():
+        # updates can move a product in or out of a building filter
+        products_version()
+    with db.cursor() as con:
+        return products.product_count(con, input.product_search())
+
+
+@reactive.calc
+def n_all_products():
+    membership_version()
+    with db.cursor() as con:
+        return products.product_count(con)
+
+
+@reactive.effect
+@reactive.event(input.product_search, input.product_sort, input.product_desc, input.page_size)
+def _():
+    ui.update_numeric("product_page", value=1)
+
+
+@reactive.effect
+def update_plot_choices():
+    membership_version()
+    if input.product_search():
+        products_version()
+    with db.cursor() as con:
+        choices = products.product_names(con, input.product_search())
+    with reactive.isolate():
+        selected = input.plot_selection()
+    ui.update_selectize("plot_selection", choices=choices, selected=selected if selected in choices else None)
+
+
+@reactive.calc
+def material_flows():
+    s = slider_values()
+    return mc.flows(s["M"], s["F_R"]/100, s["F_U"]/100, s["C_R"]/100, s["C_U"]/100, s["E"]/100)
+
+
 @reactive.calc
 def virgin():
-    m = input.M()
-    fr = input.F_R()/100
-    fu = input.F_U()/100
-    return float(m*(1-fr-fu))
+    return float(material_flows()[0])
 
 
 @reactive.calc
 def waste_zero():
-    m = input.M()
-    cr = input.C_R()/100
-    cu = input.C_U()/100
-    return float(m*(1-cr-cu))
+    return float(material_flows()[1])
 
 
 @reactive.calc
 def waste_f():
-    m = input.M()
-    fr = input.F_R()/100
-    ef = input.E()/100
-    return float(m*((1-ef)/ef)*fr)
+    return float(material_flows()[2])
 
 
 @reactive.calc
 def waste_c():
-    m = input.M()
-    cr = input.C_R()/100
-    ec = input.E()/100
-    return float(m*(1-ec)*cr)
+    return float(material_flows()[3])
 
 
 @reactive.calc
 def waste_tot():
-    w0 = waste_zero()
-    wf = waste_f()
-    wc = waste_c()
-    return float(w0+(wf+wc)/2)
+    return float(material_flows()[4])
 
 
 @reactive.calc
 def lfi():
-    m = input.M()
+    m = slider_values()["M"]
     v = virgin()
     w = waste_tot()
     w_f = waste_f()
     w_c = waste_c()
-    return float((v+w)/(2*m + (w_f-w_c)/2))
+    return float(mc.LFI_array(v, w, m, w_f, w_c))
 
 
 def utility_x():
-    m = input.M()/100
-    lt = input.L()/100
-    u = input.U()/100
+    s = slider_values()
+    m = s["M"]/100
+    lt = s["L"]/100
+    u = s["U"]/100
 
     x_param = input.utility()
     if "Mass" not in x_param:
@@ -474,119 +1002,300 @@ def utility_x():
     elif "Functional units" not in x_param:
         u = 1
 
-    return float(lt*u/m)
+    return float(mc.X_array(lt, 1, u, 1, m, 1))
+
+
+@reactive.calc
+def slider_inputs():
+    return {s: input[s]() for s in result_cache.SLIDERS}
+
+
+# every calc below reads the sliders through slider_values(), which changes once per drag rather than on every tick
+slider_values = rate_limit.coalesce(slider_inputs)
+
+
+@reactive.calc
+def slider_key():
+    return result_cache.scenario_key(slider_values(), input.utility())
 
 
 @reactive.calc
 def mci():
-    linear_flow = lfi()
-    x = utility_x()
-    f = 0.9/x
-    if 1-linear_flow*f < 0:
-        return 0
-    else:
-        return 1-linear_flow*f
+    # the lfi() chain is only evaluated when no session has computed this slider state yet
+    def compute():
+        linear_flow = lfi()
+        f = mc.F_array(utility_x())
+        return float(mc.MCI_array(linear_flow, f))
+
+    return RESULTS.get_or_compute(("MCI",) + slider_key(), compute)
 
 
 @reactive.calc
 def ddf_input():
-    a = input.Accessibility()
-    t = input.Type()
-    i = input.Independency()
-    m = input.Method()
-    p = input.Pattern()
-
-    acc, typ, ind, met, pat = 0, 0, 0, 0, 0
-
-    if a == 'Accessible':
-        acc = 1
-    elif a == "Accessible with additional operation which causes no damage":
-        acc = 0.8
-    elif a == "Accessible with additional operation which is reparable damage":
-        acc = 0.6
-    elif a == "Accessible with additional operation which causes damage":
-        acc = 0.4
-    elif a == "Not accessible, total damage":
-        acc = 0.1
-
-    if t == "Accessory external connection or connection system":
-        typ = 1
-    elif t == "Direct connection with additional fixing devices":
-        typ = 0.8
-    elif t == "Direct integral connection with inserts (pin)":
-        typ = 0.6
-    elif t == "Filled soft chemical connection":
-        typ = 0.2
-    elif t == "Filled hard chemical connection":
-        typ = 0.1
-    elif t == "Direct chemical connection":
-        typ = 0.1
-
-    if i == "Modular zoning":
-        ind = 1
-    elif i == "Planned interpenetrating":
-        ind = 0.8
-    elif i == "Planned for one solution":
-        ind = 0.6
-    elif i == "Unplanned interpenetrating":
-        ind = 0.2
-    elif i == "Total dependence":
-        ind = 0.1
-
-    if m == "Pre-made geometry":
-        met = 1
-    elif m == "Half standardized geometry":
-        met = 0.8
-    elif m == "Geometry made on construction site":
-        met = 0.6
-
-    if p == "One or two connections":
-        pat = 1
-    elif p == "Three connections":
-        pat = 0.8
-    elif p == "Four connections":
-        pat = 0.6
-    elif p == "Five or more connections":
-        pat = 0.2
-
-    return np.array([["Accessibility to connection", acc],
-                     ["Type of connection", typ],
-                     ["Independency", ind],
-                     ["Method of fabrication", met],
-                     ["Type of relational pattern", pat]
-                     ])
+    # integer codes of the selected DDF labels, in the order of ddf.FACTORS
+    return ddf.encode_connections([[input[factor]() for factor in ddf.FACTORS]])
 
 
 @reactive.calc
 def dis_pot():
-    acc = ddf_input()[0][1]
-    typ = ddf_input()[1][1]
-    ind = ddf_input()[2][1]
-    met = ddf_input()[3][1]
-    pat = ddf_input()[4][1]
-    return (float(acc)+float(typ)+float(ind)+float(met)+float(pat))/5
+    codes = ddf_input()
+    return RESULTS.get_or_compute(("DDF",) + tuple(codes[0].tolist()),
+                                  lambda: float(ddf.disassembly_potential(codes)[0]))
 
 
 @reactive.calc
 def bci():
-    dp = dis_pot()
-    pci = mci()
-    return dp*pci
+    def compute():
+        dp = dis_pot()
+        pci = mci()
+        return dp*pci
+
+    return RESULTS.get_or_compute(("BCI",) + slider_key() + tuple(ddf_input()[0].tolist()), compute)
 
 
 @reactive.calc
 def project_cost():
     m = 1000  # in kg of required materials
-    fr = input.F_R()/100
-    fu = input.F_U()/100
+    fr = slider_values()["F_R"]/100
+    fu = slider_values()["F_U"]/100
 
-    cost_per_kg_v = 12  # avg price of virgin materials (in USD)
-    cost_per_kg_r = 9  # avg price of recycled materials (in USD)
-    cost_per_kg_u = 4  # avg price of reused materials (in USD)
+    # avg prices of virgin, recycled and reused materials (in USD/kg)
+    cost_per_kg_v = optimizer.DEFAULT_PRICES["Virgin"]
+    cost_per_kg_r = optimizer.DEFAULT_PRICES["Recycled"]
+    cost_per_kg_u = optimizer.DEFAULT_PRICES["Reused"]
 
     return float(m*fr*cost_per_kg_r + m*fu*cost_per_kg_u + (m*(1-fr-fu))*cost_per_kg_v)
 
 
+# the value boxes only re-render when the result they display changes
+mci_shown = rate_limit.distinct(mci)
+bci_shown = rate_limit.distinct(bci)
+cost_shown = rate_limit.distinct(project_cost)
+
+
+@reactive.calc
+def building_choices():
+    products_version()
+    with db.cursor() as con:
+        return building_aggregates.building_names(con)
+
+
+# Inventory charts of the selected building, or of all of them
+@reactive.effect
+def update_chart_buildings():
+    choices = {"": "All buildings", **{name: name for name in building_choices()}}
+    with reactive.isolate():
+        selected = input.chart_building()
+    ui.update_select("chart_building", choices=choices, selected=selected if selected in choices else "")
+
+
+@reactive.calc
+def chart_building():
+    products_version()
+    return input.chart_building() or None
+
+
+@reactive.calc
+def lca_dataset():
+    return input.lca_dataset() or lca.DEFAULT_DATASET
+
+
+@reactive.effect
+def update_lca_datasets():
+    with db.cursor() as con:
+        choices = lca.datasets(con)
+    ui.update_select("lca_dataset", choices=choices, selected=lca.DEFAULT_DATASET)
+
+
+@reactive.calc
+def building_gwp():
+    products_version()
+    with db.cursor() as con:
+        rows = lca.building_impacts(con, lca_dataset()).to_pylist()
+    return {row["Building"]: row for row in rows}
+
+
+@reactive.calc
+def chart_top_n():
+    return min(max(int(input.chart_top_n() or 15), 1), 50)
+
+
+# Strategy mix optimization of the selected building
+@reactive.effect
+def update_opt_buildings():
+    choices = building_choices()
+    with reactive.isolate():
+        selected = input.opt_building()
+    ui.update_select("opt_building", choices=choices, selected=selected if selected in choices else None)
+
+
+@reactive.calc
+def opt_inventory():
+    products_version()
+    req(input.opt_building())
+    defaults = {s: input[f"opt_price_{s}"]() or 0 for s in optimizer.DEFAULT_PRICES}
+    with db.cursor() as con:
+        names, mass, disassembly = optimizer.inventory(con, input.opt_building(), dis_pot())
+        prices = optimizer.unit_prices(con, names, defaults=defaults)
+    req(names)
+    return names, mass, disassembly, prices
+
+
+# the front and the mix search run in a worker thread, a building of thousands of products takes about a second
+@reactive.extended_task
+async def opt_front_task(inventory, efficiency, max_reused, max_recycled):
+    _, mass, disassembly, prices = inventory
+    front = await asyncio.to_thread(optimizer.pareto_front, mass, prices, disassembly, efficiency=efficiency,
+                                    max_reused=max_reused, max_recycled=max_recycled)
+    return inventory, front
+
+
+@reactive.effect
+def solve_opt_front():
+    inventory = opt_inventory()
+    opt_front_task.cancel()
+    opt_front_task.invoke(inventory, slider_values()["E"]/100, input.opt_max_reused()/100,
+                          input.opt_max_recycled()/100)
+
+
+@reactive.extended_task
+async def opt_point_task(inventory, front, mode, limit):
+    search = optimizer.best_under_budget if mode == "budget" else optimizer.cheapest_for_target
+    return inventory, front, await asyncio.to_thread(search, front, limit)
+
+
+@reactive.effect
+def search_opt_point():
+    inventory, front = opt_front_task.result()
+    limit = (input.opt_budget() or 0) if input.opt_mode() == "budget" else input.opt_target()/100
+    opt_point_task.cancel()
+    opt_point_task.invoke(inventory, front, input.opt_mode(), limit)
+
+
+@reactive.calc
+def opt_point():
+    return opt_point_task.result()
+
+
+# Portfolio ranking, read from the per-building rollups
+@reactive.calc
+def portfolio_settings():
+    defaults = {s: input[f"opt_price_{s}"]() or 0 for s in optimizer.DEFAULT_PRICES}
+    with db.cursor() as con:
+        prices = optimizer.catalog_prices(con, defaults=defaults)
+    return {"efficiency": slider_values()["E"]/100, "dis_pot": dis_pot(), "prices": prices}
+
+
+@reactive.calc
+def portfolio_summary():
+    products_version()
+    with db.cursor() as con:
+        return portfolio.summary(con, **portfolio_settings())
+
+
+@reactive.calc
+def n_portfolio_buildings():
+    products_version()
+    with db.cursor() as con:
+        return portfolio.building_count(con, input.portfolio_search())
+
+
+@reactive.effect
+@reactive.event(input.portfolio_search, input.portfolio_sort, input.portfolio_desc)
+def _():
+    ui.update_numeric("portfolio_page", value=1)
+
+
+# Scenarios of the selected building, editor_scenario is the scenario shown in the editor (None for the inventory)
+scenarios_version = reactive.value(0)
+editor_scenario = reactive.value(None)
+
+
+@reactive.effect
+def update_scenario_buildings():
+    choices = building_choices()
+    with reactive.isolate():
+        selected = input.scenario_building()
+    ui.update_select("scenario_building", choices=choices, selected=selected if selected in choices else None)
+
+
+@reactive.calc
+def scenario_names():
+    scenarios_version()
+    req(input.scenario_building())
+    with db.cursor() as con:
+        return scenarios.scenario_names(con, input.scenario_building())
+
+
+@reactive.effect
+def update_scenario_choices():
+    choices = scenario_names()
+    with reactive.isolate():
+        selected = input.scenario_selected()
+    ui.update_select("scenario_selected", choices=choices, selected=selected if selected in choices else None)
+
+
+@reactive.effect
+@reactive.event(input.scenario_building)
+def _():
+    editor_scenario.set(None)
+
+
+@reactive.effect
+@reactive.event(input.scenario_load)
+def load_scenario():
+    name = input.scenario_selected()
+    req(name)
+    with db.cursor() as con:
+        settings = scenarios.settings(con, input.scenario_building(), name)
+    for slider, value in (settings or {}).items():
+        ui.update_slider(slider, value=value)
+    editor_scenario.set(name)
+    if not db.read_only:
+        ui.update_text("scenario_name", value=name)
+
+
+# Monte Carlo runs execute in a background thread, the session polls their partial results
+mc_job = reactive.value(None)
+mc_summary = reactive.value(None)
+
+
+@reactive.effect
+@reactive.event(input.mc_run)
+def start_monte_carlo():
+    if mc_job() is not None:
+        mc_job().cancel()
+    # the browser does not enforce the bounds of numeric inputs, empty inputs come as None
+    n = uncertainty.sample_count(input.mc_samples())
+    if n != input.mc_samples():
+        ui.update_numeric("mc_samples", value=n)
+    distributions = uncertainty.around(slider_values(), dis_pot(), input.mc_spread()/100)
+    mc_job.set(uncertainty.BackgroundRun(distributions, n, seed=max(int(input.mc_seed() or 0), 0)))
+
+
+@reactive.effect
+def poll_monte_carlo():
+    job = mc_job()
+    if job is None:
+        return
+    done = job.done
+    mc_summary.set(job.latest())
+    if job.error is not None:
+        ui.notification_show(f"Monte Carlo simulation failed: {job.error}", type="error")
+    elif not done:
+        reactive.invalidate_later(0.25)
+
+
+def cancel_monte_carlo():
+    with reactive.isolate():
+        if mc_job() is not None:
+            mc_job().cancel()
+
+
+# assigned so that shiny express does not render the returned callback
+_ = get_current_session().on_ended(cancel_monte_carlo)
+
+
 @reactive.effect
 @reactive.event(input.reset)
 def _():
@@ -600,34 +1309,172 @@ def _():
     ui.update_slider("L", value=100)
     ui.update_slider("U", value=100)
 
+if profiling.ENABLED:
+    @reactive.effect
+    @reactive.event(input.profile_reset)
+    def reset_profile():
+        profiling.PROFILER.reset()
+
 # Capture the input data from the building_data_input() table
 
 
-if database:
+if database and not db.read_only:
+
+    # inserts of all sessions are batched by a background writer, the session is acknowledged as soon as the row is
+    # queued and the product views refresh once the change feed reports it
+    product_queue = write_queue.get_queue(db)
+
+    @reactive.extended_task
+    async def product_stored(product_name, future):
+        # resolved by the background writer once the batch holding the row is committed, without blocking the session
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            return f"{product_name} could not be stored: {e}"
+        return None
+
+    @reactive.effect
+    def notify_store_failure():
+        message = product_stored.result()
+        if message:
+            ui.notification_show(message, type="error")
 
     @reactive.effect
     @reactive.event(input.storing_data)
     def store_new_data():
         # Extract new data as scalar values
-        new_data = building_data_input.data_view()
-        product_name = str(new_data['Product'].iloc[0])  # Convert to string if needed
-        virgin = float(new_data['Virgin'].iloc[0])  # Convert to float
-        reused = float(new_data['Reused'].iloc[0])  # Convert to float
-        recycled = float(new_data['Recycled'].iloc[0])  # Convert to float
-        repurposed = float(new_data['Repurposed'].iloc[0])  # Convert to float
+        new_data = building_data_input.data_view().to_pylist()[0]
+        product_name = str(new_data['Product'])  # Convert to string if needed
+        virgin = float(new_data['Virgin'])  # Convert to float
+        reused = float(new_data['Reused'])  # Convert to float
+        recycled = float(new_data['Recycled'])  # Convert to float
+        repurposed = float(new_data['Repurposed'])  # Convert to float
+        building = str(new_data['Building'])
+        mass = float(new_data['Mass'])
 
         try:
-            # Use a parameterized query to insert the data
-            con.execute("""
-                INSERT INTO r_strategies (Product, Virgin, Reused, Recycled, Repurposed)
-                VALUES (?, ?, ?, ?, ?)
-            """, [product_name, virgin, reused, recycled, repurposed])
-
-            # Optionally display the updated table
-            con.sql("SELECT * FROM r_strategies").show()
-            print("Data inserted successfully.")
+            future = product_queue.submit([product_name, virgin, reused, recycled, repurposed, building, mass])
+        except write_queue.QueueFull:
+            ui.notification_show("The database is busy, please try again in a moment.", type="warning")
+            return
         except Exception as e:
-            print(f"An error occurred: {e}")
+            ui.notification_show(f"{product_name} could not be stored: {e}", type="error")
+            return
+        ui.notification_show(f"{product_name} queued for storage.", duration=2)
+        product_stored.invoke(product_name, future)
 
     #db_input = building_data_input.data_view().loc['New product']
-    # con.sql("INSERT INTO r_strategies VALUES ('New Product', 0.1, 0.2, 0.3, 0.4)")
\ No newline at end of file
+    # con.sql("INSERT INTO r_strategies VALUES ('New Product', 0.1, 0.2, 0.3, 0.4)")
+
+    def import_file(file, report):
+        with db.write() as con:
+            summary = ingest.import_products(con, file["datapath"], file_format=Path(file["name"]).suffix,
+                                             progress=report)
+        summary["file"] = file["name"]
+        return summary
+
+    # files are imported in a worker thread, the sessions stay responsive while a large file is written
+    @reactive.extended_task
+    async def import_task(files):
+        loop = asyncio.get_running_loop()
+        notifications = []
+        with ui.Progress(min=0, max=len(files)) as progress:
+            for i, file in enumerate(files):
+                def report(message, i=i, name=file["name"]):
+                    # called from the worker thread, the progress bar is updated on the event loop
+                    loop.call_soon_threadsafe(lambda: progress.set(i, message=f"Importing {name}", detail=message))
+
+                report("waiting for the database")
+                try:
+                    summary = await asyncio.to_thread(import_file, file, report)
+                    notifications.append((ingest.summary_text(summary),
+                                          "warning" if summary["rejected"] else "message"))
+                except Exception as e:
+                    notifications.append((f"{file['name']} could not be imported: {e}", "error"))
+        return notifications
+
+    @reactive.effect
+    @reactive.event(input.product_upload)
+    def import_uploaded_products():
+        import_task.invoke(input.product_upload())
+
+    @reactive.effect
+    def notify_import():
+        for message, kind in import_task.result():
+            ui.notification_show(message, type=kind)
+
+    @reactive.effect
+    @reactive.event(input.scenario_save)
+    def save_scenario():
+        name = input.scenario_name().strip()
+        building = input.scenario_building()
+        if not name or not building:
+            ui.notification_show("Choose a building and a scenario name first.", type="warning")
+            return
+        try:
+            # only the differences of the edited inventory are stored
+            with db.write() as con:
+                con.register("scenario_inventory", scenario_editor.data_view())
+                n = scenarios.save(con, building, name, "scenario_inventory", input.scenario_description(),
+                                   settings=slider_values())
+                con.unregister("scenario_inventory")
+            ui.notification_show(f"{name} saved, {n} product(s) differ from {building}.")
+        except Exception as e:
+            ui.notification_show(f"{name} could not be saved: {e}", type="error")
+        scenarios_version.set(scenarios_version() + 1)
+        editor_scenario.set(name)
+
+    @reactive.effect
+    @reactive.event(input.scenario_delete)
+    def delete_scenario():
+        name = input.scenario_selected()
+        req(name)
+        with db.write() as con:
+            scenarios.delete(con, input.scenario_building(), name)
+        if editor_scenario() == name:
+            editor_scenario.set(None)
+        scenarios_version.set(scenarios_version() + 1)
+
+# Changes of the products are pushed to every open session, each session then only refetches the views the changed
+# products show on. Writes of this worker (sessions, the write-behind queue) set a version shared by its sessions.
+# Read-only workers do not write, they check the version of the file every second and every check opens the file.
+feed = change_feed.get_feed(db, interval=1.0)
+seen_version = {"version": feed.version()}
+
+if db.read_only:
+    @reactive.poll(feed.version, feed.interval)
+    def feed_version():
+        return feed.version()
+else:
+    feed_version = feed.reactive_version()
+
+
+@reactive.effect
+@reactive.event(feed_version, ignore_init=True)
+def apply_changes():
+    latest, changes = feed.changes_since(seen_version["version"])
+    seen_version["version"] = latest
+    if changes == []:
+        return
+    # None when too many changes to list, everything is refetched
+    names = None if changes is None else {product for _, _, product in changes}
+    membership = changes is None or any(op != "update" for _, op, _ in changes)
+    products_version.set(products_version() + 1)
+    if membership:
+        membership_version.set(membership_version() + 1)
+    if membership or names is None or names & grid_products:
+        grid_version.set(grid_version() + 1)
+    with reactive.isolate():
+        selected = input.plot_selection()
+    if names is None or selected in names:
+        pie_version.set(pie_version() + 1)
+
+
+if profiling.ENABLED:
+    # times the calcs, effects and render functions of this session
+    _ = profiling.instrument(globals())
+    profiling.write_at_shutdown(get_current_session().app)
+
+startup_timing.mark("reactive graph")
+startup_timing.report()
+startup_timing.preload()
@@ -3,15 +3,74 @@
 # https://www.ellenmacarthurfoundation.org/assets/downloads/EMF_Material_Circularity_Indicator_2020.pdf
 #######################################################################################################################
 
+import numpy as np
+
 #%% Define MCI mathematical model
 def LFI(V, W, M, W_f, W_c):
     return((V+W) / (2*M + (W_f-W_c)/2) )
 
 def X(L, L_av, U, U_av, M, M_av):
-    return((L*U*M) / (L_av*U_av*M_av))
+    # lifetime and functional units raise the utility, mass lowers it
+    return((L/L_av) * (U/U_av) / (M/M_av))
 
 def F(X):
     return(0.9/X)
 
 def MCI(lfi, f):
-    return(max(0, 1-lfi*f))
\ No newline at end of file
+    return(max(0, 1-lfi*f))
+
+
+#%% Vectorized MCI model over whole product inventories
+# Every argument may be a scalar or a column array (one entry per product); fractions are given in [0, 1].
+# Edge cases are resolved with masks rather than Python branching:
+#   - E = 0 with recycled input makes W_f unbounded, in which case the LFI tends to 1
+#   - X = 0 makes F unbounded, in which case the MCI is 0 (or 1 for a product with no linear flow)
+
+
+def flows(M, F_R, F_U, C_R, C_U, E):
+    M, F_R, F_U, C_R, C_U, E = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (M, F_R, F_U, C_R, C_U, E)))
+    V = M*(1-F_R-F_U)
+    W_0 = M*(1-C_R-C_U)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        W_f = np.where(E > 0, M*((1-E)/E)*F_R, np.where(F_R > 0, np.inf, 0.0))
+    W_c = M*(1-E)*C_R
+    W = W_0 + (W_f+W_c)/2
+    return V, W_0, W_f, W_c, W
+
+
+def LFI_array(V, W, M, W_f, W_c):
+    M = np.asarray(M, dtype=float)  # 2*M would repeat a list
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lfi = (V+W) / (2*M + (W_f-W_c)/2)
+    return np.where(np.isinf(W_f), 1.0, lfi)
+
+
+def X_array(L, L_av, U, U_av, M, M_av):
+    # same utility as X()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.asarray(L, dtype=float)/L_av) * (np.asarray(U, dtype=float)/U_av) / (np.asarray(M, dtype=float)/M_av)
+
+
+def F_array(x):
+    with np.errstate(divide="ignore"):
+        return 0.9/np.asarray(x, dtype=float)
+
+
+def MCI_array(lfi, f):
+    lfi = np.asarray(lfi, dtype=float)
+    with np.errstate(invalid="ignore"):
+        linear = np.where(lfi > 0, lfi*f, 0.0)
+    return np.maximum(0, 1-linear)
+
+
+def MCI_batch(M, F_R, F_U, C_R, C_U, E, L=1, U=1, M_av=None, L_av=1, U_av=1):
+    """Score a whole inventory in one pass, returns the (LFI, X, F, MCI) arrays.
+
+    `M` is the product mass in any unit, it also enters the utility through M/M_av. Without `M_av` the mass ratio of
+    the utility is 1, pass M_av=1 when `M` is already the ratio to the average product.
+    """
+    V, W_0, W_f, W_c, W = flows(M, F_R, F_U, C_R, C_U, E)
+    lfi = LFI_array(V, W, M, W_f, W_c)
+    x = X_array(L, L_av, U, U_av, M, M if M_av is None else M_av)
+    f = F_array(x)
+    return lfi, x, f, MCI_array(lfi, f)
@@ -0,0 +1,35 @@
+#######################################################################################################################
+# Command line entry point of the headless tools, none of them needs shiny
+#
+# usage: python bci.py <command> [options], python bci.py <command> --help for the options of a command
+#   score       score the buildings of a portfolio into Parquet files (scoring.py)
+#   ingest      import products from CSV or Parquet files (ingest.py)
+#   migrate     migrate a building database to the latest schema (migrations.py)
+#   aggregates  check or rebuild the per-building aggregates (building_aggregates.py)
+#   scenarios   compare the scenarios of a building (scenarios.py)
+#   lca         load emission factors and report the embodied carbon of the buildings (lca.py)
+#######################################################################################################################
+
+import importlib
+import sys
+
+COMMANDS = {
+    "score": "scoring",
+    "ingest": "ingest",
+    "migrate": "migrations",
+    "aggregates": "building_aggregates",
+    "scenarios": "scenarios",
+    "lca": "lca",
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(f"usage: bci {{{','.join(COMMANDS)}}} [options]", file=sys.stderr)
+        sys.exit(2)
+    importlib.import_module(COMMANDS[argv[0]]).main(argv[1:])
+
+
+if __name__ == "__main__":
+    main()
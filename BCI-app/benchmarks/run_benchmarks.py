@@ -0,0 +1,253 @@
+#######################################################################################################################
+# Benchmarks of the calculation and persistence hot paths
+# Scalar vs batch MCI, DDF scoring, DuckDB reads and inserts at several table sizes and app startup are timed on
+# synthetic inventories. Results are written as JSON and compared against a stored baseline, any benchmark slower
+# than the baseline by more than the tolerance is reported as a regression (exit code 1).
+#
+# usage: python benchmarks/run_benchmarks.py [--full] [--only mci,ddf,db,startup] [--output results.json]
+#                                            [--baseline benchmarks/baseline.json] [--save-baseline] [--tolerance 0.5]
+#######################################################################################################################
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+bench_dir = Path(__file__).parent
+app_dir = bench_dir.parent
+sys.path.insert(0, str(app_dir))
+
+import duckdb
+import numpy as np
+
+import MCI_calculations as mc
+import building_aggregates
+import building_scores as bs
+import ddf_scores as ddf
+import portfolio
+import products
+import synthetic
+from database import BuildingDatabase, default_db_path
+from migrations import migrate
+from write_queue import WriteBehindQueue
+
+SIZES = {
+    "quick": {"mci_scalar": [10**3, 10**4, 10**5], "mci_batch": [10**3, 10**4, 10**5, 10**6],
+              "ddf": [10**3, 10**4, 10**5], "db": [10**3, 10**5]},
+    "full": {"mci_scalar": [10**3, 10**4, 10**5, 10**6], "mci_batch": [10**3, 10**4, 10**5, 10**6, 10**7],
+             "ddf": [10**3, 10**4, 10**5, 10**6], "db": [10**3, 10**5, 10**6]},
+}
+
+
+def timed(fn, repeat, budget=0.5, max_repeat=50):
+    # at least `repeat` calls, more for fast benchmarks until `budget` seconds are spent
+    times = []
+    while len(times) < repeat or (sum(times) < budget and len(times) < max_repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(times), "min_s": min(times), "repeat": len(times)}
+
+
+def repeats(n):
+    return 3 if n >= 10**6 else 5
+
+
+#%% Benchmarks, each yields (name, n, function, repeat, items timed per call)
+def mci_benchmarks(sizes):
+    for n in sizes["mci_scalar"]:
+        p = {k: v.tolist() for k, v in synthetic.products(n).items()}
+
+        def scalar(p=p, n=n):
+            for i in range(n):
+                m, fr, fu, cr, cu, e = p["M"][i], p["F_R"][i], p["F_U"][i], p["C_R"][i], p["C_U"][i], p["E"][i]
+                w_f, w_c = m*((1-e)/e)*fr, m*(1-e)*cr
+                lfi = mc.LFI(m*(1-fr-fu), m*(1-cr-cu) + (w_f+w_c)/2, m, w_f, w_c)
+                mc.MCI(lfi, mc.F(mc.X(p["L"][i], 1, p["U"][i], 1, 1, 1)))
+
+        yield "mci_scalar", n, scalar, 1 if n >= 10**5 else 3, n
+
+    for n in sizes["mci_batch"]:
+        p = synthetic.products(n)
+        yield "mci_batch", n, lambda p=p: mc.MCI_batch(**p, M_av=p["M"]), repeats(n), n
+
+
+def ddf_benchmarks(sizes):
+    for n in sizes["ddf"]:
+        labels = synthetic.connections(n)
+        codes = ddf.encode_connections(labels)
+        yield "ddf_encode", n, lambda labels=labels: ddf.encode_connections(labels), repeats(n), n
+        yield "ddf_score", n, lambda codes=codes: ddf.disassembly_potential(codes), repeats(n), n
+
+
+def db_benchmarks(sizes, tmp_dir):
+    for n in sizes["db"]:
+        db = BuildingDatabase(Path(tmp_dir) / f"products_{n}.db")
+        with db.write() as con:
+            synthetic.create_product_table(con, n)
+
+        def read_full(db=db):
+            with db.cursor() as con:
+                con.table("r_strategies").to_arrow_table()
+
+        def read_page(db=db):
+            with db.cursor() as con:
+                products.product_page(con, page=10, page_size=25, sort="Mass", search="Building 7")
+
+        def aggregate(db=db):
+            with db.cursor() as con:
+                bs.building_scores(con).fetchall()
+
+        def indicators(db=db):
+            with db.cursor() as con:
+                building_aggregates.building_indicators(con).fetchall()
+
+        def ranking(db=db):
+            # a portfolio ranking page with its summary, read from the per-building rollups
+            with db.cursor() as con:
+                portfolio.ranking_page(con, sort="BCI")
+                portfolio.summary(con)
+
+        def insert(db=db):
+            # one transaction per product, as store_new_data did before the write-behind queue
+            for i in range(100):
+                with db.write() as con:
+                    products.upsert_rows(con, [(f"Inserted {i}", 0.25, 0.25, 0.25, 0.25, "Building 1", 1.0)])
+
+        def insert_queued(db=db, runs=[0]):
+            # the write-behind path, submitted rows are batched into one transaction, names are new on every run
+            runs[0] += 1
+            q = WriteBehindQueue(db)
+            for i in range(100):
+                q.submit([f"Queued {runs[0]}-{i}", 0.25, 0.25, 0.25, 0.25, "Building 1", 1.0])
+            q.close()
+
+        yield "db_read_full", n, read_full, repeats(n), n
+        yield "db_read_page", n, read_page, repeats(n), 25
+        yield "db_building_scores", n, aggregate, repeats(n), n
+        yield "db_building_indicators", n, indicators, repeats(n), n
+        yield "db_portfolio_ranking", n, ranking, repeats(n), n
+        yield "db_insert", n, insert, 3, 100
+        yield "db_insert_queued", n, insert_queued, 3, 100
+        db.close()
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from pathlib import Path
+from shiny.express import wrap_express_app
+wrap_express_app(Path(sys.argv[1]))
+print(time.perf_counter() - start)
+"""
+
+
+def startup_benchmarks(sizes, tmp_dir):
+    # fresh interpreter each time, read-only on a migrated copy of the app database so that the tracked file is left
+    # alone and a running app does not hold the lock
+    path = Path(tmp_dir) / "startup.db"
+    shutil.copyfile(default_db_path, path)
+    db = BuildingDatabase(path)
+    db.setup(migrate)
+    db.close()
+    env = {**os.environ, "BCI_DB": str(path), "BCI_READ_ONLY": "1"}
+
+    def startup():
+        run = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, str(app_dir / "BCI_app.py")],
+                             env=env, cwd=app_dir, capture_output=True, text=True)
+        if run.returncode:
+            raise RuntimeError(f"app startup failed with exit code {run.returncode}:\n{run.stderr}")
+
+    yield "app_startup", 1, startup, 3, 1
+
+
+GROUPS = {"mci": mci_benchmarks, "ddf": ddf_benchmarks, "db": db_benchmarks, "startup": startup_benchmarks}
+
+
+def run(groups, sizes):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for group in groups:
+            benchmarks = GROUPS[group](sizes, tmp_dir) if group in ("db", "startup") else GROUPS[group](sizes)
+            for name, n, fn, repeat, items in benchmarks:
+                record = {"name": name, "n": n, **timed(fn, repeat)}
+                record["per_item_us"] = record["median_s"] / items * 1e6
+                results[f"{name}[{n}]"] = record
+                print(f"{name + f'[{n}]':32} {record['median_s']:12.6f} s  {record['per_item_us']:12.4f} us/item")
+    return results
+
+
+def metadata(mode):
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "mode": mode,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "duckdb": duckdb.__version__,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Benchmarks slower than the baseline by more than `tolerance` (relative), as (key, ratio).
+
+    Best times are compared, they are far less sensitive to noise from other processes than medians.
+    """
+    regressions = []
+    for key, record in results.items():
+        if key not in baseline:
+            continue
+        ratio = record["min_s"] / baseline[key]["min_s"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{key:32} {ratio:8.2f}x baseline {flag}")
+        if flag:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BCI calculation and persistence hot paths.")
+    parser.add_argument("--full", action="store_true", help="run the large sizes (up to 1e7 products)")
+    parser.add_argument("--only", default=",".join(GROUPS), help="comma separated groups: " + ", ".join(GROUPS))
+    parser.add_argument("--output", type=Path, default=bench_dir / "results" / "latest.json")
+    parser.add_argument("--baseline", type=Path, default=bench_dir / "baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown before a regression")
+    args = parser.parse_args(argv)
+
+    mode = "full" if args.full else "quick"
+    results = run([g.strip() for g in args.only.split(",") if g.strip()], SIZES[mode])
+    report = {"meta": metadata(mode), "results": results}
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    print(f"Comparing against the baseline of {baseline['meta']['date']} ({baseline['meta']['platform']})")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#######################################################################################################################
+# Synthetic product inventories for the benchmarks
+# Generators are seeded so that every run scores the same inputs.
+#######################################################################################################################
+
+import numpy as np
+
+from ddf_scores import DDF_TABLE, FACTORS
+from migrations import migrate
+from products import upsert_products
+
+
+def products(n, seed=0):
+    """Column arrays of n products, fractions in [0, 1] with F_R + F_U <= 1 and C_R + C_U <= 1."""
+    rng = np.random.default_rng(seed)
+    inputs = rng.dirichlet([2, 1, 1], n)
+    outputs = rng.dirichlet([2, 1, 1], n)
+    return {
+        "M": rng.lognormal(3, 1, n),
+        "F_R": inputs[:, 1],
+        "F_U": inputs[:, 2],
+        "C_R": outputs[:, 1],
+        "C_U": outputs[:, 2],
+        "E": rng.uniform(0.5, 1, n),
+        "L": rng.uniform(0.5, 2, n),
+        "U": rng.uniform(0.5, 2, n),
+    }
+
+
+def connections(n, seed=0):
+    """(n, 5) array of DDF labels, one row per joint."""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.choice(np.array(DDF_TABLE[f]["labels"], dtype=object), n) for f in FACTORS])
+
+
+def create_product_table(con, n, buildings=100, seed=0):
+    """Migrate an empty database and store n products (r_strategies layout), generated inside DuckDB."""
+    migrate(con)
+    con.execute(f"SELECT setseed({(seed % 1000) / 1000})")
+    con.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE synthetic_products AS
+        WITH draws AS (
+            SELECT i, random() AS a, random() AS b, random() AS c, random() AS d, random() AS m
+            FROM range({int(n)}) t(i)
+        )
+        SELECT 'Product ' || (i+1) AS "Product",
+               a/(a+b+c+d) AS "Virgin", b/(a+b+c+d) AS "Reused",
+               c/(a+b+c+d) AS "Recycled", d/(a+b+c+d) AS "Repurposed",
+               'Building ' || (i % {int(buildings)} + 1) AS "Building",
+               1 + 99*m AS "Mass",
+               NULL::DOUBLE AS "Disassembly"
+        FROM draws
+        """
+    )
+    upsert_products(con, "synthetic_products")
+    con.execute("DROP TABLE synthetic_products")
@@ -0,0 +1,242 @@
+#######################################################################################################################
+# Running per-building aggregates
+# building_aggregates holds, for each building, the number of products, their total mass, the mass of each strategy
+# and the DDF sums. products.upsert_products() and products.delete_products() write the products inside updating(),
+# which merges the new contributions of the touched products minus their old ones in the same transaction, so building
+# indicators are read from one row per building instead of scanning the products. check() compares the table against
+# a full recomputation and rebuild() recreates it from scratch.
+#
+# Building scores are the mass-weighted product scores of building_scores.building_scores_sql. With the strategy
+# fractions used as input and output fractions, the linear flow index of a product is
+#   LFI = (4E*(1-F_R-F_U) + F_R*(1-E^2)) / (4E + F_R*(1-E)^2)
+# which is linear in 1-F_R-F_U for a given recycled fraction F_R. building_flow_sums therefore holds, per building and
+# recycled fraction, the sums of mass and of mass*(1-F_R-F_U) over the products, over the assessed ones weighted by
+# their DDF score and over the unassessed ones. None of them depends on the recycling efficiency, which is applied when
+# the indicators are read, so every write runs one upsert whatever the efficiencies the sessions look at. Strategy
+# fractions are non-negative (ingest.py validates them), hence LFI <= 1 and the MCI is never clamped at 0.
+#
+# usage: python building_aggregates.py [--db data/building_data.db] [--rebuild]
+#######################################################################################################################
+
+from contextlib import contextmanager
+
+# aggregate column: contribution of one product, from its row of product_rows_sql
+AGGREGATES = {
+    "products": "1",
+    "mass": "mass",
+    "virgin_mass": "mass * coalesce(virgin, 0)",
+    "reused_mass": "mass * coalesce(reused, 0)",
+    "recycled_mass": "mass * coalesce(recycled, 0)",
+    "repurposed_mass": "mass * coalesce(repurposed, 0)",
+    "assessed_mass": "CASE WHEN score IS NOT NULL THEN mass ELSE 0 END",
+    "ddf_mass": "mass * coalesce(score, 0)",
+}
+# flow sum column: contribution of one scored product, from its row of product_rows_sql and its linear fraction
+FLOW_SUMS = {
+    "products": "1",
+    "mass": "mass",
+    "linear_mass": "mass * linear",
+    "ddf_mass": "coalesce(mass * score, 0)",
+    "ddf_linear_mass": "coalesce(mass * score * linear, 0)",
+    "unassessed_mass": "CASE WHEN score IS NULL THEN mass ELSE 0 END",
+    "unassessed_linear_mass": "CASE WHEN score IS NULL THEN mass * linear ELSE 0 END",
+}
+
+
+def _selected(product_ids):
+    # a join rather than an IN filter, DuckDB then prunes the scans of the other tables to the selected ids
+    return f"JOIN ({product_ids}) t USING (product_id)" if product_ids else ""
+
+
+def product_rows_sql(product_ids=None):
+    """Products selected by the subquery `product_ids` (all if None) with their mass and DDF score."""
+    return f"""
+        SELECT p.product_id, p.building_id, p.name, coalesce(f.mass, 1.0) AS mass,
+               p.virgin, p.reused, p.recycled, p.repurposed, d.score
+        FROM products p
+        {_selected(product_ids)}
+        LEFT JOIN material_flows f USING (product_id)
+        LEFT JOIN ddf_assessments d USING (product_id)
+    """
+
+
+def contributions_sql(rows=None, sign=1):
+    """Summed contributions per building of the product rows `rows` (a table or subquery, all products if None)."""
+    rows = rows or f"({product_rows_sql()})"
+    sums = ", ".join(f"{sign} * sum({expression}) AS {column}" for column, expression in AGGREGATES.items())
+    return f"SELECT building_id, {sums} FROM {rows} GROUP BY building_id"
+
+
+def flow_contributions_sql(rows=None, sign=1):
+    """Summed flow contributions per building and recycled fraction of the product rows `rows` (all if None).
+
+    Products missing a strategy fraction have no MCI (see building_scores.py) and are left out.
+    """
+    rows = rows or f"({product_rows_sql()})"
+    sums = ", ".join(f"{sign} * sum({expression}) AS {column}" for column, expression in FLOW_SUMS.items())
+    return f"""
+        SELECT building_id, recycled, {sums}
+        FROM (
+            SELECT *, 1 - recycled - reused - repurposed AS linear
+            FROM {rows}
+            WHERE recycled IS NOT NULL AND reused IS NOT NULL AND repurposed IS NOT NULL
+        )
+        GROUP BY building_id, recycled
+    """
+
+
+def _merge(con, table, keys, columns, rows):
+    # one upsert of the net contributions `rows`, rows of products written again are updated in place
+    sums = ", ".join(f"sum({c}) AS {c}" for c in columns)
+    updates = ", ".join(f"{c} = {table}.{c} + excluded.{c}" for c in columns)
+    con.execute(
+        f"""
+        INSERT INTO {table} BY NAME (SELECT {keys}, {sums} FROM ({rows}) GROUP BY {keys})
+        ON CONFLICT ({keys}) DO UPDATE SET {updates}
+        """
+    )
+    con.execute(f"DELETE FROM {table} WHERE products <= 0")
+
+
+@contextmanager
+def updating(con, product_ids, deleting=False):
+    """Update the aggregates and flow sums for the products selected by the subquery `product_ids` written inside.
+
+    The selected products are read once before and, unless they are being deleted, once after the block, the
+    difference of their contributions is merged.
+    """
+    con.execute(f"CREATE OR REPLACE TEMP TABLE retracted_products AS {product_rows_sql(product_ids)}")
+    yield
+    aggregates = contributions_sql("retracted_products", -1)
+    flows = flow_contributions_sql("retracted_products", -1)
+    if not deleting:
+        con.execute(f"CREATE OR REPLACE TEMP TABLE updated_products AS {product_rows_sql(product_ids)}")
+        aggregates += f" UNION ALL BY NAME {contributions_sql('updated_products')}"
+        flows = f"({flows}) UNION ALL BY NAME ({flow_contributions_sql('updated_products')})"
+    _merge(con, "building_aggregates", "building_id", AGGREGATES, aggregates)
+    _merge(con, "building_flow_sums", "building_id, recycled", FLOW_SUMS, flows)
+    con.execute("DROP TABLE retracted_products")
+    con.execute("DROP TABLE IF EXISTS updated_products")
+
+
+def rebuild(con):
+    con.execute("DELETE FROM building_aggregates")
+    con.execute(f"INSERT INTO building_aggregates BY NAME ({contributions_sql()})")
+
+
+def rebuild_flow_sums(con):
+    con.execute("DELETE FROM building_flow_sums")
+    con.execute(f"INSERT INTO building_flow_sums BY NAME ({flow_contributions_sql()})")
+
+
+def _compare(stored, actual, columns, tolerance):
+    # rows keyed on their first values, missing rows count as zeros
+    mismatches = []
+    for key in sorted(stored.keys() | actual.keys()):
+        s = stored.get(key, [0]*len(columns))
+        a = actual.get(key, [0]*len(columns))
+        for column, x, y in zip(columns, s, a):
+            if abs(x - y) > tolerance * max(1.0, abs(y)):
+                mismatches.append((key, column, x, y))
+    return mismatches
+
+
+def check(con, tolerance=1e-9):
+    """Stored aggregates and flow sums differing from a full recomputation, as (key, column, stored, actual).
+
+    Keys are building ids for the aggregates and (building id, recycled fraction) for the flow sums.
+    """
+    columns = ", ".join(AGGREGATES)
+    stored = con.execute(f"SELECT building_id, {columns} FROM building_aggregates").fetchall()
+    actual = con.execute(f"SELECT building_id, {columns} FROM ({contributions_sql()})").fetchall()
+    mismatches = _compare({r[0]: r[1:] for r in stored}, {r[0]: r[1:] for r in actual}, AGGREGATES, tolerance)
+
+    columns = ", ".join(FLOW_SUMS)
+    stored = con.execute(f"SELECT building_id, recycled, {columns} FROM building_flow_sums").fetchall()
+    actual = con.execute(f"SELECT building_id, recycled, {columns} FROM ({flow_contributions_sql()})").fetchall()
+    return mismatches + _compare({r[:2]: r[2:] for r in stored}, {r[:2]: r[2:] for r in actual}, FLOW_SUMS, tolerance)
+
+
+#%% Building level indicators from the aggregates
+def _linear_flows(mass, linear_mass, efficiency):
+    # sum of mass*LFI of the products of a flow sums row, E = 0 with recycled input makes the LFI 1
+    e = float(efficiency)
+    denominator = f"(4*{e} + recycled*{(1 - e)**2})"
+    return f"""
+        CASE WHEN {denominator} = 0 THEN {linear_mass}
+             ELSE (4*{e}*{linear_mass} + recycled*{1 - e*e}*{mass}) / {denominator} END
+    """
+
+
+def score_sums_sql(efficiency=0.95):
+    """Sums of mass*MCI, of mass*MCI*DDF score of the assessed products and of mass*MCI of the unassessed ones."""
+    return f"""
+        SELECT building_id,
+               sum(mass - 0.9*{_linear_flows("mass", "linear_mass", efficiency)}) AS mci_mass,
+               sum(ddf_mass - 0.9*{_linear_flows("ddf_mass", "ddf_linear_mass", efficiency)}) AS ddf_bci_mass,
+               sum(unassessed_mass - 0.9*{_linear_flows("unassessed_mass", "unassessed_linear_mass", efficiency)})
+                   AS unassessed_mci_mass
+        FROM building_flow_sums
+        GROUP BY building_id
+    """
+
+
+def building_indicators_sql(efficiency=0.95, dis_pot=1.0):
+    """Scores of building_scores_sql per building, read from the aggregates and the flow sums."""
+    # unassessed mass takes the disassembly potential `dis_pot`
+    dp = float(dis_pot)
+    return f"""
+        SELECT b.name AS "Building", a.products AS "Products", a.mass AS "Mass",
+               s.mci_mass / nullif(a.mass, 0) AS "MCI",
+               (a.ddf_mass + (a.mass - a.assessed_mass)*{dp}) / nullif(a.mass, 0) AS "Disassembly",
+               (s.ddf_bci_mass + s.unassessed_mci_mass*{dp}) / nullif(a.mass, 0) AS "BCI"
+        FROM building_aggregates a
+        JOIN buildings b USING (building_id)
+        LEFT JOIN ({score_sums_sql(efficiency)}) s USING (building_id)
+        ORDER BY b.name
+    """
+
+
+def building_indicators(con, building=None, efficiency=0.95, dis_pot=1.0):
+    """Mass-weighted MCI, disassembly potential and BCI of each building, read from the running sums."""
+    query = building_indicators_sql(efficiency, dis_pot)
+    if building is None:
+        return con.execute(query)
+    return con.execute(f'SELECT * FROM ({query}) WHERE "Building" = ?', [building])
+
+
+def building_names(con):
+    """Names of the buildings holding at least one product."""
+    rows = con.execute("SELECT b.name FROM building_aggregates JOIN buildings b USING (building_id) ORDER BY 1")
+    return [row[0] for row in rows.fetchall()]
+
+
+#%% Command line interface
+def main(argv=None):
+    import argparse
+    from pathlib import Path
+
+    from database import BuildingDatabase, default_db_path
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Check the per-building aggregates against the products.")
+    parser.add_argument("--db", type=Path, default=default_db_path, help="building database file")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the aggregates from scratch")
+    args = parser.parse_args(argv)
+
+    db = BuildingDatabase(args.db, lock_timeout=30)
+    with db.write() as con:
+        migrate(con)
+        mismatches = check(con)
+        for key, column, stored, actual in mismatches[:20]:
+            print(f"  {key} {column}: stored {stored}, actual {actual}")
+        print(f"{args.db.name}: {len(mismatches)} mismatching aggregate(s)")
+        if args.rebuild:
+            rebuild(con)
+            rebuild_flow_sums(con)
+            print(f"{args.db.name}: aggregates rebuilt, {len(check(con))} mismatching aggregate(s)")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#######################################################################################################################
+# Whole-building circularity aggregation
+# Per-product MCI and disassembly potential are computed and mass-weighted into a BCI for each building. Everything
+# runs as set-based SQL inside DuckDB, so only one row per building is returned to Python.
+#######################################################################################################################
+
+STRATEGIES = ["Virgin", "Reused", "Recycled", "Repurposed"]
+
+
+#%% Product level scores
+# Same formulas as MCI_calculations.MCI_batch, with the strategy fractions used both as input and output fractions:
+#   F_R = C_R = Recycled, F_U = C_U = Reused + Repurposed
+# Product utility data (lifetime, functional units) is not stored yet, hence X = 1 and F = 0.9.
+# Products without a DDF assessment fall back on `dis_pot`, products missing a strategy fraction have no scores.
+def product_scores_sql(source="r_strategies", efficiency=0.95, dis_pot=1.0):
+    e = float(efficiency)
+    dp = float(dis_pot)
+    return f"""
+        WITH inputs AS (
+            SELECT "Building", "Product", "Mass" AS m,
+                   "Recycled" AS f_r, "Reused" + "Repurposed" AS f_u,
+                   "Recycled" AS c_r, "Reused" + "Repurposed" AS c_u,
+                   coalesce("Disassembly", {dp}) AS dp
+            FROM {source}
+        ), flows AS (
+            SELECT *,
+                   m*(1-f_r-f_u) AS v,
+                   m*(1-c_r-c_u) AS w_0,
+                   CASE WHEN {e} > 0 THEN m*((1-{e})/{e})*f_r
+                        WHEN f_r > 0 THEN 'inf'::DOUBLE
+                        ELSE 0 END AS w_f,
+                   m*(1-{e})*c_r AS w_c
+            FROM inputs
+        ), linear AS (
+            SELECT *,
+                   CASE WHEN v IS NULL THEN NULL
+                        WHEN isinf(w_f) THEN 1.0
+                        ELSE (v + w_0 + (w_f+w_c)/2) / (2*m + (w_f-w_c)/2) END AS lfi
+            FROM flows
+        )
+        SELECT "Building", "Product", m AS "Mass", lfi AS "LFI", mci AS "MCI", dp AS "Disassembly", mci*dp AS "BCI"
+        FROM (
+            -- greatest() skips NULLs, a missing LFI would score 0
+            SELECT *, CASE WHEN lfi IS NOT NULL THEN greatest(0, 1 - lfi*0.9) END AS mci
+            FROM linear
+        )
+    """
+
+
+#%% Building level aggregation
+# The definition of the building scores, building_aggregates.py maintains running sums reproducing them at any
+# recycling efficiency
+def building_scores_sql(source="r_strategies", efficiency=0.95, dis_pot=1.0):
+    return f"""
+        SELECT "Building",
+               count(*) AS "Products",
+               sum("Mass") AS "Mass",
+               sum("Mass"*"MCI") / nullif(sum("Mass"), 0) AS "MCI",
+               sum("Mass"*"Disassembly") / nullif(sum("Mass"), 0) AS "Disassembly",
+               sum("Mass"*"BCI") / nullif(sum("Mass"), 0) AS "BCI"
+        FROM ({product_scores_sql(source, efficiency, dis_pot)})
+        GROUP BY "Building"
+        ORDER BY "Building"
+    """
+
+
+def building_scores(con, building=None, efficiency=0.95, dis_pot=1.0):
+    """Mass-weighted MCI, disassembly potential and BCI per building, call .df() or .fetchall() on the result."""
+    query = building_scores_sql(efficiency=efficiency, dis_pot=dis_pot)
+    if building is None:
+        return con.execute(query)
+    return con.execute(f'SELECT * FROM ({query}) WHERE "Building" = ?', [building])
@@ -0,0 +1,131 @@
+#######################################################################################################################
+# Change feed of the product tables
+# products.upsert_products() and products.delete_products() append one row per product they insert, update or delete
+# to change_log, in the same transaction. Versions are monotonic, so a session only has to compare the latest version
+# with the last one it has seen and then fetch the changes in between, whichever process or session wrote them. The
+# log keeps the last KEEP changes, sessions further behind reload everything.
+#
+# ChangeFeed caches the latest version for `interval` seconds, all sessions of a process share one query per interval.
+# Writes of the process itself are pushed: ChangeFeed.reactive_version() is a Shiny reactive value shared by all the
+# sessions of the process, bumped after every committed write. Read-only files older than schema version 5 have no log,
+# their feed stays at version 0.
+#######################################################################################################################
+
+import asyncio
+import threading
+import time
+
+import duckdb
+
+KEEP = 10_000
+OPS = ["insert", "update", "delete"]
+
+
+def record(con, changes, keep=KEEP):
+    """Append the (op, product) rows of the subquery `changes` to the log, dropping changes older than `keep`."""
+    con.execute(f"INSERT INTO change_log (op, product) SELECT op, product FROM ({changes}) ORDER BY product")
+    con.execute("DELETE FROM change_log WHERE version <= (SELECT max(version) FROM change_log) - ?", [int(keep)])
+
+
+def latest_version(con):
+    return con.execute("SELECT coalesce(max(version), 0) FROM change_log").fetchone()[0]
+
+
+def changes_since(con, version, limit=1000):
+    """(latest version, [(version, op, product)...]) of the changes after `version`.
+
+    The list is None when the changes are no longer all logged or are more than `limit`, reload everything then.
+    """
+    latest, oldest, n = con.execute(
+        "SELECT coalesce(max(version), 0), min(version), count(*) FROM change_log WHERE version > ?", [version]
+    ).fetchone()
+    if n == 0:
+        return latest_version(con), []
+    # versions skipped by rolled back transactions look like pruned changes, hence the extra check on the log
+    pruned = oldest > version + 1 and con.execute(
+        "SELECT count(*) = 0 FROM change_log WHERE version <= ?", [version]
+    ).fetchone()[0]
+    if n > limit or pruned:
+        return latest, None
+    rows = con.execute("SELECT version, op, product FROM change_log WHERE version > ? ORDER BY version", [version])
+    return latest, rows.fetchall()
+
+
+class ChangeFeed:
+
+    def __init__(self, db, interval=0.25):
+        self.db = db
+        self.interval = interval
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._reactive = None
+        self._loop = None
+
+    def version(self):
+        """Latest version of the log, queried at most once every `interval` seconds."""
+        with self._lock:
+            now = time.monotonic()
+            if self._version is None or now - self._checked >= self.interval:
+                try:
+                    with self.db.cursor() as con:
+                        self._version = latest_version(con)
+                except duckdb.CatalogException:
+                    self._version = 0
+                self._checked = now
+            return self._version
+
+    def reactive_version(self):
+        """Reactive value of the latest version, set after every write transaction of this process.
+
+        The value is updated on the event loop of the sessions that called this, it is shared by all of them.
+        """
+        from shiny import reactive
+
+        with self._lock:
+            if self._reactive is None:
+                self._reactive = reactive.value(None)
+                self.db.on_commit(self._committed)
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass  # the run of the app script at startup, sessions run on the loop
+        self._reactive.set(self.version())
+        return self._reactive
+
+    def _committed(self):
+        # called from the writing thread, the cached version is stale
+        with self._lock:
+            self._version = None
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._update()))
+        except RuntimeError:
+            pass  # the app has stopped, e.g. the write-behind queue flushed at exit
+
+    async def _update(self):
+        from shiny import reactive
+
+        async with reactive.lock():
+            self._reactive.set(self.version())
+            await reactive.flush()
+
+    def changes_since(self, version, limit=1000):
+        try:
+            with self.db.cursor() as con:
+                return changes_since(con, version, limit)
+        except duckdb.CatalogException:
+            return 0, []
+
+
+#%% Process-wide registry, one feed per database
+_feeds = {}
+_registry_lock = threading.Lock()
+
+
+def get_feed(db, **options):
+    with _registry_lock:
+        if id(db) not in _feeds:
+            _feeds[id(db)] = ChangeFeed(db, **options)
+        return _feeds[id(db)]
@@ -0,0 +1,107 @@
+#######################################################################################################################
+# Chart data aggregated in DuckDB
+# Building-wide charts never ship one point per product to the browser: strategies are shown for the top-N products
+# by mass plus one "Other products" bar, score distributions are binned, scatter plots are drawn from a reservoir
+# sample and the portfolio view rolls the per-building aggregates up to the top-N buildings. Payloads are bounded by
+# the number of bars, bins or sampled points whatever the inventory size. Results are Arrow tables turned into
+# {column: list} dicts.
+#######################################################################################################################
+
+from building_scores import STRATEGIES, product_scores_sql
+
+OTHER_PRODUCTS = "Other products"
+OTHER_BUILDINGS = "Other buildings"
+
+
+def _source(building=None):
+    # products of one building, or all of them
+    if building:
+        return """(SELECT * FROM r_strategies WHERE "Building" = ?)""", [building]
+    return "r_strategies", []
+
+
+def _columns(relation):
+    return relation.to_arrow_table().to_pydict()
+
+
+#%% Product level charts
+def strategy_distribution(con, building=None, top_n=15):
+    """Mass of each strategy for the `top_n` heaviest products, the other products summed into one row."""
+    source, params = _source(building)
+    masses = ", ".join(f'sum("Mass" * "{s}") AS "{s}"' for s in STRATEGIES)
+    return _columns(con.execute(
+        f"""
+        WITH ranked AS (
+            SELECT *, row_number() OVER (ORDER BY "Mass" DESC, "Product") AS rank FROM {source}
+        )
+        SELECT CASE WHEN rank <= ? THEN "Product" ELSE '{OTHER_PRODUCTS}' END AS label,
+               count(*) AS products, {masses}
+        FROM ranked
+        GROUP BY label
+        ORDER BY min(rank)
+        """,
+        params + [int(top_n)],
+    ))
+
+
+def score_histogram(con, building=None, column="MCI", bins=40, efficiency=0.95, dis_pot=1.0):
+    """Number and mass of products per bin of equal width on [0, 1] of the product score `column`."""
+    if column not in ("MCI", "BCI", "Disassembly"):
+        raise ValueError(f"Cannot bin products by {column!r}")
+    source, params = _source(building)
+    bins = int(bins)
+    return _columns(con.execute(
+        f"""
+        SELECT least(floor("{column}" * {bins}), {bins} - 1)::INTEGER AS bin,
+               count(*) AS products, sum("Mass") AS mass
+        FROM ({product_scores_sql(source, efficiency, dis_pot)})
+        GROUP BY bin
+        ORDER BY bin
+        """,
+        params,
+    ))
+
+
+def score_sample(con, building=None, max_points=5000, efficiency=0.95, dis_pot=1.0, seed=0):
+    """Mass, MCI and BCI of at most `max_points` products drawn at random, and the number of products sampled from."""
+    source, params = _source(building)
+    scores = product_scores_sql(source, efficiency, dis_pot)
+    total = con.execute(f"SELECT count(*) FROM {source}", params).fetchone()[0]
+    sample = _columns(con.execute(
+        f"""
+        SELECT "Product", "Mass", "MCI", "BCI"
+        FROM ({scores}) USING SAMPLE reservoir({int(max_points)} ROWS) REPEATABLE ({int(seed)})
+        """,
+        params,
+    ))
+    return sample, total
+
+
+#%% Portfolio
+def portfolio_rollup(con, top_n=20):
+    """Hierarchy portfolio > building > strategy of the stored mass, read from the per-building aggregates.
+
+    Returns {"id", "parent", "label", "mass"} lists ready for a treemap or sunburst, buildings beyond the `top_n`
+    heaviest are merged into one node.
+    """
+    strategy_masses = ", ".join(f'sum({s.lower()}_mass) AS "{s}"' for s in STRATEGIES)
+    rows = con.execute(
+        f"""
+        WITH ranked AS (
+            SELECT b.name, a.*, row_number() OVER (ORDER BY a.mass DESC, b.name) AS rank
+            FROM building_aggregates a JOIN buildings b USING (building_id)
+        )
+        SELECT CASE WHEN rank <= ? THEN name ELSE '{OTHER_BUILDINGS}' END AS building, {strategy_masses}
+        FROM ranked
+        GROUP BY building
+        ORDER BY min(rank)
+        """,
+        [int(top_n)],
+    ).fetchall()
+
+    nodes = [("Portfolio", "", "Portfolio", sum(sum(masses) for _, *masses in rows))]
+    for building, *masses in rows:
+        building_id = f"Portfolio/{building}"
+        nodes.append((building_id, "Portfolio", building, sum(masses)))
+        nodes += [(f"{building_id}/{s}", building_id, s, mass) for s, mass in zip(STRATEGIES, masses)]
+    return {key: [node[i] for node in nodes] for i, key in enumerate(["id", "parent", "label", "mass"])}
@@ -0,0 +1,133 @@
+#######################################################################################################################
+# Shared access to the building database
+# One database instance is opened per file and process, sessions and requests get their own cursor on it and writes
+# are serialized behind a lock. In read-only mode (dashboards) the file is only opened for the duration of each
+# cursor, so maintenance scripts can take the write lock between requests. on_commit() callbacks run after every write
+# transaction of the process, the change feed uses them to push product changes to the open sessions.
+#######################################################################################################################
+
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+
+from profiling import profile_cursor
+
+app_dir = Path(__file__).parent
+data_dir = app_dir / "data"
+# BCI_DB points the app and the scripts at another database file
+default_db_path = Path(os.environ.get("BCI_DB") or data_dir / "building_data.db")
+
+
+def env_read_only():
+    return os.environ.get("BCI_READ_ONLY", "").lower() in ("1", "true", "yes")
+
+
+def connect(path, read_only=False, lock_timeout=0.0):
+    """duckdb.connect, retrying while another process holds a conflicting lock on the file."""
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        try:
+            return duckdb.connect(str(path), read_only=read_only)
+        except duckdb.IOException:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.1)
+
+
+class BuildingDatabase:
+
+    def __init__(self, path=default_db_path, read_only=False, lock_timeout=0.0):
+        self.path = Path(path)
+        self.read_only = read_only
+        self.lock_timeout = lock_timeout
+        self._con = None
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._setup_done = set()
+        self._commit_callbacks = []
+
+    def _connection(self):
+        with self._open_lock:
+            if self._con is None:
+                self._con = connect(self.path, read_only=False, lock_timeout=self.lock_timeout)
+            return self._con
+
+    @contextmanager
+    def cursor(self):
+        """Cursor for the current request, safe to use from any thread (queries are timed with BCI_PROFILE=1)."""
+        if self.read_only:
+            con = connect(self.path, read_only=True, lock_timeout=self.lock_timeout)
+            try:
+                yield profile_cursor(con)
+            finally:
+                con.close()
+        else:
+            cur = self._connection().cursor()
+            try:
+                yield profile_cursor(cur)
+            finally:
+                cur.close()
+
+    @contextmanager
+    def write(self):
+        """Cursor running inside a transaction, one writer at a time."""
+        if self.read_only:
+            raise PermissionError(f"{self.path.name} is opened in read-only mode")
+        with self._write_lock, self.cursor() as cur:
+            cur.begin()
+            try:
+                yield cur
+            except BaseException:
+                cur.rollback()
+                raise
+            cur.commit()
+        for fn in self._commit_callbacks:
+            fn()
+
+    def on_commit(self, fn):
+        """Call fn() after every committed write transaction, from the thread that wrote."""
+        self._commit_callbacks.append(fn)
+
+    def setup(self, fn):
+        """Run the write function fn(con) once per process, e.g. schema changes made when the app starts."""
+        with self._write_lock:
+            if fn not in self._setup_done:
+                with self.write() as con:
+                    fn(con)
+                self._setup_done.add(fn)
+
+    def close(self):
+        with self._open_lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+
+#%% Process-wide registry, one BuildingDatabase per file and mode
+_databases = {}
+_registry_lock = threading.Lock()
+
+
+def get_database(path=default_db_path, read_only=None):
+    if read_only is None:
+        read_only = env_read_only()
+    key = (Path(path).resolve(), read_only)
+    with _registry_lock:
+        if key not in _databases:
+            _databases[key] = BuildingDatabase(path, read_only=read_only)
+        return _databases[key]
+
+
+def close_all():
+    with _registry_lock:
+        for db in _databases.values():
+            db.close()
+        _databases.clear()
+
+
+atexit.register(close_all)
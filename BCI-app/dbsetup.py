@@ -1,25 +1,32 @@
 
-import duckdb
-import os
+# creates data/building_data.db with a few example products, or migrates an existing file to the latest schema
 from pathlib import Path
 
-p = Path.cwd()
-print(p)
-os.chdir(p.parent)
-data_dir = os.getcwd() + "\\data"
+from database import BuildingDatabase
+from migrations import migrate, schema_version
+from products import upsert_rows
+
+data_dir = Path(__file__).parent / "data"
 print(data_dir)
 
 # create a connection to a building data file 'building_data.db'
-con = duckdb.connect(data_dir + "\\building_data.db")
+db = BuildingDatabase(data_dir / "building_data.db", lock_timeout=30)
+
+with db.write() as con:
+    # create or migrate the product tables, r_strategies is a view on them
+    applied = migrate(con)
+    print(f"Applied migrations {applied}, schema version {schema_version(con)}")
 
-# create the R strategies table and load data into it
-con.sql("CREATE TABLE r_strategies (Product STRING, Virgin DOUBLE, Reused DOUBLE, Recycled DOUBLE, Repurposed DOUBLE)")
-con.sql("INSERT INTO r_strategies VALUES ('Product 1', 0.1, 0.2, 0.3, 0.4)")
-con.sql("INSERT INTO r_strategies VALUES ('Product 2', 0.25, 0.25, 0.25, 0.25)")
-con.sql("INSERT INTO r_strategies VALUES ('Product 3', 0.9, 0, 0.1, 0)")
+    # load example data into an empty database
+    if con.execute("SELECT count(*) FROM r_strategies").fetchone()[0] == 0:
+        upsert_rows(con, [
+            ("Product 1", 0.1, 0.2, 0.3, 0.4, "Building 1", 1.0),
+            ("Product 2", 0.25, 0.25, 0.25, 0.25, "Building 1", 1.0),
+            ("Product 3", 0.9, 0, 0.1, 0, "Building 1", 1.0),
+        ])
 
-# query the table
-con.table("r_strategies").show()
+    # query the table
+    con.table("r_strategies").show()
 
 # explicitly close the connection
-con.close()
\ No newline at end of file
+db.close()
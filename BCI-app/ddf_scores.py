@@ -0,0 +1,61 @@
+#######################################################################################################################
+# Durmisevic Determining Disassembly Factors (DDFs)
+# Fuzzy scores are declared in data/ddf_scores.csv and loaded once into a lookup matrix, connections are then scored
+# in batch from integer codes (one row per joint, one column per factor).
+#######################################################################################################################
+
+import csv
+from pathlib import Path
+
+import numpy as np
+
+ddf_table_path = Path(__file__).parent / "data" / "ddf_scores.csv"
+
+
+def load_ddf_table(path=ddf_table_path):
+    """Read the scoring table, returns {factor: {"name": ..., "labels": [...], "scores": [...]}} in file order."""
+    table = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            factor = table.setdefault(row["factor"], {"name": row["name"], "labels": [], "scores": []})
+            factor["labels"].append(row["label"])
+            factor["scores"].append(float(row["score"]))
+    return table
+
+
+DDF_TABLE = load_ddf_table()
+FACTORS = list(DDF_TABLE)
+
+# SCORES[f, code] is the fuzzy score of label `code` for factor `f`, the last column is kept at 0 so that the code -1
+# (unknown label) scores 0
+SCORES = np.zeros((len(FACTORS), max(len(DDF_TABLE[f]["labels"]) for f in FACTORS) + 1))
+for i, factor in enumerate(FACTORS):
+    SCORES[i, :len(DDF_TABLE[factor]["scores"])] = DDF_TABLE[factor]["scores"]
+
+
+#%% Encoding of categorical labels into integer codes
+def encode(factor, labels):
+    """Integer codes of an array of labels for one factor, -1 for labels missing from the table."""
+    lookup = {label: code for code, label in enumerate(DDF_TABLE[factor]["labels"])}
+    labels = np.asarray(labels, dtype=object)
+    codes = np.fromiter((lookup.get(label, -1) for label in labels.ravel()), dtype=np.int64, count=labels.size)
+    return codes.reshape(labels.shape)
+
+
+def encode_connections(connections):
+    """Codes of a (n, 5) array of labels, or a mapping {factor: labels}, columns ordered as FACTORS."""
+    if isinstance(connections, dict):
+        return np.column_stack([encode(f, connections[f]) for f in FACTORS])
+    connections = np.atleast_2d(np.asarray(connections, dtype=object))
+    return np.column_stack([encode(f, connections[:, i]) for i, f in enumerate(FACTORS)])
+
+
+#%% Batch scoring
+def factor_scores(codes):
+    codes = np.atleast_2d(np.asarray(codes, dtype=np.int64))
+    return SCORES[np.arange(len(FACTORS)), codes]
+
+
+def disassembly_potential(codes, weights=None):
+    """Disassembly potential of each connection, DDFs are equally weighted by default."""
+    return np.average(factor_scores(codes), axis=1, weights=weights)
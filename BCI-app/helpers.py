@@ -1,14 +1,24 @@
 # helpers.py
 
-from shiny.express import ui, render
-import ibis
-import plotly.express as px
-import pandas as pd
-import plotly.graph_objects as go
-
 
 def initialize_database(con, source_db, table_name):
+    # ibis is only needed here, importing it at module level slowed down the app startup
+    import ibis
+
     source_con = ibis.duckdb.connect(database=source_db)
     table = source_con.table(table_name).execute()
     con.create_table(table_name, table)
     source_con.disconnect()
+
+
+def round_table(table, decimals=3):
+    """Arrow table with its floating point columns rounded, for display in data grids."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    columns = [
+        pc.round(column, decimals) if pa.types.is_floating(column.type) else column
+        for column in table.columns
+    ]
+    return pa.table(columns, names=table.column_names)
+
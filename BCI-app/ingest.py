@@ -0,0 +1,152 @@
+#######################################################################################################################
+# Bulk import of products
+# CSV or Parquet files are streamed through DuckDB's native readers into a staging table, validated in SQL and upserted
+# on "Product" into the product tables. See data/R_strategies.csv for the expected columns.
+#
+# usage: python ingest.py products.csv [more.parquet ...] [--db data/building_data.db] [--tolerance 0.001]
+#######################################################################################################################
+
+import argparse
+from pathlib import Path
+
+from building_scores import STRATEGIES
+from migrations import BUILDING_COLUMNS, migrate
+from products import upsert_products
+
+REQUIRED_COLUMNS = ["Product"] + STRATEGIES
+OPTIONAL_COLUMNS = {"Building": "'Building 1'", "Mass": "1.0", "Disassembly": "NULL"}
+READERS = {".csv": "read_csv(?, header = true)", ".parquet": "read_parquet(?)"}
+
+
+def source_sql(path, file_format=None):
+    file_format = (file_format or Path(path).suffix).lower()
+    if not file_format.startswith("."):
+        file_format = "." + file_format
+    if file_format not in READERS:
+        raise ValueError(f"Unsupported file format {file_format!r}, expected one of {', '.join(READERS)}")
+    return f"SELECT * FROM {READERS[file_format]}"
+
+
+def columns_sql(con, path, file_format=None):
+    """Select list casting the columns of the file to the r_strategies layout, missing optional columns get defaults."""
+    query = source_sql(path, file_format)
+    columns = [row[0] for row in con.execute(f"DESCRIBE {query}", [str(path)]).fetchall()]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"{Path(path).name} is missing the column(s) {', '.join(missing)}")
+
+    select = ['CAST("Product" AS VARCHAR) AS "Product"']
+    select += [f'CAST("{s}" AS DOUBLE) AS "{s}"' for s in STRATEGIES]
+    for column, default in OPTIONAL_COLUMNS.items():
+        source = f'"{column}"' if column in columns else default
+        select.append(f'CAST({source} AS {BUILDING_COLUMNS[column].split()[0]}) AS "{column}"')
+    return ", ".join(select)
+
+
+def stage(con, path, file_format=None):
+    """Load the file into the temporary table staged_products, with every r_strategies column and a row number."""
+    con.execute("DROP TABLE IF EXISTS staged_products")
+    con.execute(
+        f"""
+        CREATE TEMP TABLE staged_products AS
+        SELECT row_number() OVER () AS row_id, {columns_sql(con, path, file_format)}
+        FROM ({source_sql(path, file_format)})
+        """,
+        [str(path)],
+    )
+
+
+def validation_sql(tolerance):
+    # one reason per rejected row, the strategy fractions must lie in [0, 1] and sum to 1
+    fractions = " + ".join(f'"{s}"' for s in STRATEGIES)
+    out_of_range = " OR ".join(f'"{s}" NOT BETWEEN 0 AND 1' for s in STRATEGIES)
+    any_null = " OR ".join(f'"{s}" IS NULL' for s in STRATEGIES)
+    return f"""
+        SELECT row_id, "Product",
+               CASE WHEN "Product" IS NULL OR trim("Product") = '' THEN 'missing product name'
+                    WHEN {any_null} THEN 'missing strategy fraction'
+                    WHEN {out_of_range} THEN 'fraction outside [0, 1]'
+                    WHEN abs({fractions} - 1) > {float(tolerance)} THEN 'fractions do not sum to 1'
+                    WHEN "Mass" IS NULL OR "Mass" < 0 THEN 'invalid mass'
+               END AS reason
+        FROM staged_products
+    """
+
+
+def import_products(con, path, file_format=None, tolerance=1e-3, dry_run=False, progress=None):
+    """Validate and upsert one file, returns a summary with the rejected rows (at most 20 are listed).
+
+    Run it inside a transaction (BuildingDatabase.write()) so that a failed import leaves the tables untouched. Rows
+    sharing a product name are upserted once, the last one in the file wins. `progress(message)` is called before
+    each step, from the thread running the import.
+    """
+    report = progress or (lambda message: None)
+    migrate(con)
+    report("reading the file")
+    stage(con, path, file_format)
+    n_read = con.execute("SELECT count(*) FROM staged_products").fetchone()[0]
+    report(f"validating {n_read} rows")
+    con.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE valid_products AS
+        SELECT s.* EXCLUDE (row_id)
+        FROM staged_products s JOIN ({validation_sql(tolerance)}) v USING (row_id)
+        WHERE v.reason IS NULL
+        QUALIFY row_number() OVER (PARTITION BY s."Product" ORDER BY s.row_id DESC) = 1
+        """
+    )
+    n_valid, n_updated = con.execute(
+        """
+        SELECT count(*), count(*) FILTER (WHERE "Product" IN (SELECT name FROM products))
+        FROM valid_products
+        """
+    ).fetchone()
+    rejected = f"""SELECT row_id, "Product", reason FROM ({validation_sql(tolerance)}) WHERE reason IS NOT NULL"""
+    n_rejected = con.execute(f"SELECT count(*) FROM ({rejected})").fetchone()[0]
+    errors = con.execute(f"{rejected} ORDER BY row_id LIMIT 20").fetchall()
+
+    if not dry_run:
+        report(f"writing {n_valid} products")
+        upsert_products(con, "valid_products")
+    con.execute("DROP TABLE staged_products")
+    con.execute("DROP TABLE valid_products")
+
+    return {
+        "file": Path(path).name,
+        "read": n_read,
+        "inserted": n_valid - n_updated,
+        "updated": n_updated,
+        "rejected": n_rejected,
+        "errors": errors,
+    }
+
+
+def summary_text(summary):
+    return (f"{summary['file']}: {summary['read']} rows read, {summary['inserted']} inserted, "
+            f"{summary['updated']} updated, {summary['rejected']} rejected")
+
+
+#%% Command line interface
+def main(argv=None):
+    from database import BuildingDatabase, default_db_path
+
+    parser = argparse.ArgumentParser(description="Import products into the building database.")
+    parser.add_argument("files", nargs="+", type=Path, help="CSV or Parquet files")
+    parser.add_argument("--db", type=Path, default=default_db_path, help="building database file")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="file format, inferred from the extension")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="tolerance on the sum of strategy fractions")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, nothing is written")
+    args = parser.parse_args(argv)
+
+    db = BuildingDatabase(args.db, lock_timeout=30)
+    for path in args.files:
+        with db.write() as con:
+            summary = import_products(con, path, args.format, args.tolerance, args.dry_run)
+        print(summary_text(summary))
+        for row_id, product, reason in summary["errors"]:
+            print(f"  row {row_id} ({product}): {reason}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#######################################################################################################################
+# Embodied carbon (GWP, kg CO2e) of the products and buildings
+# emission_factors holds, per dataset, the kg CO2e per kg of material supplied through each route (virgin, reused,
+# recycled, repurposed). Factors apply to every product (scope 'all') or to one product (scope 'product', item =
+# product name), the product factor of a route wins over the 'all' one. Every dataset gives the four routes in its
+# 'all' scope, set_factors() and load_factors() reject incomplete ones, and datasets stored incomplete by older versions
+# warn and fall back on DEFAULT_FACTORS. A product emits mass * sum(strategy fraction * route factor), computed for all
+# products in one set-based query next to their MCI and BCI. "Avoided GWP" compares with the same mass supplied as
+# virgin material.
+#
+# The factors of a dataset are resolved into a small lookup table (one row per scope and item) cached in the process
+# per database file and dataset until the dataset changes, queries join it as an Arrow table. DEFAULT_FACTORS are
+# illustrative placeholders, load a real dataset (ICE, Okobaudat, EPDs...) with
+# `python bci.py lca --load factors.csv --dataset <name>`, the CSV columns being scope, item, route, factor and
+# optionally source.
+#######################################################################################################################
+
+import threading
+import warnings
+
+from building_scores import STRATEGIES, product_scores_sql
+
+DEFAULT_DATASET = "default"
+# kg CO2e per kg, seeded as the 'all' scope of the default dataset
+DEFAULT_FACTORS = {"Virgin": 1.0, "Reused": 0.05, "Recycled": 0.4, "Repurposed": 0.15}
+SCOPES = ["all", "product"]
+LOOKUP = "emission_factor_lookup"
+
+
+#%% Emission factor datasets
+def _missing_routes(routes):
+    return [s for s in STRATEGIES if s not in routes]
+
+
+def _check_complete(routes, dataset):
+    missing = _missing_routes(routes)
+    if missing:
+        raise ValueError(f"Dataset {dataset!r} has no 'all' factor for {', '.join(missing)}")
+
+
+def set_factors(con, rows, dataset=DEFAULT_DATASET):
+    """Insert or replace (scope, item, route, factor, source) rows of `dataset`, complete with its stored factors."""
+    rows = [tuple(row) + (None,) * (5 - len(row)) for row in rows]
+    for scope, _, route, _, _ in rows:
+        if scope not in SCOPES or route not in STRATEGIES:
+            raise ValueError(f"Unknown scope {scope!r} or route {route!r}")
+    stored = con.execute(
+        "SELECT route FROM emission_factors WHERE dataset = ? AND scope = 'all' AND item = ''", [dataset]
+    ).fetchall()
+    added = {route for scope, item, route, _, _ in rows if scope == "all" and not item}
+    _check_complete({row[0] for row in stored} | added, dataset)
+    con.executemany(
+        """
+        INSERT INTO emission_factors (dataset, scope, item, route, factor, source) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (dataset, scope, item, route) DO UPDATE
+        SET factor = excluded.factor, source = excluded.source, updated_at = now()
+        """,
+        [(dataset, scope, item or "", route, float(factor), source) for scope, item, route, factor, source in rows],
+    )
+
+
+def load_factors(con, path, dataset):
+    """Replace `dataset` with the factors of the CSV file `path`, returns the number of factors."""
+    csv = "read_csv(?, header = true, all_varchar = true)"
+    columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {csv}", [str(path)]).fetchall()]
+    source = "source" if "source" in columns else "NULL"
+    invalid = con.execute(
+        f"SELECT count(*) FROM {csv} WHERE scope NOT IN ? OR route NOT IN ? OR TRY_CAST(factor AS DOUBLE) IS NULL",
+        [str(path), SCOPES, STRATEGIES],
+    ).fetchone()[0]
+    if invalid:
+        raise ValueError(f"{invalid} factor(s) of {path} have an unknown scope or route or no numeric factor")
+    routes = con.execute(
+        f"SELECT DISTINCT route FROM {csv} WHERE scope = 'all' AND coalesce(item, '') = ''", [str(path)]
+    ).fetchall()
+    _check_complete({row[0] for row in routes}, dataset)
+    con.execute("DELETE FROM emission_factors WHERE dataset = ?", [dataset])
+    con.execute(
+        f"""
+        INSERT INTO emission_factors (dataset, scope, item, route, factor, source)
+        SELECT ?, scope, coalesce(item, ''), route, CAST(factor AS DOUBLE), {source} FROM {csv}
+        """,
+        [dataset, str(path)],
+    )
+    return con.execute("SELECT count(*) FROM emission_factors WHERE dataset = ?", [dataset]).fetchone()[0]
+
+
+def datasets(con):
+    return [row[0] for row in con.execute("SELECT DISTINCT dataset FROM emission_factors ORDER BY 1").fetchall()]
+
+
+#%% Cached factor lookups
+_lookups = {}
+_lookups_lock = threading.Lock()
+
+
+def factor_lookup(con, dataset=DEFAULT_DATASET):
+    """Arrow table (scope, item, one factor column per route) of `dataset`, NULL where the route is not given.
+
+    Lookups are cached per database file, those of in-memory databases are resolved on every call.
+    """
+    path, *stamp = con.execute(
+        """
+        SELECT (SELECT path FROM duckdb_databases() WHERE database_name = current_database()), count(*),
+               max(updated_at)
+        FROM emission_factors WHERE dataset = ?
+        """,
+        [dataset],
+    ).fetchone()
+    key = (path, dataset)
+    with _lookups_lock:
+        cached = _lookups.get(key)
+        if path is not None and cached is not None and cached[0] == stamp:
+            return cached[1]
+    routes = ", ".join(f"max(factor) FILTER (WHERE route = '{s}') AS \"{s}\"" for s in STRATEGIES)
+    lookup = con.execute(
+        f"SELECT scope, item, {routes} FROM emission_factors WHERE dataset = ? GROUP BY scope, item", [dataset]
+    ).to_arrow_table()
+    given = [row for row in lookup.to_pylist() if row["scope"] == "all" and row["item"] == ""]
+    missing = _missing_routes([s for s in STRATEGIES if given and given[0][s] is not None])
+    if missing:
+        warnings.warn(f"Emission factor dataset {dataset!r} has no 'all' factor for {', '.join(missing)}, "
+                      f"DEFAULT_FACTORS are used", stacklevel=2)
+    if path is not None:
+        with _lookups_lock:
+            _lookups[key] = (stamp, lookup)
+    return lookup
+
+
+#%% Product and building impacts
+def product_gwp_sql(building=None):
+    """GWP of the products (of `building`), per route and in total, joined with the factor lookup table LOOKUP."""
+    factor = {s: f'coalesce(fp."{s}", fa."{s}", {DEFAULT_FACTORS[s]})' for s in STRATEGIES}
+    routes = ", ".join(f'coalesce(f.mass, 1.0) * coalesce(p.{s.lower()}, 0) * {factor[s]} AS "GWP {s}"'
+                       for s in STRATEGIES)
+    total = " + ".join(f'coalesce(p.{s.lower()}, 0) * {factor[s]}' for s in STRATEGIES)
+    where = "WHERE b.name = ?" if building else ""
+    return f"""
+        SELECT p.name AS "Product", b.name AS "Building", coalesce(f.mass, 1.0) AS "Mass", {routes},
+               coalesce(f.mass, 1.0) * ({total}) AS "GWP",
+               coalesce(f.mass, 1.0) * {factor["Virgin"]} AS "GWP if virgin"
+        FROM products p
+        JOIN buildings b USING (building_id)
+        LEFT JOIN material_flows f USING (product_id)
+        LEFT JOIN {LOOKUP} fp ON fp.scope = 'product' AND fp.item = p.name
+        LEFT JOIN {LOOKUP} fa ON fa.scope = 'all'
+        {where}
+    """
+
+
+def _execute(con, query, params, dataset):
+    con.register(LOOKUP, factor_lookup(con, dataset))
+    try:
+        return con.execute(query, params).to_arrow_table()
+    finally:
+        con.unregister(LOOKUP)
+
+
+def product_impacts(con, building=None, dataset=DEFAULT_DATASET, efficiency=0.95, dis_pot=1.0, limit=None):
+    """Arrow table of the GWP, MCI and BCI of the products (of `building`), the largest emitters first."""
+    params = [building] if building else []
+    source = """(SELECT * FROM r_strategies WHERE "Building" = ?)""" if building else "r_strategies"
+    query = f"""
+        SELECT g."Product", g."Building", g."Mass", s."MCI", s."BCI", g."GWP", g."GWP" / g."Mass" AS "GWP per kg",
+               g."GWP if virgin" - g."GWP" AS "Avoided GWP"
+        FROM ({product_gwp_sql(building)}) g
+        JOIN ({product_scores_sql(source, efficiency, dis_pot)}) s USING ("Product")
+        ORDER BY g."GWP" DESC, g."Product"
+        {f"LIMIT {int(limit)}" if limit else ""}
+    """
+    return _execute(con, query, params + params, dataset)
+
+
+def building_impacts(con, dataset=DEFAULT_DATASET):
+    """Arrow table of the GWP and avoided GWP of each building."""
+    query = f"""
+        SELECT "Building", sum("GWP") AS "GWP", sum("GWP if virgin") - sum("GWP") AS "Avoided GWP",
+               sum("GWP") / nullif(sum("Mass"), 0) AS "GWP per kg"
+        FROM ({product_gwp_sql()})
+        GROUP BY "Building"
+        ORDER BY "Building"
+    """
+    return _execute(con, query, [], dataset)
+
+
+def gwp_distribution(con, building=None, top_n=15, dataset=DEFAULT_DATASET):
+    """GWP of each route for the `top_n` largest emitters, the other products summed into one row (see charts.py)."""
+    from charts import OTHER_PRODUCTS
+
+    routes = ", ".join(f'sum("GWP {s}") AS "{s}"' for s in STRATEGIES)
+    query = f"""
+        WITH ranked AS (
+            SELECT *, row_number() OVER (ORDER BY "GWP" DESC, "Product") AS rank
+            FROM ({product_gwp_sql(building)})
+        )
+        SELECT CASE WHEN rank <= ? THEN "Product" ELSE '{OTHER_PRODUCTS}' END AS label, count(*) AS products, {routes}
+        FROM ranked
+        GROUP BY label
+        ORDER BY min(rank)
+    """
+    return _execute(con, query, ([building] if building else []) + [int(top_n)], dataset).to_pydict()
+
+
+#%% Command line interface
+def main(argv=None):
+    import argparse
+    from pathlib import Path
+
+    from database import BuildingDatabase, default_db_path
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Embodied carbon of the buildings.")
+    parser.add_argument("--db", type=Path, default=default_db_path, help="building database file")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="emission factor dataset")
+    parser.add_argument("--load", type=Path, help="replace the dataset with the factors of this CSV file")
+    args = parser.parse_args(argv)
+
+    db = BuildingDatabase(args.db, lock_timeout=30)
+    with db.write() as con:
+        migrate(con)
+        if args.load:
+            print(f"{load_factors(con, args.load, args.dataset)} factor(s) loaded into {args.dataset!r}")
+        rows = building_impacts(con, args.dataset).to_pylist()
+    db.close()
+    print(f"{'Building':30} {'GWP (kg CO2e)':>15} {'Avoided':>15} {'per kg':>8}")
+    for row in rows:
+        gwp, avoided, per_kg = row["GWP"], row["Avoided GWP"], row["GWP per kg"] or 0
+        print(f"{row['Building'][:30]:30} {gwp:15,.1f} {avoided:15,.1f} {per_kg:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#######################################################################################################################
+# Material flow analysis of whole buildings
+# Every product follows the flow network of the MCI methodology (MCI_calculations.flows), from the material sources
+# through manufacturing and use to its end of life:
+#   virgin extraction, scrap feedstock > feedstock recycling, reused components > manufacturing > use
+#   use > reuse & repurposing, end-of-life recycling > secondary material, landfill & energy recovery
+# The flows of all products are computed at once as an (n products, edges) array and summed into a sparse
+# source/target matrix over the nodes, with the use stage split into the `top_n` heaviest products (or buildings)
+# plus one node for the others. The Sankey diagram has at most len(STAGES) + top_n nodes whatever the inventory size.
+#
+# Fractions are balanced before the flows are computed: inputs (recycled + reused) and outputs (recycled + reused)
+# summing to more than 1 are scaled down to 1, so that every transit stage conserves mass. Waste of feedstock
+# recycling is unbounded for an efficiency of 0 and left out then.
+#######################################################################################################################
+
+import numpy as np
+
+import MCI_calculations as mc
+from charts import OTHER_BUILDINGS, OTHER_PRODUCTS
+
+STAGES = [
+    "Virgin extraction",
+    "Scrap feedstock",
+    "Reused components",
+    "Feedstock recycling",
+    "Manufacturing",
+    "Use",
+    "Reuse & repurposing",
+    "End-of-life recycling",
+    "Secondary material",
+    "Landfill & energy recovery",
+]
+# (source, target) stage of each flow
+EDGES = [
+    ("Virgin extraction", "Manufacturing"),
+    ("Scrap feedstock", "Feedstock recycling"),
+    ("Feedstock recycling", "Manufacturing"),
+    ("Feedstock recycling", "Landfill & energy recovery"),
+    ("Reused components", "Manufacturing"),
+    ("Manufacturing", "Use"),
+    ("Use", "Reuse & repurposing"),
+    ("Use", "End-of-life recycling"),
+    ("Use", "Landfill & energy recovery"),
+    ("End-of-life recycling", "Secondary material"),
+    ("End-of-life recycling", "Landfill & energy recovery"),
+]
+# stages whose inflows equal their outflows
+TRANSIT = ["Feedstock recycling", "Manufacturing", "Use", "End-of-life recycling"]
+
+
+#%% Product flows
+def balance(recycled, reused):
+    """Recycled and reused fractions scaled down where they sum to more than 1, and the mask of the scaled ones."""
+    recycled = np.clip(np.asarray(recycled, dtype=float), 0, None)
+    reused = np.clip(np.asarray(reused, dtype=float), 0, None)
+    total = recycled + reused
+    scaled = total > 1
+    scale = np.where(scaled, 1/np.where(scaled, total, 1), 1.0)
+    return recycled*scale, reused*scale, scaled
+
+
+def product_flows(mass, recycled, reused, efficiency=0.95):
+    """(n, len(EDGES)) array of the mass on every edge for each product, and the number of balanced products.
+
+    As in building_scores.py the strategy fractions are used both as input and output fractions.
+    """
+    mass = np.asarray(mass, dtype=float)
+    f_r, f_u, scaled = balance(recycled, reused)
+    e = np.broadcast_to(np.asarray(efficiency, dtype=float), mass.shape)
+    v, w_0, w_f, w_c, _ = mc.flows(mass, f_r, f_u, f_r, f_u, e)
+    w_f = np.where(np.isfinite(w_f), w_f, 0.0)
+    recycled_in = mass*f_r
+    columns = {
+        ("Virgin extraction", "Manufacturing"): v,
+        ("Scrap feedstock", "Feedstock recycling"): recycled_in + w_f,
+        ("Feedstock recycling", "Manufacturing"): recycled_in,
+        ("Feedstock recycling", "Landfill & energy recovery"): w_f,
+        ("Reused components", "Manufacturing"): mass*f_u,
+        ("Manufacturing", "Use"): mass,
+        ("Use", "Reuse & repurposing"): mass*f_u,
+        ("Use", "End-of-life recycling"): mass*f_r,
+        ("Use", "Landfill & energy recovery"): w_0,
+        ("End-of-life recycling", "Secondary material"): mass*f_r*e,
+        ("End-of-life recycling", "Landfill & energy recovery"): w_c,
+    }
+    return np.column_stack([columns[edge] for edge in EDGES]), int(scaled.sum())
+
+
+def incidence():
+    """(len(STAGES), len(EDGES)) matrix, +1 where an edge enters a stage and -1 where it leaves it."""
+    matrix = np.zeros((len(STAGES), len(EDGES)))
+    for j, (source, target) in enumerate(EDGES):
+        matrix[STAGES.index(source), j] -= 1
+        matrix[STAGES.index(target), j] += 1
+    return matrix
+
+
+def imbalance(flows):
+    """(n, len(TRANSIT)) inflow minus outflow of the transit stages for each product, zero when mass is conserved."""
+    rows = [STAGES.index(stage) for stage in TRANSIT]
+    return flows @ incidence()[rows].T
+
+
+#%% Aggregated flow matrix
+def flow_matrix(flows, groups, labels):
+    """Sum the product flows into (sources, targets, values) between nodes, the use stage split by group.
+
+    `groups` gives the group index of each product and `labels` the group names. Nodes are STAGES followed by one
+    use node per group, the plain "Use" node is not used. Only the non-zero entries of the matrix are returned.
+    """
+    n_nodes = len(STAGES) + len(labels)
+    groups = np.asarray(groups, dtype=np.int64)
+    use = STAGES.index("Use")
+    sources, targets = [], []
+    for source, target in EDGES:
+        s, t = STAGES.index(source), STAGES.index(target)
+        # per product node ids, the use stage maps to the node of the product group
+        sources.append(len(STAGES) + groups if s == use else np.full(len(groups), s))
+        targets.append(len(STAGES) + groups if t == use else np.full(len(groups), t))
+    cells = (np.column_stack(sources)*n_nodes + np.column_stack(targets)).ravel()
+    totals = np.bincount(cells, weights=np.asarray(flows, dtype=float).ravel(), minlength=n_nodes*n_nodes)
+    # rounding leftovers of balanced flows are dropped with the empty cells
+    nonzero = np.flatnonzero(totals > 1e-12*max(totals.max(initial=0), 1))
+    return nonzero // n_nodes, nonzero % n_nodes, totals[nonzero]
+
+
+def sankey_data(flows, groups, labels):
+    """Node labels and links of the Sankey diagram, unused nodes dropped."""
+    sources, targets, values = flow_matrix(flows, groups, labels)
+    nodes = STAGES + [f"Use: {label}" for label in labels]
+    used = np.unique(np.concatenate([sources, targets]))
+    index = np.full(len(nodes), -1)
+    index[used] = np.arange(len(used))
+    return {
+        "labels": [nodes[i] for i in used],
+        "source": index[sources].tolist(),
+        "target": index[targets].tolist(),
+        "value": values.tolist(),
+    }
+
+
+#%% Building inventories
+def inventory(con, building=None, top_n=10):
+    """Mass, recycled and reused fractions and group index of the products, with the group labels.
+
+    Groups are the `top_n` heaviest products of `building`, or the `top_n` heaviest buildings when building is None,
+    the rest share the last group.
+    """
+    if building:
+        source, params, key = """(SELECT * FROM r_strategies WHERE "Building" = ?)""", [building], '"Product"'
+        other = OTHER_PRODUCTS
+    else:
+        source, params, key = "r_strategies", [], '"Building"'
+        other = OTHER_BUILDINGS
+    ranked = f"""
+        SELECT {key} AS item, row_number() OVER (ORDER BY sum("Mass") DESC, {key}) - 1 AS rank
+        FROM {source} GROUP BY {key}
+    """
+    table = con.execute(
+        f"""
+        SELECT s."Mass", coalesce(s."Recycled", 0) AS recycled,
+               coalesce(s."Reused", 0) + coalesce(s."Repurposed", 0) AS reused, least(r.rank, ?) AS "group"
+        FROM {source} s JOIN ({ranked}) r ON r.item = s.{key}
+        """,
+        [int(top_n)] + params + params,
+    ).to_arrow_table()
+    columns = {name: table.column(name).to_numpy() for name in ["Mass", "recycled", "reused", "group"]}
+    labels = [row[0] for row in con.execute(f"SELECT item FROM ({ranked}) WHERE rank < ? ORDER BY rank",
+                                            params + [int(top_n)]).fetchall()]
+    if table.num_rows and columns["group"].max() >= top_n:
+        labels.append(other)
+    return columns, labels
+
+
+def building_flows(con, building=None, efficiency=0.95, top_n=10):
+    """Sankey data of the material flows of `building` (all buildings if None) and the number of balanced products."""
+    columns, labels = inventory(con, building, top_n)
+    flows, balanced = product_flows(columns["Mass"], columns["recycled"], columns["reused"], efficiency)
+    return sankey_data(flows, columns["group"], labels), balanced
@@ -0,0 +1,445 @@
+#######################################################################################################################
+# Versioned schema migrations of the building database
+# Migrations are applied in order and recorded in schema_migrations, each one is idempotent so that databases created
+# by older versions of dbsetup.py (without the version table) are migrated in place. Run migrate(con) inside a
+# transaction (BuildingDatabase.write()), a failed migration then leaves the file untouched.
+#
+# Since version 3 products are stored in normalized tables and r_strategies is a view with the original columns:
+#   buildings        building_id, name
+#   products         product_id, name, building_id, strategy fractions
+#   material_flows   product_id, mass, lifetime, functional_units
+#   ddf_assessments  product_id, one label per DDF factor, score (disassembly potential)
+#   price_catalogs   catalog, item, unit, unit_price, currency
+# Foreign keys are not declared: DuckDB rejects deleting and re-inserting a referenced key in one transaction, which
+# is how products are upserted. products.upsert_products() and products.delete_products() keep the tables consistent.
+# Version 4 adds the running per-building aggregates of building_aggregates.py, version 5 the change log of
+# change_feed.py, version 6 the scenario tables of scenarios.py, version 7 the emission factors of lca.py, version 8
+# running score sums per recycling efficiency and version 9 replaces them by the flow sums of building_aggregates.py,
+# which do not depend on the efficiency. Version 10 drops the building elements table of version 3, never written.
+# Migrations hold their own SQL rather than calling the modules, whose code moves on after the version is applied.
+#######################################################################################################################
+
+import duckdb
+
+# DDF factors of ddf_scores.FACTORS when version 3 was written, one label column each in ddf_assessments
+DDF_FACTORS = ["Accessibility", "Type", "Independency", "Method", "Pattern"]
+
+# Columns added to r_strategies so that products can be grouped and weighted per building (version 2)
+BUILDING_COLUMNS = {
+    "Building": "VARCHAR DEFAULT 'Building 1'",
+    "Mass": "DOUBLE DEFAULT 1.0",
+    "Disassembly": "DOUBLE",
+}
+
+
+def _is_table(con, name):
+    row = con.execute("SELECT table_type FROM information_schema.tables WHERE table_name = ?", [name]).fetchone()
+    return row is not None and row[0] == "BASE TABLE"
+
+
+#%% Migrations
+def create_r_strategies(con):
+    # the original flat table of dbsetup.py
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS r_strategies "
+        "(Product VARCHAR, Virgin DOUBLE, Reused DOUBLE, Recycled DOUBLE, Repurposed DOUBLE)"
+    )
+
+
+def add_building_columns(con):
+    if not _is_table(con, "r_strategies"):
+        return
+    for column, definition in BUILDING_COLUMNS.items():
+        con.execute(f'ALTER TABLE r_strategies ADD COLUMN IF NOT EXISTS "{column}" {definition}')
+
+
+R_STRATEGIES_VIEW = """
+    CREATE OR REPLACE VIEW r_strategies AS
+    SELECT p.name AS "Product",
+           p.virgin AS "Virgin", p.reused AS "Reused", p.recycled AS "Recycled", p.repurposed AS "Repurposed",
+           b.name AS "Building",
+           coalesce(f.mass, 1.0) AS "Mass",
+           d.score AS "Disassembly"
+    FROM products p
+    JOIN buildings b USING (building_id)
+    LEFT JOIN material_flows f USING (product_id)
+    LEFT JOIN ddf_assessments d USING (product_id)
+"""
+
+
+def normalize(con):
+    factors = ", ".join(f'"{f}" VARCHAR' for f in DDF_FACTORS)
+    con.execute("CREATE SEQUENCE IF NOT EXISTS building_ids")
+    con.execute("CREATE SEQUENCE IF NOT EXISTS element_ids")
+    con.execute("CREATE SEQUENCE IF NOT EXISTS product_ids")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS buildings (
+            building_id INTEGER PRIMARY KEY DEFAULT nextval('building_ids'),
+            name VARCHAR NOT NULL UNIQUE
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS elements (
+            element_id INTEGER PRIMARY KEY DEFAULT nextval('element_ids'),
+            building_id INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            UNIQUE (building_id, name)
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            product_id BIGINT PRIMARY KEY DEFAULT nextval('product_ids'),
+            name VARCHAR NOT NULL UNIQUE,
+            building_id INTEGER NOT NULL,
+            element_id INTEGER,
+            virgin DOUBLE,
+            reused DOUBLE,
+            recycled DOUBLE,
+            repurposed DOUBLE
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS products_building ON products (building_id)")
+    con.execute("CREATE INDEX IF NOT EXISTS products_element ON products (element_id)")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS material_flows (
+            product_id BIGINT PRIMARY KEY,
+            mass DOUBLE NOT NULL DEFAULT 1.0,
+            lifetime DOUBLE,
+            functional_units DOUBLE
+        )
+        """
+    )
+    con.execute(f"CREATE TABLE IF NOT EXISTS ddf_assessments (product_id BIGINT PRIMARY KEY, {factors}, score DOUBLE)")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_catalogs (
+            catalog VARCHAR NOT NULL,
+            item VARCHAR NOT NULL,
+            unit VARCHAR NOT NULL DEFAULT 'kg',
+            unit_price DOUBLE NOT NULL,
+            currency VARCHAR NOT NULL DEFAULT 'USD',
+            PRIMARY KEY (catalog, item)
+        )
+        """
+    )
+
+    if _is_table(con, "r_strategies"):
+        # move the flat table into the new tables, products stored several times keep their last row
+        con.execute(
+            """
+            CREATE TEMP TABLE legacy_products AS
+            SELECT * EXCLUDE (rn) FROM (
+                SELECT *, row_number() OVER (PARTITION BY "Product" ORDER BY rowid DESC) AS rn
+                FROM r_strategies WHERE "Product" IS NOT NULL
+            ) WHERE rn = 1
+            """
+        )
+        con.execute("DROP TABLE r_strategies")
+        con.execute(
+            """
+            INSERT INTO buildings (name)
+            SELECT DISTINCT coalesce("Building", 'Building 1') FROM legacy_products ORDER BY 1
+            """
+        )
+        con.execute(
+            """
+            INSERT INTO products (name, building_id, virgin, reused, recycled, repurposed)
+            SELECT l."Product", b.building_id, l."Virgin", l."Reused", l."Recycled", l."Repurposed"
+            FROM legacy_products l JOIN buildings b ON b.name = coalesce(l."Building", 'Building 1')
+            """
+        )
+        con.execute(
+            """
+            INSERT INTO material_flows (product_id, mass)
+            SELECT p.product_id, coalesce(l."Mass", 1.0) FROM legacy_products l JOIN products p ON p.name = l."Product"
+            """
+        )
+        con.execute(
+            """
+            INSERT INTO ddf_assessments (product_id, score)
+            SELECT p.product_id, l."Disassembly" FROM legacy_products l JOIN products p ON p.name = l."Product"
+            WHERE l."Disassembly" IS NOT NULL
+            """
+        )
+        con.execute("DROP TABLE legacy_products")
+    con.execute(R_STRATEGIES_VIEW)
+
+
+def per_building_aggregates(con):
+    # the running aggregates of building_aggregates.py, summed over the products stored at migration time
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS building_aggregates (
+            building_id INTEGER PRIMARY KEY, products BIGINT NOT NULL, mass DOUBLE NOT NULL,
+            virgin_mass DOUBLE NOT NULL, reused_mass DOUBLE NOT NULL, recycled_mass DOUBLE NOT NULL,
+            repurposed_mass DOUBLE NOT NULL, assessed_mass DOUBLE NOT NULL, ddf_mass DOUBLE NOT NULL
+        )
+        """
+    )
+    con.execute("DELETE FROM building_aggregates")
+    con.execute(
+        """
+        INSERT INTO building_aggregates
+        SELECT building_id, count(*), sum(mass), sum(mass*coalesce(virgin, 0)), sum(mass*coalesce(reused, 0)),
+               sum(mass*coalesce(recycled, 0)), sum(mass*coalesce(repurposed, 0)),
+               sum(CASE WHEN score IS NOT NULL THEN mass ELSE 0 END), sum(mass*coalesce(score, 0))
+        FROM (
+            SELECT p.building_id, coalesce(f.mass, 1.0) AS mass, p.virgin, p.reused, p.recycled, p.repurposed, d.score
+            FROM products p
+            LEFT JOIN material_flows f USING (product_id)
+            LEFT JOIN ddf_assessments d USING (product_id)
+        )
+        GROUP BY building_id
+        """
+    )
+
+
+def change_log(con):
+    con.execute("CREATE SEQUENCE IF NOT EXISTS change_versions")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS change_log (
+            version BIGINT PRIMARY KEY DEFAULT nextval('change_versions'),
+            op VARCHAR NOT NULL,
+            product VARCHAR NOT NULL,
+            changed_at TIMESTAMP DEFAULT current_timestamp
+        )
+        """
+    )
+
+
+def scenario_tables(con):
+    con.execute("CREATE SEQUENCE IF NOT EXISTS scenario_ids")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scenarios (
+            scenario_id INTEGER PRIMARY KEY DEFAULT nextval('scenario_ids'),
+            building_id INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            description VARCHAR,
+            settings VARCHAR,
+            saved_at TIMESTAMP DEFAULT current_timestamp,
+            UNIQUE (building_id, name)
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scenario_changes (
+            scenario_id INTEGER NOT NULL,
+            product VARCHAR NOT NULL,
+            virgin DOUBLE, reused DOUBLE, recycled DOUBLE, repurposed DOUBLE, mass DOUBLE, disassembly DOUBLE,
+            removed BOOLEAN NOT NULL DEFAULT false,
+            PRIMARY KEY (scenario_id, product)
+        )
+        """
+    )
+
+
+def emission_factors(con):
+    # seeded with the illustrative defaults of lca.DEFAULT_FACTORS
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS emission_factors (
+            dataset VARCHAR NOT NULL,
+            scope VARCHAR NOT NULL,
+            item VARCHAR NOT NULL DEFAULT '',
+            route VARCHAR NOT NULL,
+            factor DOUBLE NOT NULL,
+            source VARCHAR,
+            updated_at TIMESTAMP DEFAULT current_timestamp,
+            PRIMARY KEY (dataset, scope, item, route)
+        )
+        """
+    )
+    con.execute(
+        """
+        INSERT INTO emission_factors (dataset, scope, item, route, factor, source)
+        VALUES ('default', 'all', '', 'Virgin', 1.0, 'illustrative default'),
+               ('default', 'all', '', 'Reused', 0.05, 'illustrative default'),
+               ('default', 'all', '', 'Recycled', 0.4, 'illustrative default'),
+               ('default', 'all', '', 'Repurposed', 0.15, 'illustrative default')
+        ON CONFLICT (dataset, scope, item, route) DO UPDATE
+        SET factor = excluded.factor, source = excluded.source, updated_at = now()
+        """
+    )
+
+
+def score_sums_per_efficiency(con):
+    # the building score sums of version 8, only the 0.95 efficiency was summed at migration time
+    con.execute("CREATE TABLE IF NOT EXISTS score_efficiencies (efficiency DOUBLE PRIMARY KEY)")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS building_score_sums (
+            efficiency DOUBLE, building_id INTEGER, mci_mass DOUBLE NOT NULL, ddf_bci_mass DOUBLE NOT NULL,
+            unassessed_mci_mass DOUBLE NOT NULL, PRIMARY KEY (efficiency, building_id)
+        )
+        """
+    )
+    if con.execute("SELECT count(*) FROM score_efficiencies WHERE efficiency = 0.95").fetchone()[0]:
+        return
+    con.execute("INSERT INTO score_efficiencies VALUES (0.95)")
+    con.execute(
+        """
+        INSERT INTO building_score_sums
+        WITH flows AS (
+            SELECT p.building_id, coalesce(f.mass, 1.0) AS m, d.score,
+                   p.recycled AS f_r, p.reused + p.repurposed AS f_u
+            FROM products p
+            LEFT JOIN material_flows f USING (product_id)
+            LEFT JOIN ddf_assessments d USING (product_id)
+        ), scores AS (
+            SELECT building_id, m, score,
+                   greatest(0, 1 - 0.9*(m*(1-f_r-f_u) + m*(1-f_r-f_u) + (m*(0.05/0.95)*f_r + m*0.05*f_r)/2)
+                                     / (2*m + (m*(0.05/0.95)*f_r - m*0.05*f_r)/2)) AS mci
+            FROM flows
+        )
+        SELECT 0.95, building_id, coalesce(sum(m*mci), 0), coalesce(sum(coalesce(m*mci*score, 0)), 0),
+               coalesce(sum(CASE WHEN score IS NULL THEN m*mci ELSE 0 END), 0)
+        FROM scores
+        GROUP BY building_id
+        """
+    )
+
+
+def efficiency_free_flow_sums(con):
+    # replaces the per-efficiency score sums of version 8, see building_aggregates.py
+    con.execute("DROP TABLE IF EXISTS building_score_sums")
+    con.execute("DROP TABLE IF EXISTS score_efficiencies")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS building_flow_sums (
+            building_id INTEGER, recycled DOUBLE, products BIGINT NOT NULL, mass DOUBLE NOT NULL,
+            linear_mass DOUBLE NOT NULL, ddf_mass DOUBLE NOT NULL, ddf_linear_mass DOUBLE NOT NULL,
+            unassessed_mass DOUBLE NOT NULL, unassessed_linear_mass DOUBLE NOT NULL,
+            PRIMARY KEY (building_id, recycled)
+        )
+        """
+    )
+    con.execute("DELETE FROM building_flow_sums")
+    con.execute(
+        """
+        INSERT INTO building_flow_sums
+        SELECT building_id, recycled, count(*), sum(mass), sum(mass*linear), sum(coalesce(mass*score, 0)),
+               sum(coalesce(mass*score*linear, 0)), sum(CASE WHEN score IS NULL THEN mass ELSE 0 END),
+               sum(CASE WHEN score IS NULL THEN mass*linear ELSE 0 END)
+        FROM (
+            SELECT p.building_id, p.recycled, coalesce(f.mass, 1.0) AS mass, d.score,
+                   1 - p.recycled - p.reused - p.repurposed AS linear
+            FROM products p
+            LEFT JOIN material_flows f USING (product_id)
+            LEFT JOIN ddf_assessments d USING (product_id)
+            WHERE p.recycled IS NOT NULL AND p.reused IS NOT NULL AND p.repurposed IS NOT NULL
+        )
+        GROUP BY building_id, recycled
+        """
+    )
+
+
+def drop_elements(con):
+    # nothing ever wrote building elements. DuckDB cannot drop an indexed column inside a transaction, products is
+    # copied into a table without element_id instead, keeping the product ids
+    con.execute("DROP TABLE IF EXISTS elements")
+    con.execute("DROP SEQUENCE IF EXISTS element_ids")
+    con.execute(
+        """
+        CREATE TABLE products_v10 (
+            product_id BIGINT PRIMARY KEY DEFAULT nextval('product_ids'),
+            name VARCHAR NOT NULL UNIQUE,
+            building_id INTEGER NOT NULL,
+            virgin DOUBLE,
+            reused DOUBLE,
+            recycled DOUBLE,
+            repurposed DOUBLE
+        )
+        """
+    )
+    con.execute(
+        """
+        INSERT INTO products_v10
+        SELECT product_id, name, building_id, virgin, reused, recycled, repurposed FROM products ORDER BY product_id
+        """
+    )
+    con.execute("DROP TABLE products")
+    con.execute("ALTER TABLE products_v10 RENAME TO products")
+    con.execute("CREATE INDEX products_building ON products (building_id)")
+
+
+# (version, description, function), append new migrations at the end and never edit applied ones
+MIGRATIONS = [
+    (1, "flat r_strategies table", create_r_strategies),
+    (2, "building, mass and disassembly columns", add_building_columns),
+    (3, "normalized buildings, elements, products, flows, DDF assessments and price catalogs", normalize),
+    (4, "per-building aggregates", per_building_aggregates),
+    (5, "product change log", change_log),
+    (6, "scenarios stored as changes of a building inventory", scenario_tables),
+    (7, "emission factors", emission_factors),
+    (8, "running building score sums per recycling efficiency", score_sums_per_efficiency),
+    (9, "building flow sums independent of the recycling efficiency", efficiency_free_flow_sums),
+    (10, "unused building elements dropped", drop_elements),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+#%% Runner
+def schema_version(con):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR,
+            applied_at TIMESTAMP DEFAULT current_timestamp
+        )
+        """
+    )
+    return con.execute("SELECT coalesce(max(version), 0) FROM schema_migrations").fetchone()[0]
+
+
+def applied_version(con):
+    """Schema version of the database without creating the version table, for files opened read-only."""
+    try:
+        return con.execute("SELECT coalesce(max(version), 0) FROM schema_migrations").fetchone()[0]
+    except duckdb.CatalogException:
+        return 0
+
+
+def migrate(con, target=LATEST):
+    """Apply the pending migrations up to `target`, returns the versions applied."""
+    current = schema_version(con)
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if current < version <= target:
+            fn(con)
+            con.execute("INSERT INTO schema_migrations (version, description) VALUES (?, ?)", [version, description])
+            applied.append(version)
+    return applied
+
+
+#%% Command line interface
+def main(argv=None):
+    import argparse
+    from pathlib import Path
+
+    from database import BuildingDatabase, default_db_path
+
+    parser = argparse.ArgumentParser(description="Migrate a building database to the latest schema.")
+    parser.add_argument("--db", type=Path, default=default_db_path, help="building database file")
+    args = parser.parse_args(argv)
+
+    db = BuildingDatabase(args.db, lock_timeout=30)
+    with db.write() as con:
+        applied = migrate(con)
+        version = schema_version(con)
+    print(f"{args.db.name}: applied {applied or 'no'} migration(s), schema version {version}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
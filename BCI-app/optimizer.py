@@ -0,0 +1,258 @@
+#######################################################################################################################
+# Cost-constrained optimization of the circular strategy mix
+# Every product of a building chooses its mix of virgin, reused, recycled and repurposed material among discretized
+# options. The building BCI (mass-weighted product BCI, as in building_scores.py) and the cost are both sums over
+# products, a multiple-choice knapsack. Its supported (convex hull) Pareto points are exact: every product climbs the
+# upper hull of its options in cost and BCI, and taking the hull segments of all products in order of BCI per dollar
+# traces the front from the cheapest to the most circular mix. All products share the option grid, so the hulls are
+# computed once per distinct price row. The best mix under a budget or the cheapest mix reaching a target BCI usually
+# lies between two supported points, it is searched from both neighbours by greedy repair (option changes in order of
+# BCI per dollar) and the better result is kept. This is a heuristic: it is never worse than the supported points but
+# can miss the optimum of the knapsack.
+#######################################################################################################################
+
+import numpy as np
+
+import MCI_calculations as mc
+from building_scores import STRATEGIES
+
+# average prices per kg (USD) used when the price catalog has no entry
+DEFAULT_PRICES = {"Virgin": 12.0, "Reused": 4.0, "Recycled": 9.0, "Repurposed": 4.0}
+
+
+#%% Options and inputs
+def mix_options(step=0.1, max_reused=1.0, max_recycled=1.0):
+    """(K, 4) array of strategy mixes in STRATEGIES order on a grid of `step`, summing to 1.
+
+    max_reused bounds reused + repurposed and max_recycled bounds recycled, the material available on the market.
+    """
+    n = int(round(1/step))
+    grid = np.array([(v, u, r, n-v-u-r) for v in range(n+1) for u in range(n+1-v) for r in range(n+1-v-u)]) / n
+    reused = grid[:, 1] + grid[:, 3]
+    keep = (reused <= max_reused + 1e-9) & (grid[:, 2] <= max_recycled + 1e-9)
+    return grid[keep]
+
+
+def option_mci(options, efficiency=0.95):
+    # product MCI of each option, independent of the mass (X = 1, same mapping as building_scores.py)
+    recycled = options[:, 2]
+    reused = options[:, 1] + options[:, 3]
+    ones = np.ones(len(options))
+    return mc.MCI_batch(ones, recycled, reused, recycled, reused, efficiency*ones)[3]
+
+
+def inventory(con, building, dis_pot=1.0):
+    """Names, masses and disassembly potentials of the products of `building` ("Disassembly" falls back on dis_pot)."""
+    rows = con.execute(
+        """SELECT "Product", "Mass", coalesce("Disassembly", ?) FROM r_strategies WHERE "Building" = ? ORDER BY 1""",
+        [float(dis_pot), building],
+    ).fetchall()
+    names = [r[0] for r in rows]
+    return names, np.array([r[1] for r in rows], dtype=float), np.array([r[2] for r in rows], dtype=float)
+
+
+def catalog_prices(con, catalog="default", defaults=DEFAULT_PRICES):
+    """Price per kg of each strategy, the catalog items "<strategy>" override `defaults`."""
+    rows = con.execute(
+        "SELECT item, unit_price FROM price_catalogs WHERE catalog = ? AND unit = 'kg' AND item IN ?",
+        [catalog, STRATEGIES],
+    ).fetchall()
+    return {**{s: float(defaults[s]) for s in STRATEGIES}, **dict(rows)}
+
+
+def unit_prices(con, names, catalog="default", defaults=DEFAULT_PRICES):
+    """(n, 4) prices per kg, catalog items "<strategy>" apply to every product and "<product>/<strategy>" to one."""
+    prices = np.tile([float(defaults[s]) for s in STRATEGIES], (len(names), 1))
+    rows = con.execute(
+        "SELECT item, unit_price FROM price_catalogs WHERE catalog = ? AND unit = 'kg'", [catalog]
+    ).fetchall()
+    items = dict(rows)
+    for j, s in enumerate(STRATEGIES):
+        if s in items:
+            prices[:, j] = items[s]
+    index = {name: i for i, name in enumerate(names)}
+    for item, price in items.items():
+        product, _, strategy = item.rpartition("/")
+        if product in index and strategy in STRATEGIES:
+            prices[index[product], STRATEGIES.index(strategy)] = price
+    return prices
+
+
+#%% Pareto front
+def _hull(unit_cost, mci_k):
+    # options on the upper hull of (cost, MCI) by increasing cost, starting at the cheapest (ties to the higher MCI)
+    order = np.lexsort((-mci_k, unit_cost))
+    pareto = order[np.r_[True, mci_k[order][1:] > np.maximum.accumulate(mci_k[order])[:-1] + 1e-12]]
+    hull = []
+    for k in pareto:
+        while len(hull) >= 2:
+            (c1, m1), (c2, m2) = [(unit_cost[h], mci_k[h]) for h in hull[-2:]]
+            # drop the last option when it lies on or below the segment to the new one
+            if (m2-m1)*(unit_cost[k]-c1) <= (mci_k[k]-m1)*(c2-c1):
+                hull.pop()
+            else:
+                break
+        hull.append(k)
+    return hull
+
+
+def pareto_front(mass, prices, dis_pot, efficiency=0.95, step=0.1, max_reused=1.0, max_recycled=1.0):
+    """Supported Pareto points between cost and BCI, sorted by cost.
+
+    Returns {"cost", "bci", "mci": (P,) arrays, "options": (K, 4)} along with the hull segments (product and option
+    taken, in front order) from the cheapest mix and the (n, K) "product_bci" and "product_cost" of every option.
+    """
+    mass = np.asarray(mass, dtype=float)
+    dis_pot = np.broadcast_to(np.asarray(dis_pot, dtype=float), mass.shape)
+    prices = np.broadcast_to(np.asarray(prices, dtype=float), (len(mass), len(STRATEGIES)))
+    options = mix_options(step, max_reused, max_recycled)
+    mci_k = option_mci(options, efficiency)
+    # an inventory without mass has no circularity rather than 0/0
+    total = mass.sum()
+    weight = np.divide(mass, total, out=np.zeros_like(mass), where=total > 0)
+    scale = weight*dis_pot
+    unit_cost = prices @ options.T  # (n, K) per kg
+    value = scale[:, None] * mci_k[None, :]  # (n, K) BCI contribution
+    cost = mass[:, None] * unit_cost  # (n, K)
+
+    base = np.zeros(len(mass), dtype=int)
+    seg_product, seg_option, seg_value, seg_mci, seg_cost = [], [], [], [], []
+    rows, groups = np.unique(unit_cost, axis=0, return_inverse=True)
+    for g, row in enumerate(rows):
+        hull = _hull(row, mci_k)
+        members = np.flatnonzero(groups.ravel() == g)
+        base[members] = hull[0]
+        # products without mass or disassembly potential stay on their cheapest option
+        members = members[(scale[members] > 0) & (mass[members] > 0)]
+        for previous, k in zip(hull, hull[1:]):
+            seg_product.append(members)
+            seg_option.append(np.full(len(members), k))
+            seg_value.append(scale[members]*(mci_k[k]-mci_k[previous]))
+            seg_mci.append(weight[members]*(mci_k[k]-mci_k[previous]))
+            seg_cost.append(mass[members]*(row[k]-row[previous]))
+    seg_product, seg_option, seg_value, seg_mci, seg_cost = (
+        np.concatenate(a) if a else np.zeros(0, dtype=d)
+        for a, d in [(seg_product, int), (seg_option, int), (seg_value, float), (seg_mci, float), (seg_cost, float)]
+    )
+    # most BCI per dollar first, the segments of one product keep their hull order as their rates decrease
+    order = np.argsort(-seg_value/seg_cost, kind="stable")
+    seg_product, seg_option = seg_product[order], seg_option[order]
+    seg_value, seg_mci, seg_cost = seg_value[order], seg_mci[order], seg_cost[order]
+
+    start = _point({"product_bci": value, "product_cost": cost, "weight": weight, "option_mci": mci_k}, base)
+    return {
+        "cost": start["cost"] + np.r_[0, np.cumsum(seg_cost)],
+        "bci": start["bci"] + np.r_[0, np.cumsum(seg_value)],
+        "mci": start["mci"] + np.r_[0, np.cumsum(seg_mci)],
+        "options": options, "weight": weight, "option_mci": mci_k, "product_bci": value, "product_cost": cost,
+        "base": base, "segment_product": seg_product, "segment_option": seg_option,
+    }
+
+
+def front_choice(front, point):
+    """(n,) option index of each product at supported point `point` of the front."""
+    choice = front["base"].copy()
+    taken = np.full(len(choice), -1)
+    np.maximum.at(taken, front["segment_product"][:point], np.arange(point))
+    changed = taken >= 0
+    choice[changed] = front["segment_option"][taken[changed]]
+    return choice
+
+
+def _point(front, choice):
+    # totals of one option choice per product
+    rows = np.arange(len(choice))
+    return {
+        "cost": float(front["product_cost"][rows, choice].sum()),
+        "bci": float(front["product_bci"][rows, choice].sum()),
+        "mci": float((front["weight"]*front["option_mci"][choice]).sum()),
+        "choice": choice,
+    }
+
+
+#%% Greedy repair between the supported points
+def _upgrade(front, choice, budget=np.inf, target=np.inf):
+    # option changes raising the BCI, most BCI per dollar first, while affordable and until `target` is reached
+    value, cost = front["product_bci"], front["product_cost"]
+    rows = np.arange(len(choice))
+    choice = choice.copy()
+    for _ in range(value.size):
+        current_value, current_cost = value[rows, choice], cost[rows, choice]
+        if current_value.sum() >= target - 1e-12:
+            break
+        gain = value - current_value[:, None]
+        extra = cost - current_cost[:, None]
+        allowed = (gain > 1e-15) & (extra <= budget - current_cost.sum() + 1e-9)
+        if not allowed.any():
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(allowed, np.where(extra > 0, gain/extra, np.inf), -np.inf)
+        i, k = np.unravel_index(np.argmax(rate), rate.shape)
+        choice[i] = k
+    return choice
+
+
+def _downgrade(front, choice, budget=-np.inf, target=-np.inf):
+    # option changes lowering the cost, least BCI lost per dollar first, until within `budget` and keeping `target`
+    value, cost = front["product_bci"], front["product_cost"]
+    rows = np.arange(len(choice))
+    choice = choice.copy()
+    for _ in range(value.size):
+        current_value, current_cost = value[rows, choice], cost[rows, choice]
+        if current_cost.sum() <= budget + 1e-9:
+            break
+        saving = current_cost[:, None] - cost
+        loss = current_value[:, None] - value
+        allowed = (saving > 1e-9) & (current_value.sum() - loss >= target - 1e-12)
+        if not allowed.any():
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.where(allowed, np.where(loss > 0, saving/loss, np.inf), -np.inf)
+        i, k = np.unravel_index(np.argmax(rate), rate.shape)
+        choice[i] = k
+    return choice
+
+
+def best_under_budget(front, budget):
+    """Mix with the highest BCI found costing at most `budget`, as {"cost", "bci", "mci", "choice"}, None if none is.
+
+    The best supported point under the budget is upgraded with what is left, the next one is repaired down to the
+    budget and upgraded again.
+    """
+    affordable = np.flatnonzero(front["cost"] <= budget + 1e-9)
+    found = []
+    if affordable.size:
+        found.append(_point(front, _upgrade(front, front_choice(front, affordable[-1]), budget=budget)))
+    above = affordable[-1] + 1 if affordable.size else 0
+    if above < len(front["cost"]):
+        choice = _downgrade(front, front_choice(front, above), budget=budget)
+        if _point(front, choice)["cost"] <= budget + 1e-9:
+            found.append(_point(front, _upgrade(front, choice, budget=budget)))
+    return max(found, key=lambda p: (p["bci"], -p["cost"])) if found else None
+
+
+def cheapest_for_target(front, target):
+    """Cheapest mix found reaching a BCI of `target`, as {"cost", "bci", "mci", "choice"}, None if none does.
+
+    The cheapest supported point reaching the target is repaired down to it, the previous one is upgraded to the
+    target and repaired down as well.
+    """
+    reaching = np.flatnonzero(front["bci"] >= target - 1e-12)
+    if not reaching.size:
+        return None
+    found = [_point(front, _downgrade(front, front_choice(front, reaching[0]), target=target))]
+    if reaching[0] > 0:
+        choice = _upgrade(front, front_choice(front, reaching[0] - 1), target=target)
+        if _point(front, choice)["bci"] >= target - 1e-12:
+            found.append(_point(front, _downgrade(front, choice, target=target)))
+    return min(found, key=lambda p: (p["cost"], -p["bci"]))
+
+
+def mix_table(front, point, names, mass, prices):
+    """Mass, strategy fractions and cost of every product of a mix found on `front`, as a list of dicts."""
+    mixes = front["options"][point["choice"]]
+    costs = mass * (prices * mixes).sum(axis=1)
+    return [
+        {"Product": name, "Mass": m, **{s: float(x) for s, x in zip(STRATEGIES, mix)}, "Cost": c}
+        for name, m, mix, c in zip(names, mass, mixes, costs)
+    ]
@@ -0,0 +1,79 @@
+#######################################################################################################################
+# Portfolio ranking of the buildings
+# Buildings are ranked by BCI, MCI, cost or disassembly potential from the per-building rollup of
+# building_aggregates.py, kept up to date by every product write. A ranking page reads the running sums of each building
+# whatever the number of products underneath, sorting, filtering and paging run in DuckDB as for the product grid.
+#
+# Costs price the strategy masses of each building at the catalog prices per strategy (optimizer.catalog_prices),
+# product-specific catalog prices are only used by the optimizer.
+#######################################################################################################################
+
+from building_aggregates import building_indicators_sql
+from building_scores import STRATEGIES
+
+SORT_COLUMNS = ["BCI", "MCI", "Cost", "Disassembly", "Mass", "Products", "Building"]
+PAGE_SIZE = 50
+
+
+def ranking_sql(efficiency=0.95, dis_pot=1.0, prices=None):
+    """Indicators and cost of every building, one row per building of the rollup."""
+    from optimizer import DEFAULT_PRICES
+
+    prices = {**DEFAULT_PRICES, **(prices or {})}
+    cost = " + ".join(f"a.{s.lower()}_mass * {float(prices[s])}" for s in STRATEGIES)
+    return f"""
+        SELECT s.*, {cost} AS "Cost"
+        FROM ({building_indicators_sql(efficiency, dis_pot)}) s
+        JOIN buildings b ON b.name = s."Building"
+        JOIN building_aggregates a USING (building_id)
+    """
+
+
+def _search_filter(search, column='"Building"'):
+    # case-insensitive match on the building name
+    if not search:
+        return "", []
+    return f"WHERE {column} ILIKE ?", [f"%{search}%"]
+
+
+def building_count(con, search=""):
+    where, params = _search_filter(search, "b.name")
+    return con.execute(
+        f"SELECT count(*) FROM building_aggregates JOIN buildings b USING (building_id) {where}", params
+    ).fetchone()[0]
+
+
+def ranking_page(con, sort="BCI", descending=True, search="", page=1, page_size=PAGE_SIZE, efficiency=0.95,
+                 dis_pot=1.0, prices=None):
+    """Page `page` (starting at 1) of the buildings sorted by `sort` as an Arrow table.
+
+    "Rank" is the position of the building in the whole portfolio, before the search filter.
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort buildings by {sort!r}")
+    order = "DESC" if descending else "ASC"
+    where, params = _search_filter(search)
+    return con.execute(
+        f"""
+        SELECT * FROM (
+            SELECT row_number() OVER (ORDER BY "{sort}" {order} NULLS LAST, "Building") AS "Rank", *
+            FROM ({ranking_sql(efficiency, dis_pot, prices)})
+        ) {where}
+        ORDER BY "Rank"
+        LIMIT ? OFFSET ?
+        """,
+        params + [int(page_size), (max(int(page), 1) - 1) * int(page_size)],
+    ).to_arrow_table()
+
+
+def summary(con, efficiency=0.95, dis_pot=1.0, prices=None):
+    """Buildings, products, mass, cost and mass-weighted MCI, disassembly potential and BCI of the portfolio."""
+    row = con.execute(
+        f"""
+        SELECT count(*), coalesce(sum("Products"), 0), coalesce(sum("Mass"), 0), coalesce(sum("Cost"), 0),
+               sum("Mass"*"MCI") / nullif(sum("Mass"), 0), sum("Mass"*"Disassembly") / nullif(sum("Mass"), 0),
+               sum("Mass"*"BCI") / nullif(sum("Mass"), 0)
+        FROM ({ranking_sql(efficiency, dis_pot, prices)})
+        """
+    ).fetchone()
+    return dict(zip(["buildings", "products", "mass", "cost", "MCI", "Disassembly", "BCI"], row))
@@ -0,0 +1,185 @@
+#######################################################################################################################
+# Paginated access to the r_strategies view, product upserts and deletions
+# The product grid and the pie chart selector only fetch the rows they display, sorting and filtering run in DuckDB
+# with LIMIT/OFFSET queries. Writes go to the normalized tables behind the view, see migrations.py.
+#######################################################################################################################
+
+import building_aggregates
+import change_feed
+from building_scores import STRATEGIES
+
+# row layout of the product input grid and of the write-behind queue
+PRODUCT_COLUMNS = ["Product"] + STRATEGIES + ["Building", "Mass"]
+SORT_COLUMNS = ["Product", "Building", "Mass"] + STRATEGIES
+PAGE_SIZES = [10, 25, 50, 100]
+
+
+def _search_filter(search):
+    # case-insensitive match on product or building name
+    if not search:
+        return "", []
+    return """WHERE "Product" ILIKE ? OR "Building" ILIKE ?""", [f"%{search}%"] * 2
+
+
+def product_count(con, search=""):
+    where, params = _search_filter(search)
+    return con.execute(f"SELECT count(*) FROM r_strategies {where}", params).fetchone()[0]
+
+
+def page_count(n_products, page_size):
+    return max(1, -(-n_products // page_size))
+
+
+def product_page(con, page=1, page_size=PAGE_SIZES[0], sort="Product", descending=False, search=""):
+    """Rows of page `page` (starting at 1) as an Arrow table, shown by the data grid without going through pandas."""
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort products by {sort!r}")
+    where, params = _search_filter(search)
+    order = "DESC" if descending else "ASC"
+    return con.execute(
+        f"""
+        SELECT * FROM r_strategies {where}
+        ORDER BY "{sort}" {order}, "Product"
+        LIMIT ? OFFSET ?
+        """,
+        params + [int(page_size), (max(int(page), 1) - 1) * int(page_size)],
+    ).to_arrow_table()
+
+
+def export_products(con, path, search="", batch_size=100_000):
+    """Write the products matching `search` to the Parquet file `path`, streamed in Arrow record batches."""
+    import pyarrow.parquet as pq
+
+    where, params = _search_filter(search)
+    query = f"""SELECT * FROM r_strategies {where} ORDER BY "Product" """
+    reader = con.execute(query, params).to_arrow_reader(batch_size)
+    rows = 0
+    with pq.ParquetWriter(path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def product_names(con, search="", limit=100):
+    """First `limit` product names matching `search`, used as choices of the pie chart selector."""
+    where, params = _search_filter(search)
+    rows = con.execute(f"""SELECT "Product" FROM r_strategies {where} ORDER BY "Product" LIMIT ?""", params + [limit])
+    return [row[0] for row in rows.fetchall()]
+
+
+def product_strategies(con, product):
+    """Strategy fractions of one product, {strategy: fraction} or None if the product is not stored."""
+    columns = ", ".join(f'"{s}"' for s in STRATEGIES)
+    row = con.execute(f"""SELECT {columns} FROM r_strategies WHERE "Product" = ? LIMIT 1""", [product]).fetchone()
+    return None if row is None else dict(zip(STRATEGIES, row))
+
+
+#%% Writes, run them inside a transaction (BuildingDatabase.write())
+def upsert_products(con, source, assessments=True):
+    """Insert or update the products of `source`, a table or subquery in the r_strategies layout keyed on "Product".
+
+    Product names must be unique in `source`. A NULL "Disassembly" keeps the stored DDF assessment, with
+    assessments=False the column is not read at all. The building aggregates and the change log are updated in the
+    same transaction.
+    """
+    # conflicts are resolved through the unique indexes on the names, without scanning the tables
+    building = """coalesce(s."Building", 'Building 1')"""
+    con.execute(
+        f"INSERT INTO buildings (name) SELECT DISTINCT {building} FROM {source} s ON CONFLICT (name) DO NOTHING"
+    )
+    touched = f'SELECT p.product_id FROM {source} s JOIN products p ON p.name = s."Product"'
+    with building_aggregates.updating(con, touched):
+        change_feed.record(
+            con,
+            f"""
+            SELECT CASE WHEN p.product_id IS NULL THEN 'insert' ELSE 'update' END AS op, s."Product" AS product
+            FROM {source} s LEFT JOIN products p ON p.name = s."Product"
+            """,
+        )
+        con.execute(
+            f"""
+            INSERT INTO products (name, building_id, virgin, reused, recycled, repurposed)
+            SELECT s."Product", b.building_id, s."Virgin", s."Reused", s."Recycled", s."Repurposed"
+            FROM {source} s JOIN buildings b ON b.name = {building}
+            ON CONFLICT (name) DO UPDATE
+            SET building_id = excluded.building_id, virgin = excluded.virgin, reused = excluded.reused,
+                recycled = excluded.recycled, repurposed = excluded.repurposed
+            """
+        )
+        con.execute(
+            f"""
+            INSERT INTO material_flows (product_id, mass)
+            SELECT p.product_id, coalesce(s."Mass", 1.0) FROM {source} s JOIN products p ON p.name = s."Product"
+            ON CONFLICT (product_id) DO UPDATE SET mass = excluded.mass
+            """
+        )
+        if assessments:
+            con.execute(
+                f"""
+                INSERT INTO ddf_assessments (product_id, score)
+                SELECT p.product_id, s."Disassembly" FROM {source} s JOIN products p ON p.name = s."Product"
+                WHERE s."Disassembly" IS NOT NULL
+                ON CONFLICT (product_id) DO UPDATE SET score = excluded.score
+                """
+            )
+
+
+def upsert_rows(con, rows):
+    """Upsert rows given as sequences in PRODUCT_COLUMNS order, the last row of a product wins."""
+    rows = list({row[0]: row for row in rows}.values())
+    columns = ", ".join(f'"{c}"' for c in PRODUCT_COLUMNS)
+    placeholders = "(" + ", ".join("?" for _ in PRODUCT_COLUMNS) + ")"
+    # one multi-row statement, an order of magnitude faster than executemany in DuckDB
+    con.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE upserted_products AS
+        SELECT * FROM (VALUES {", ".join([placeholders]*len(rows))}) t({columns})
+        """,
+        [v for row in rows for v in row],
+    )
+    upsert_products(con, "upserted_products", assessments=False)
+    con.execute("DROP TABLE upserted_products")
+
+
+def insert_rows(con, rows):
+    """Insert new products given as sequences in PRODUCT_COLUMNS order, as the write-behind queue does.
+
+    Names already stored, or given twice, are rejected rather than overwriting a product. Returns {index in rows:
+    reason} of the rejected rows, the other rows are inserted.
+    """
+    rejected, seen = {}, set()
+    for i, row in enumerate(rows):
+        if row[0] in seen:
+            rejected[i] = f"{row[0]!r} was submitted twice"
+        seen.add(row[0])
+    names = [row[0] for row in rows]
+    stored = {r[0] for r in con.execute("SELECT name FROM products WHERE name IN ?", [names]).fetchall()}
+    for i, row in enumerate(rows):
+        if row[0] in stored:
+            rejected[i] = f"A product named {row[0]!r} already exists"
+    new = [row for i, row in enumerate(rows) if i not in rejected]
+    if new:
+        upsert_rows(con, new)
+    return rejected
+
+
+def delete_products(con, where="", params=()):
+    """Delete the products of the r_strategies rows matching the SQL condition `where`, returns their number."""
+    con.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE deleted_products AS
+        SELECT product_id FROM products
+        WHERE name IN (SELECT "Product" FROM r_strategies {f"WHERE {where}" if where else ""})
+        """,
+        list(params),
+    )
+    with building_aggregates.updating(con, "SELECT product_id FROM deleted_products", deleting=True):
+        change_feed.record(
+            con, "SELECT 'delete' AS op, name AS product FROM products JOIN deleted_products USING (product_id)"
+        )
+        for table in ["material_flows", "ddf_assessments", "products"]:
+            con.execute(f"DELETE FROM {table} WHERE product_id IN (SELECT product_id FROM deleted_products)")
+    n = con.execute("SELECT count(*) FROM deleted_products").fetchone()[0]
+    con.execute("DROP TABLE deleted_products")
+    return n
@@ -0,0 +1,248 @@
+#######################################################################################################################
+# Opt-in profiling of the reactive graph and of the database queries
+# With BCI_PROFILE=1, instrument(globals()) at the end of BCI_app.py times every reactive calc, effect and render
+# function of the session, and counts their invalidations and, for calcs, how many dependents each invalidation
+# reaches (fan-out). Database cursors time every query, named after the function running it. Statistics are shared
+# by the sessions of the worker and shown on the diagnostics panel (app URL with ?diagnostics), which exports them in
+# the Prometheus text format and as a Chrome trace (flame chart in Perfetto, speedscope or chrome://tracing).
+#
+# BCI_PROFILE_EVENTS bounds the number of trace events kept (100000 by default). When BCI_PROFILE_DIR is set, both
+# exports are written there at exit. Instrumentation hooks into shiny internals (Calc_._fn, Effect_._fn,
+# Renderer.render, the Dependents of calcs), written against shiny 1.8: objects whose internals are missing or not
+# coroutine functions are left alone with a warning, the app then runs unprofiled rather than failing.
+#######################################################################################################################
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import warnings
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+ENABLED = os.environ.get("BCI_PROFILE", "").lower() in ("1", "true", "yes")
+MAX_EVENTS = int(os.environ.get("BCI_PROFILE_EVENTS", 100_000))
+
+# statistics of each (kind, name)
+FIELDS = ["calls", "seconds", "max_seconds", "invalidations", "fanout"]
+
+
+class Profiler:
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self._stats = {}
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def _entry(self, kind, name):
+        key = (kind, name)
+        if key not in self._stats:
+            self._stats[key] = dict.fromkeys(FIELDS, 0)
+        return self._stats[key]
+
+    def record(self, kind, name, start, seconds):
+        with self._lock:
+            entry = self._entry(kind, name)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            self._events.append((kind, name, start, seconds, threading.get_ident()))
+
+    def invalidated(self, kind, name, fanout=0):
+        with self._lock:
+            entry = self._entry(kind, name)
+            entry["invalidations"] += 1
+            entry["fanout"] += fanout
+
+    def stats(self):
+        """One dict per (kind, name), the most expensive first."""
+        with self._lock:
+            rows = [{"kind": kind, "name": name, **entry} for (kind, name), entry in self._stats.items()]
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._events.clear()
+
+    #%% Exports
+    def prometheus_text(self):
+        """Statistics in the Prometheus text exposition format."""
+        metrics = [
+            ("calls", "counter", "Number of executions"),
+            ("seconds", "counter", "Total wall time of the executions in seconds"),
+            ("max_seconds", "gauge", "Longest execution in seconds"),
+            ("invalidations", "counter", "Number of invalidations"),
+            ("fanout", "counter", "Dependents invalidated by the invalidations"),
+        ]
+        rows = self.stats()
+        lines = []
+        for field, kind, description in metrics:
+            metric = f"bci_profile_{field}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {metric} {description}.")
+            lines.append(f"# TYPE {metric} {kind}")
+            for row in rows:
+                lines.append(f'{metric}{{kind="{_label(row["kind"])}",name="{_label(row["name"])}"}} {row[field]}')
+        return "\n".join(lines) + "\n"
+
+    def chrome_trace(self):
+        """Recorded executions in the Chrome trace event format, nested calls stack up in flame charts."""
+        with self._lock:
+            events = list(self._events)
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {"name": name, "cat": kind, "ph": "X", "pid": pid, "tid": tid,
+                 "ts": (start - self._origin) * 1e6, "dur": seconds * 1e6}
+                for kind, name, start, seconds, tid in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self, directory):
+        """Write both exports to `directory`, named after the process id."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"bci-{os.getpid()}"
+        (directory / f"{stem}.prom").write_text(self.prometheus_text())
+        (directory / f"{stem}.trace.json").write_text(json.dumps(self.chrome_trace()))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+PROFILER = Profiler()
+
+
+@contextmanager
+def timed(kind, name, profiler=PROFILER):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(kind, name, start, time.perf_counter() - start)
+
+
+#%% Reactive graph
+def _timed_async(fn, kind, name, profiler, count_invalidations):
+    from shiny import reactive
+
+    async def wrapper():
+        if count_invalidations:
+            reactive.get_current_context().on_invalidate(lambda: profiler.invalidated(kind, name))
+        with timed(kind, name, profiler):
+            return await fn()
+
+    return wrapper
+
+
+def _count_fanout(dependents, name, profiler):
+    # called when the calc invalidates, before its dependents unregister
+    invalidate = dependents.invalidate
+
+    def wrapper():
+        profiler.invalidated("calc", name, len(dependents._dependents))
+        invalidate()
+
+    dependents.invalidate = wrapper
+
+
+def _patchable(obj, attribute):
+    # the private coroutine function instrument() replaces, checked so that another shiny version falls back cleanly
+    import inspect
+
+    return inspect.iscoroutinefunction(getattr(obj, attribute, None))
+
+
+def instrument(namespace, profiler=PROFILER):
+    """Time the reactive calcs, effects and render functions found in `namespace`, returns how many were wrapped."""
+    try:
+        from shiny.reactive._reactives import Calc_, Effect_
+        from shiny.render.renderer import Renderer
+    except ImportError:
+        warnings.warn("BCI_PROFILE: unknown shiny internals, reactive functions are not timed", stacklevel=2)
+        return 0
+
+    wrapped, skipped = 0, []
+    for name, obj in list(namespace.items()):
+        if getattr(obj, "_bci_profiled", False):
+            continue
+        if isinstance(obj, Calc_):
+            dependents = getattr(obj, "_dependents", None)
+            fanout = hasattr(dependents, "invalidate") and hasattr(dependents, "_dependents")
+            if not (_patchable(obj, "_fn") and fanout):
+                skipped.append(name)
+                continue
+            obj._fn = _timed_async(obj._fn, "calc", name, profiler, count_invalidations=False)
+            _count_fanout(dependents, name, profiler)
+        elif isinstance(obj, Effect_):
+            if not _patchable(obj, "_fn"):
+                skipped.append(name)
+                continue
+            obj._fn = _timed_async(obj._fn, "effect", name, profiler, count_invalidations=True)
+        elif isinstance(obj, Renderer):
+            if not _patchable(obj, "render"):
+                skipped.append(name)
+                continue
+            obj.render = _timed_async(obj.render, "render", name, profiler, count_invalidations=True)
+        else:
+            continue
+        obj._bci_profiled = True
+        wrapped += 1
+    if skipped:
+        warnings.warn(f"BCI_PROFILE: unknown shiny internals, {', '.join(skipped)} not timed", stacklevel=2)
+    return wrapped
+
+
+#%% Database queries
+class ProfiledCursor:
+    """DuckDB cursor timing execute() and executemany(), other attributes are passed through.
+
+    execute() runs the query, fetching a materialized result afterwards is cheap. Relations of sql() or table() only
+    run when fetched and are not timed, the app queries through execute().
+    """
+
+    def __init__(self, cursor, profiler=PROFILER):
+        self._cursor = cursor
+        self._profiler = profiler
+
+    def _timed(self, method, args, kwargs):
+        caller = sys._getframe(2)
+        name = f"{caller.f_globals.get('__name__', '?')}.{caller.f_code.co_name}"
+        with timed("query", name, self._profiler):
+            return getattr(self._cursor, method)(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._timed("execute", args, kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._timed("executemany", args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def profile_cursor(cursor):
+    return ProfiledCursor(cursor) if ENABLED else cursor
+
+
+#%% Exports at exit
+_write_registered = False
+
+
+def write_at_shutdown(app):
+    """Also write the exports when the shiny `app` shuts down, uvicorn stopped by SIGTERM skips atexit handlers."""
+    global _write_registered
+    if app is None or _write_registered or not os.environ.get("BCI_PROFILE_DIR"):
+        return
+    _write_registered = True
+    app.on_shutdown(lambda: PROFILER.write(os.environ["BCI_PROFILE_DIR"]))
+
+
+if ENABLED and os.environ.get("BCI_PROFILE_DIR"):
+    atexit.register(lambda: PROFILER.write(os.environ["BCI_PROFILE_DIR"]))
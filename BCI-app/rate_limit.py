@@ -0,0 +1,112 @@
+#######################################################################################################################
+# Coalesced recomputation of slider drags
+# A drag sends a burst of slider values, coalesce() hands downstream calcs a single settled value per burst: with the
+# "debounce" policy once the slider has been still for `delay` seconds, with "throttle" at most once every `delay`
+# seconds. distinct() stops the invalidation of outputs whose value did not change. Both count what they save in
+# STATS, shared by the sessions of the worker.
+#
+# BCI_SLIDER_DELAY sets the delay in seconds (0.25 by default, 0 disables coalescing), BCI_SLIDER_POLICY the policy.
+#######################################################################################################################
+
+import os
+import threading
+import time
+
+from shiny import reactive
+
+DELAY = float(os.environ.get("BCI_SLIDER_DELAY", 0.25))
+POLICY = os.environ.get("BCI_SLIDER_POLICY", "debounce").lower()
+POLICIES = ["debounce", "throttle"]
+
+
+class RecomputeStats:
+
+    def __init__(self):
+        self.changes = 0  # values received from the inputs
+        self.recomputes = 0  # settled values handed downstream
+        self.unchanged = 0  # recomputed values equal to the previous one, dependents not invalidated
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "changes": self.changes,
+                "recomputes": self.recomputes,
+                "saved": max(self.changes - self.recomputes, 0),
+                "unchanged": self.unchanged,
+            }
+
+
+STATS = RecomputeStats()
+
+
+def _settle(target, value, stats):
+    # reactive values compare by identity, equal results would still invalidate their dependents
+    with reactive.isolate():
+        if target.is_set() and target() == value:
+            stats.count("unchanged")
+            return False
+    target.set(value)
+    return True
+
+
+def distinct(source, stats=STATS):
+    """Reactive value following the calc `source`, its dependents only re-run when the value changes."""
+    value = reactive.value()
+
+    @reactive.effect(priority=1)
+    def _():
+        _settle(value, source(), stats)
+
+    return value
+
+
+def coalesce(source, delay=DELAY, policy=POLICY, stats=STATS):
+    """Reactive value following the calc `source`, one settled value per burst of changes.
+
+    The first value goes through at once. Call it inside a session, the timers belong to the current session.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy!r}, expected one of {', '.join(POLICIES)}")
+    if delay <= 0:
+        return distinct(source, stats)
+
+    settled = reactive.value()
+    deadline = reactive.value(None)
+    state = {"pending": None, "last_emit": None}
+
+    @reactive.effect(priority=2)
+    def _watch():
+        state["pending"] = source()
+        stats.count("changes")
+        now = time.monotonic()
+        with reactive.isolate():
+            scheduled = deadline()
+        if state["last_emit"] is None:
+            due = now
+        elif policy == "throttle":
+            due = scheduled if scheduled is not None else max(now, state["last_emit"] + delay)
+        else:
+            due = now + delay
+        deadline.set(due)
+
+    @reactive.effect(priority=1)
+    def _emit():
+        due = deadline()
+        if due is None:
+            return
+        remaining = due - time.monotonic()
+        if remaining > 0:
+            reactive.invalidate_later(remaining)
+            return
+        with reactive.isolate():
+            deadline.set(None)
+        state["last_emit"] = time.monotonic()
+        stats.count("recomputes")
+        _settle(settled, state["pending"], stats)
+
+    return settled
@@ -1,25 +1,34 @@
 # python snippet that will remove all products with only zero entries in the table r_strategies
 
-import duckdb
 from pathlib import Path
 
+from database import BuildingDatabase
+from migrations import migrate
+from products import delete_products
+
 # Defining project paths
 
 app_dir = Path(__file__).parent
 data_dir = app_dir / "data"
 
-# replace path to building_data.db as needed. Connection to db from other users must be closed
-con = duckdb.connect(data_dir / "building_data.db")
-
-# query to fetch and display the products with only zero entries
-query = f"""SELECT * FROM r_strategies WHERE "Virgin"=0 and "Reused"=0 and "Recycled"=0 and "Repurposed"=0"""
-result = con.execute(query).fetchall()
-print("Products with only zero entries")
-print(result)
-
-# query to remove the products with only zero entries
-remove = f"""DELETE FROM r_strategies WHERE "Virgin"=0 and "Reused"=0 and "Recycled"=0 and "Repurposed"=0"""
-con.execute(remove)
-result = con.execute(query).fetchall()
-print("Products with only zero entries after removal")
-print(result)  # should show an empty list
+# replace path to building_data.db as needed. The app must either be stopped or served in read-only mode
+# (BCI_READ_ONLY=1), in which case the write lock is retried for up to 30 s between dashboard requests
+db = BuildingDatabase(data_dir / "building_data.db", lock_timeout=30)
+
+with db.write() as con:
+    migrate(con)
+
+    # query to fetch and display the products with only zero entries
+    zero_entries = """"Virgin"=0 and "Reused"=0 and "Recycled"=0 and "Repurposed"=0"""
+    query = f"""SELECT * FROM r_strategies WHERE {zero_entries}"""
+    result = con.execute(query).fetchall()
+    print("Products with only zero entries")
+    print(result)
+
+    # remove the products with only zero entries from the product tables behind r_strategies
+    delete_products(con, zero_entries)
+    result = con.execute(query).fetchall()
+    print("Products with only zero entries after removal")
+    print(result)  # should show an empty list
+
+db.close()
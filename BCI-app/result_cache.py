@@ -0,0 +1,68 @@
+#######################################################################################################################
+# Process-wide cache of MCI, DDF and BCI results
+# Results are keyed by a normalized tuple of the slider values and utility flags and shared across sessions, so popular
+# scenarios (default reset, common presets) are served without recomputation. Least recently used entries are evicted
+# once the cache holds `maxsize` results (BCI_CACHE_SIZE, 4096 by default).
+#######################################################################################################################
+
+import os
+import threading
+from collections import OrderedDict
+
+SLIDERS = ["M", "F_R", "F_U", "C_R", "C_U", "E", "L", "U"]
+
+
+def normalize(value):
+    # sliders may send 95 or 95.0 for the same position
+    return round(float(value), 6)
+
+
+def scenario_key(sliders, utility):
+    """Key of a slider state, `sliders` maps the SLIDERS ids to their values and `utility` lists the checked flags."""
+    return tuple(normalize(sliders[s]) for s in SLIDERS) + (tuple(sorted(utility)),)
+
+
+class ResultCache:
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+            self.misses += 1
+        # computed outside the lock, two sessions missing on the same key just store the same value twice
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._results),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+RESULTS = ResultCache(int(os.environ.get("BCI_CACHE_SIZE", 4096)))
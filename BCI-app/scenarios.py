@@ -0,0 +1,197 @@
+#######################################################################################################################
+# Named what-if scenarios of a building, stored as diffs from its inventory
+# A scenario only keeps the products it changes in scenario_changes: one row per product, NULL columns keep the value
+# of the base inventory (r_strategies), removed=true drops the product and products missing from the base are
+# additions. save() computes the diff of an edited copy of the inventory, so a scenario costs as many rows as products
+# it changes. Scenarios are never copied out: materialize_sql() overlays the changes on the base inside the query
+# that scores them, and compare() scores the base and any number of scenarios of a building in one pass.
+#
+# Scenarios also keep the slider settings they were saved with (JSON), restored when a scenario is loaded.
+#
+# usage: python scenarios.py "Building 1" [--db data/building_data.db] [--efficiency 0.95]
+#######################################################################################################################
+
+import json
+
+from building_scores import STRATEGIES, building_scores_sql
+
+BASE = "Base inventory"
+# scenario_changes column of each r_strategies column
+CHANGE_COLUMNS = {
+    "Virgin": "virgin",
+    "Reused": "reused",
+    "Recycled": "recycled",
+    "Repurposed": "repurposed",
+    "Mass": "mass",
+    "Disassembly": "disassembly",
+}
+# values of the columns of added products left empty
+ADDED_DEFAULTS = {"Virgin": 0.0, "Reused": 0.0, "Recycled": 0.0, "Repurposed": 0.0, "Mass": 1.0}
+
+
+def _scenario_id(con, building, name):
+    row = con.execute(
+        "SELECT s.scenario_id FROM scenarios s JOIN buildings b USING (building_id) WHERE b.name = ? AND s.name = ?",
+        [building, name],
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"No scenario {name!r} for {building!r}")
+    return row[0]
+
+
+#%% Saving and reading scenarios
+def save(con, building, name, inventory, description="", settings=None):
+    """Store the differences of `inventory` from the products of `building` as the scenario `name`.
+
+    `inventory` is a table or subquery in the r_strategies layout holding the whole edited inventory of the building,
+    its "Building" column is ignored. An existing scenario of that name is replaced. Returns the number of changes.
+    """
+    if name == BASE:
+        raise ValueError(f"{BASE!r} is the name of the inventory itself")
+    building_id = con.execute("SELECT building_id FROM buildings WHERE name = ?", [building]).fetchone()
+    if building_id is None:
+        raise KeyError(f"No building {building!r}")
+    con.execute("DELETE FROM scenario_changes WHERE scenario_id IN "
+                "(SELECT scenario_id FROM scenarios WHERE building_id = ? AND name = ?)", [building_id[0], name])
+    con.execute("DELETE FROM scenarios WHERE building_id = ? AND name = ?", [building_id[0], name])
+    scenario_id = con.execute(
+        "INSERT INTO scenarios (building_id, name, description, settings) VALUES (?, ?, ?, ?) RETURNING scenario_id",
+        [building_id[0], name, description, json.dumps(settings) if settings is not None else None],
+    ).fetchone()[0]
+
+    # changed columns only, NULL where the edited value equals the base one
+    changed = ", ".join(
+        f'CASE WHEN b."Product" IS NULL OR e."{c}" IS DISTINCT FROM b."{c}" THEN e."{c}" END AS {column}'
+        for c, column in CHANGE_COLUMNS.items()
+    )
+    differs = " OR ".join(f'e."{c}" IS DISTINCT FROM b."{c}"' for c in CHANGE_COLUMNS)
+    # values edited in a data grid may come back as text
+    edited = ", ".join(f'CAST("{c}" AS DOUBLE) AS "{c}"' for c in CHANGE_COLUMNS)
+    con.execute(
+        f"""
+        INSERT INTO scenario_changes BY NAME
+        SELECT ? AS scenario_id, coalesce(e."Product", b."Product") AS product, {changed},
+               e."Product" IS NULL AS removed
+        FROM (SELECT "Product", {edited} FROM {inventory} WHERE "Product" IS NOT NULL) e
+        FULL JOIN (SELECT * FROM r_strategies WHERE "Building" = ?) b ON b."Product" = e."Product"
+        WHERE e."Product" IS NULL OR b."Product" IS NULL OR {differs}
+        """,
+        [scenario_id, building],
+    )
+    return con.execute("SELECT count(*) FROM scenario_changes WHERE scenario_id = ?", [scenario_id]).fetchone()[0]
+
+
+def delete(con, building, name):
+    scenario_id = _scenario_id(con, building, name)
+    con.execute("DELETE FROM scenario_changes WHERE scenario_id = ?", [scenario_id])
+    con.execute("DELETE FROM scenarios WHERE scenario_id = ?", [scenario_id])
+
+
+def scenario_names(con, building):
+    rows = con.execute(
+        "SELECT s.name FROM scenarios s JOIN buildings b USING (building_id) WHERE b.name = ? ORDER BY s.name",
+        [building],
+    )
+    return [row[0] for row in rows.fetchall()]
+
+
+def settings(con, building, name):
+    """Slider settings the scenario was saved with, None if there are none."""
+    row = con.execute("SELECT settings FROM scenarios WHERE scenario_id = ?", [_scenario_id(con, building, name)])
+    value = row.fetchone()[0]
+    return json.loads(value) if value is not None else None
+
+
+def changes(con, building, name):
+    """Stored changes of a scenario as a DuckDB relation, call .to_arrow_table() or .fetchall() on it."""
+    columns = ", ".join(f'{column} AS "{c}"' for c, column in CHANGE_COLUMNS.items())
+    return con.execute(
+        f"""SELECT product AS "Product", {columns}, removed AS "Removed" FROM scenario_changes
+            WHERE scenario_id = ? ORDER BY product""",
+        [_scenario_id(con, building, name)],
+    )
+
+
+#%% Lazy materialization
+def materialize_sql(building, names):
+    """SQL and parameters of the products of the scenarios `names` of `building`, with a "Scenario" column.
+
+    The changes are overlaid on the base inventory inside the query, nothing is copied. BASE in `names` stands for the
+    inventory itself.
+    """
+    names = list(names)
+    values = {
+        c: f'coalesce(c.{column}, o."{c}"' + (f", {ADDED_DEFAULTS[c]})" if c in ADDED_DEFAULTS else ")") + f' AS "{c}"'
+        for c, column in CHANGE_COLUMNS.items()
+    }
+    # columns in the r_strategies order
+    values = ", ".join([*(values[c] for c in STRATEGIES), '? AS "Building"', values["Mass"], values["Disassembly"]])
+    placeholders = ", ".join("?" for _ in names) or "NULL"
+    query = f"""
+        WITH base AS (
+            SELECT * FROM r_strategies WHERE "Building" = ?
+        ), selected AS (
+            SELECT s.scenario_id, s.name FROM scenarios s JOIN buildings bu USING (building_id)
+            WHERE bu.name = ? AND s.name IN ({placeholders})
+        )
+        SELECT coalesce(o.name, added.name) AS "Scenario", coalesce(c.product, o."Product") AS "Product", {values}
+        FROM (SELECT sel.scenario_id, sel.name, b.* FROM selected sel CROSS JOIN base b) o
+        FULL JOIN (SELECT * FROM scenario_changes WHERE scenario_id IN (SELECT scenario_id FROM selected)) c
+            ON c.scenario_id = o.scenario_id AND c.product = o."Product"
+        LEFT JOIN selected added ON added.scenario_id = c.scenario_id
+        WHERE NOT coalesce(c.removed, false)
+    """
+    params = [building, building, *names, building]
+    if BASE in names:
+        query += f"""
+        UNION ALL BY NAME
+        SELECT '{BASE}' AS "Scenario", * FROM base
+        """
+    return query, params
+
+
+#%% Comparison
+def compare(con, building, names=None, efficiency=0.95, dis_pot=1.0):
+    """Scores of the base inventory of `building` and of its scenarios `names` (all by default), base first.
+
+    One query scores them all, changes are relative to the base. Call .to_arrow_table() or .fetchall() on the result.
+    """
+    names = scenario_names(con, building) if names is None else names
+    query, params = materialize_sql(building, [BASE, *(n for n in names if n != BASE)])
+    scores = building_scores_sql(f'(SELECT * REPLACE ("Scenario" AS "Building") FROM ({query}))', efficiency, dis_pot)
+    return con.execute(
+        f"""
+        SELECT "Building" AS "Scenario", * EXCLUDE ("Building"),
+               "MCI" - max("MCI") FILTER (WHERE "Building" = '{BASE}') OVER () AS "MCI change",
+               "BCI" - max("BCI") FILTER (WHERE "Building" = '{BASE}') OVER () AS "BCI change"
+        FROM ({scores})
+        ORDER BY "Building" <> '{BASE}', "Building"
+        """,
+        params,
+    )
+
+
+#%% Command line interface
+def main(argv=None):
+    import argparse
+    from pathlib import Path
+
+    from database import BuildingDatabase, default_db_path
+
+    parser = argparse.ArgumentParser(description="Compare the scenarios of a building.")
+    parser.add_argument("building", help="building name")
+    parser.add_argument("--db", type=Path, default=default_db_path, help="building database file")
+    parser.add_argument("--efficiency", type=float, default=0.95, help="recycling efficiency")
+    parser.add_argument("--dis-pot", type=float, default=1.0, help="disassembly potential of unassessed products")
+    args = parser.parse_args(argv)
+
+    db = BuildingDatabase(args.db, read_only=True, lock_timeout=30)
+    with db.cursor() as con:
+        rows = compare(con, args.building, efficiency=args.efficiency, dis_pot=args.dis_pot).fetchall()
+    print(f"{'Scenario':30} {'Products':>9} {'Mass':>12} {'MCI':>7} {'BCI':>7} {'dMCI':>7} {'dBCI':>7}")
+    for name, n, mass, mci, _, bci, d_mci, d_bci in rows:
+        print(f"{name[:30]:30} {n:9d} {mass:12.1f} {mci:7.1%} {bci:7.1%} {d_mci:+7.1%} {d_bci:+7.1%}")
+
+
+if __name__ == "__main__":
+    main()
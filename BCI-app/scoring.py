@@ -0,0 +1,225 @@
+#######################################################################################################################
+# Headless batch scoring of building portfolios
+# Buildings are read from a building database, CSV or Parquet files (r_strategies layout, see data/R_strategies.csv),
+# snapshotted into one Parquet file sorted by building and split into chunks of consecutive buildings. A process pool
+# scores the chunks with building_scores_sql, the mass-weighted building scores that the app reads from its running
+# sums (building_aggregates.py), and every chunk is written as its own Parquet part file. Databases that were never
+# migrated are read as they are, the building columns of version 2 taking their defaults.
+#
+# The part files are the checkpoints: an interrupted run started again with the same output directory only scores the
+# missing chunks. The snapshot is removed once every part is written, so parts deleted from a finished run cannot be
+# scored again, score into a fresh output directory instead. Read the results with
+# read_parquet('<output>/part-*.parquet').
+#
+# usage: python bci.py score data/building_data.db [more.parquet ...] --output scores [--workers 8]
+#######################################################################################################################
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import duckdb
+
+from building_scores import building_scores_sql
+
+MANIFEST = "manifest.json"
+SNAPSHOT = "_input.parquet"
+PARAMETERS = ["sources", "efficiency", "dis_pot", "chunk_size"]
+DB_SUFFIXES = [".db", ".duckdb"]
+R_STRATEGIES_COLUMNS = ["Product", "Virgin", "Reused", "Recycled", "Repurposed", "Building", "Mass", "Disassembly"]
+
+
+def _quote(path):
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+#%% Input snapshot and chunks
+def _legacy_columns(db):
+    # r_strategies columns of a database, the building columns missing before version 2 are NULL (see below)
+    from migrations import BUILDING_COLUMNS
+
+    rows = db.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'r_strategies'")
+    existing = {row[0] for row in rows.fetchall()}
+    return [f'"{c}"' if c in existing else f'CAST(NULL AS {BUILDING_COLUMNS[c].split()[0]}) AS "{c}"'
+            for c in R_STRATEGIES_COLUMNS]
+
+
+def snapshot(sources, path, lock_timeout=30.0):
+    """Copy the products of `sources` into the Parquet file `path`, sorted by building, returns the product count."""
+    from database import connect
+    from ingest import columns_sql, source_sql
+
+    tmp = Path(f"{path}.tmp")
+    con = duckdb.connect()
+    try:
+        selects, params = [], []
+        for source in map(Path, sources):
+            if source.suffix.lower() in DB_SUFFIXES:
+                # copied through a connection of its own, retried while the app holds the write lock
+                db = connect(source, read_only=True, lock_timeout=lock_timeout)
+                try:
+                    part = f"{path}.{len(selects)}.tmp"
+                    columns = ", ".join(_legacy_columns(db))
+                    db.execute(f"COPY (SELECT {columns} FROM r_strategies) TO {_quote(part)} (FORMAT parquet)")
+                finally:
+                    db.close()
+                selects.append(f"SELECT * FROM read_parquet({_quote(part)})")
+            else:
+                selects.append(f"SELECT {columns_sql(con, source)} FROM ({source_sql(source)})")
+                params.append(str(source))
+        con.execute(
+            f"""
+            COPY (
+                SELECT * REPLACE (coalesce("Building", 'Building 1') AS "Building", coalesce("Mass", 1.0) AS "Mass")
+                FROM ({" UNION ALL BY NAME ".join(selects)})
+                ORDER BY "Building", "Product"
+            )
+            TO {_quote(tmp)} (FORMAT parquet)
+            """,
+            params,
+        )
+        os.replace(tmp, path)
+        return con.execute(f"SELECT count(*) FROM read_parquet({_quote(path)})").fetchone()[0]
+    finally:
+        con.close()
+        for part in Path(path).parent.glob(f"{Path(path).name}.*.tmp"):
+            part.unlink()
+
+
+def chunks(path, chunk_size=200):
+    """(first, last, buildings) ranges of `chunk_size` consecutive buildings of the snapshot."""
+    with duckdb.connect() as con:
+        rows = con.execute(
+            f"""
+            SELECT min(b), max(b), count(*) FROM (
+                SELECT b, (row_number() OVER (ORDER BY b) - 1) // {int(chunk_size)} AS chunk
+                FROM (SELECT DISTINCT "Building" AS b FROM read_parquet({_quote(path)}))
+            ) GROUP BY chunk ORDER BY chunk
+            """
+        ).fetchall()
+    return [list(row) for row in rows]
+
+
+#%% Chunk scoring, run in the worker processes
+def part_path(output, index):
+    return Path(output) / f"part-{index:05d}.parquet"
+
+
+def score_chunk(task):
+    """Score the buildings of one chunk into its part file, returns (index, buildings, seconds)."""
+    index, output, (first, last, n), efficiency, dis_pot = task
+    start = time.perf_counter()
+    path = part_path(output, index)
+    tmp = path.with_suffix(".tmp")
+    # the snapshot is sorted by building, DuckDB only reads the row groups holding the range
+    source = (f"""(SELECT * FROM read_parquet({_quote(Path(output) / SNAPSHOT)}) """
+              f"""WHERE "Building" BETWEEN {_quote(first)} AND {_quote(last)})""")
+    with duckdb.connect(config={"threads": 1}) as con:
+        con.execute(f"COPY ({building_scores_sql(source, efficiency, dis_pot)}) TO {_quote(tmp)} (FORMAT parquet)")
+    os.replace(tmp, path)
+    return index, n, time.perf_counter() - start
+
+
+#%% Portfolio scoring
+def score(sources, output, efficiency=0.95, dis_pot=1.0, workers=None, chunk_size=200, progress=None):
+    """Score every building of `sources` into Parquet part files in the directory `output`.
+
+    Runs interrupted in `output` are resumed, the snapshot and chunks of the first run are kept. A finished run has no
+    snapshot left, parts missing from it raise a ValueError. `progress` is called with (buildings scored, total
+    buildings) after every chunk. Returns a summary of the run.
+    """
+    start = time.perf_counter()
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    parameters = {"sources": [str(s) for s in sources], "efficiency": float(efficiency), "dis_pot": float(dis_pot),
+                  "chunk_size": int(chunk_size)}
+
+    manifest_path = output / MANIFEST
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        changed = [p for p in PARAMETERS if manifest[p] != parameters[p]]
+        if changed:
+            raise ValueError(f"{output} holds a run with other {', '.join(changed)}, use another output directory")
+    else:
+        products = snapshot(sources, output / SNAPSHOT)
+        manifest = {**parameters, "products": products, "chunks": chunks(output / SNAPSHOT, chunk_size)}
+        manifest_path.write_text(json.dumps(manifest, indent=1))
+
+    total = sum(n for _, _, n in manifest["chunks"])
+    pending = [i for i in range(len(manifest["chunks"])) if not part_path(output, i).exists()]
+    if pending and not (output / SNAPSHOT).exists():
+        raise ValueError(f"{output} holds a finished run missing {len(pending)} part file(s), its input snapshot is "
+                         "gone, score into a fresh output directory")
+    done = total - sum(manifest["chunks"][i][2] for i in pending)
+    resumed = done
+    tasks = [(i, output, manifest["chunks"][i], efficiency, dis_pot) for i in pending]
+    if progress:
+        progress(done, total)
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    if workers == 1:
+        results = map(score_chunk, tasks)
+        pool = None
+    else:
+        import multiprocessing
+
+        # spawned rather than forked, DuckDB connections do not survive a fork
+        pool = multiprocessing.get_context("spawn").Pool(workers)
+        results = pool.imap_unordered(score_chunk, tasks)
+    try:
+        for _, n, _ in results:
+            done += n
+            if progress:
+                progress(done, total)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    # the snapshot is only needed to resume
+    (output / SNAPSHOT).unlink(missing_ok=True)
+    return {
+        "output": str(output),
+        "buildings": total,
+        "products": manifest["products"],
+        "chunks": len(manifest["chunks"]),
+        "resumed": resumed,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def read_scores(output):
+    """Scores of a finished run as a DuckDB relation, call .df() or .fetchall() on it."""
+    return duckdb.sql(f'SELECT * FROM read_parquet({_quote(Path(output) / "part-*.parquet")}) ORDER BY "Building"')
+
+
+#%% Command line interface
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="bci score", description="Score the buildings of a portfolio.")
+    parser.add_argument("sources", nargs="+", type=Path, help="building database, CSV or Parquet files")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="directory of the Parquet part files")
+    parser.add_argument("--efficiency", type=float, default=0.95, help="recycling efficiency")
+    parser.add_argument("--dis-pot", type=float, default=1.0, help="disassembly potential of unassessed products")
+    parser.add_argument("--workers", type=int, help="worker processes, one per CPU by default")
+    parser.add_argument("--chunk-size", type=int, default=200, help="buildings per part file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    def progress(done, total):
+        elapsed = time.perf_counter() - start
+        print(f"\r{done:,}/{total:,} buildings scored, {elapsed:.1f} s", end="", file=sys.stderr, flush=True)
+
+    summary = score(args.sources, args.output, args.efficiency, args.dis_pot, args.workers, args.chunk_size, progress)
+    print(file=sys.stderr)
+    resumed = f", {summary['resumed']:,} from a previous run" if summary["resumed"] else ""
+    print(f"{summary['buildings']:,} buildings ({summary['products']:,} products) scored into "
+          f"{summary['chunks']} part files in {summary['output']}{resumed}, {summary['seconds']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#######################################################################################################################
+# Sensitivity and scenario sweeps over the MCI parameters
+# Parameters are given in slider units (%) and evaluated in chunks through MCI_calculations.MCI_batch, so that
+# millions of parameter points are scored without going through the reactive graph.
+#######################################################################################################################
+
+import numpy as np
+
+import MCI_calculations as mc
+
+# slider id: (label, min, max) in %
+PARAMETERS = {
+    "F_R": ("Input recycled content", 0, 100),
+    "F_U": ("Input reused content", 0, 100),
+    "C_R": ("Output recycled fraction", 0, 100),
+    "C_U": ("Output reused fraction", 0, 100),
+    "E": ("Recycling efficiency", 0, 100),
+    "M": ("M/M_av", 1, 200),
+    "L": ("L/L_av", 1, 200),
+    "U": ("U/U_av", 1, 200),
+}
+DEFAULTS = {"F_R": 0, "F_U": 0, "C_R": 0, "C_U": 0, "E": 95, "M": 100, "L": 100, "U": 100}
+
+
+def evaluate(samples, dis_pot=1.0, chunk_size=1_000_000):
+    """MCI and BCI of every parameter point, `samples` maps slider ids to arrays (missing ones take DEFAULTS).
+
+    Points where the input or output fractions exceed 100% are infeasible and scored NaN. Mass, lifetime and functional
+    units are all assumed available for the utility.
+    """
+    n = max(np.size(v) for v in samples.values())
+    columns = {p: np.broadcast_to(np.asarray(samples.get(p, DEFAULTS[p]), dtype=float), (n,)) for p in PARAMETERS}
+    mci = np.empty(n)
+    for start in range(0, n, chunk_size):
+        c = {p: v[start:start + chunk_size]/100 for p, v in columns.items()}
+        mci[start:start + chunk_size] = mc.MCI_batch(c["M"], c["F_R"], c["F_U"], c["C_R"], c["C_U"], c["E"],
+                                                     c["L"], c["U"], M_av=1)[3]
+    infeasible = (columns["F_R"] + columns["F_U"] > 100) | (columns["C_R"] + columns["C_U"] > 100)
+    mci[infeasible] = np.nan
+    return mci, mci*dis_pot
+
+
+#%% Sampling designs
+def grid(ranges, points_per_axis):
+    """Full factorial grid, `ranges` maps slider ids to (min, max)."""
+    axes = [np.linspace(lo, hi, points_per_axis) for lo, hi in ranges.values()]
+    mesh = np.meshgrid(*axes, indexing="ij")
+    return {p: m.ravel() for p, m in zip(ranges, mesh)}
+
+
+def latin_hypercube(ranges, n, seed=0):
+    """Latin-hypercube sample of n points, one stratum per point along every parameter."""
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for p, (lo, hi) in ranges.items():
+        strata = (rng.permutation(n) + rng.random(n)) / n
+        samples[p] = lo + strata*(hi - lo)
+    return samples
+
+
+def sweep(ranges, n=100_000, method="lhs", base=None, dis_pot=1.0, seed=0):
+    """Sample the parameters of `ranges` (others held at `base`) and score them, returns (samples, mci, bci)."""
+    base = {**DEFAULTS, **(base or {})}
+    if method == "grid":
+        samples = grid(ranges, max(2, int(round(n ** (1/len(ranges))))))
+    elif method == "lhs":
+        samples = latin_hypercube(ranges, n, seed)
+    else:
+        raise ValueError(f"Unknown sampling method {method!r}, expected 'grid' or 'lhs'")
+    mci, bci = evaluate({**base, **samples}, dis_pot)
+    return samples, mci, bci
+
+
+#%% Surfaces and sensitivity indices
+def surface(x, y, base=None, resolution=100, dis_pot=1.0):
+    """MCI and BCI over a resolution x resolution grid of two parameters, returns (x_axis, y_axis, mci, bci)."""
+    base = {**DEFAULTS, **(base or {})}
+    x_axis = np.linspace(*PARAMETERS[x][1:], resolution)
+    y_axis = np.linspace(*PARAMETERS[y][1:], resolution)
+    xx, yy = np.meshgrid(x_axis, y_axis)
+    mci, bci = evaluate({**base, x: xx.ravel(), y: yy.ravel()}, dis_pot)
+    return x_axis, y_axis, mci.reshape(xx.shape), bci.reshape(xx.shape)
+
+
+def one_at_a_time(base=None, steps=51):
+    """One-at-a-time sensitivity of the MCI around `base`.
+
+    Each parameter is swept over its full range while the others stay at `base`. The swing is the range of feasible
+    MCI values, and the index is the swing as a share of the sum of swings.
+    """
+    base = {**DEFAULTS, **(base or {})}
+    params = list(PARAMETERS)
+    samples = {p: np.full(len(params)*steps, float(base[p])) for p in params}
+    for i, p in enumerate(params):
+        samples[p][i*steps:(i+1)*steps] = np.linspace(*PARAMETERS[p][1:], steps)
+    mci = evaluate(samples)[0].reshape(len(params), steps)
+    with np.errstate(invalid="ignore"):
+        low, high = np.nanmin(mci, axis=1), np.nanmax(mci, axis=1)
+    swing = np.nan_to_num(high - low)
+    index = swing / swing.sum() if swing.sum() > 0 else swing
+    return [
+        {"Parameter": PARAMETERS[p][0], "MCI min": float(low[i]), "MCI max": float(high[i]), "Swing": float(swing[i]),
+         "Index": float(index[i])}
+        for i, p in enumerate(params)
+    ]
@@ -0,0 +1,67 @@
+#######################################################################################################################
+# Startup phase timings
+# BCI_app.py marks the end of each startup phase, the first run of the app file in a worker is reported on stderr
+# when BCI_STARTUP_TIMINGS=1. Heavy libraries only needed by outputs (pyarrow, plotly) are imported lazily by those
+# outputs and warmed up in a background thread once the UI is built (disable with BCI_PRELOAD=0).
+#######################################################################################################################
+
+import importlib
+import os
+import sys
+import threading
+import time
+
+# timings start at the first import of this module, at the top of BCI_app.py
+_start = time.perf_counter()
+_last = _start
+_phases = []
+_reported = False
+_preload_started = False
+
+LAZY_MODULES = ["pyarrow", "plotly.graph_objects"]
+
+
+def enabled():
+    return os.environ.get("BCI_STARTUP_TIMINGS", "").lower() in ("1", "true", "yes")
+
+
+def mark(phase):
+    """Close the phase `phase`, only the first run of the app file is recorded."""
+    global _last
+    if _reported:
+        return
+    now = time.perf_counter()
+    _phases.append((phase, now - _last))
+    _last = now
+
+
+def timings():
+    return {"phases": dict(_phases), "total": sum(t for _, t in _phases)}
+
+
+def report():
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    if enabled():
+        for phase, seconds in _phases:
+            print(f"[startup] {phase:28} {seconds*1000:8.1f} ms", file=sys.stderr)
+        print(f"[startup] {'total':28} {timings()['total']*1000:8.1f} ms", file=sys.stderr)
+
+
+def _preload():
+    for module in LAZY_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        if enabled():
+            print(f"[startup] preloaded {module:19} {(time.perf_counter()-start)*1000:8.1f} ms", file=sys.stderr)
+
+
+def preload():
+    """Import LAZY_MODULES in a daemon thread, so the first session does not pay for them."""
+    global _preload_started
+    if _preload_started or os.environ.get("BCI_PRELOAD", "1").lower() in ("0", "false", "no"):
+        return
+    _preload_started = True
+    threading.Thread(target=_preload, name="bci-preload", daemon=True).start()
@@ -0,0 +1,19 @@
+# the app modules are imported flat, as the app and the scripts do
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture
+def con():
+    """In-memory building database at the latest schema."""
+    from migrations import migrate
+
+    con = duckdb.connect()
+    migrate(con)
+    yield con
+    con.close()
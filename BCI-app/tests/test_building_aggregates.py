@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import building_aggregates as ba
+import products
+from building_scores import building_scores
+
+
+def scores(con, efficiency=0.95, dis_pot=1.0):
+    # building_scores_sql, the definition, and the indicators read from the running sums
+    expected = building_scores(con, efficiency=efficiency, dis_pot=dis_pot).fetchall()
+    actual = ba.building_indicators(con, efficiency=efficiency, dis_pot=dis_pot).fetchall()
+    return expected, actual
+
+
+def assert_same_scores(expected, actual):
+    assert [row[:2] for row in actual] == [row[:2] for row in expected]
+    for a, e in zip(actual, expected):
+        assert a[2:] == pytest.approx(e[2:], rel=1e-9, abs=1e-12)
+
+
+def random_rows(rng, names, buildings=("A", "B", "C")):
+    fractions = rng.dirichlet([1, 1, 1, 1], len(names))
+    return [(name, *map(float, f), str(rng.choice(buildings)), float(rng.uniform(0.1, 10)))
+            for name, f in zip(names, fractions)]
+
+
+def assess(con, scores):
+    # DDF assessments of some products, through the "Disassembly" column of upsert_products
+    con.execute("""CREATE OR REPLACE TEMP TABLE assessed AS SELECT * FROM r_strategies WHERE "Product" IN ?""",
+                [list(scores)])
+    con.executemany("""UPDATE assessed SET "Disassembly" = ? WHERE "Product" = ?""",
+                    [(score, name) for name, score in scores.items()])
+    products.upsert_products(con, "assessed")
+
+
+def test_building_bci_is_mass_weighted(con):
+    products.upsert_rows(con, [("P1", 0.0, 1.0, 0.0, 0.0, "B", 1.0), ("P2", 1.0, 0.0, 0.0, 0.0, "B", 1.0)])
+    assess(con, {"P1": 1.0, "P2": 0.0})
+    (row,) = ba.building_indicators(con).fetchall()
+    # P1 reused (MCI 1, disassembly 1) and P2 virgin (MCI 0.1, disassembly 0)
+    assert row[3] == pytest.approx(0.55)
+    assert row[5] == pytest.approx(0.5)
+    assert_same_scores(*scores(con))
+
+
+def test_running_sums_follow_upserts_and_deletes(con):
+    rng = np.random.default_rng(1)
+    products.upsert_rows(con, random_rows(rng, [f"P{i}" for i in range(200)]))
+    assess(con, {f"P{i}": float(rng.uniform()) for i in range(0, 200, 3)})
+    # updates move products between buildings and change their mass and mix
+    products.upsert_rows(con, random_rows(rng, [f"P{i}" for i in range(0, 200, 7)]))
+    products.delete_products(con, """"Product" IN ('P1', 'P2', 'P10')""")
+    products.delete_products(con, """"Building" = 'C'""")
+    assert ba.check(con) == []
+    for efficiency in [0.95, 0.7]:
+        for dis_pot in [1.0, 0.4]:
+            assert_same_scores(*scores(con, efficiency, dis_pot))
+
+
+@pytest.mark.parametrize("efficiency", [0.0, 0.01, 0.5, 0.83, 1.0])
+def test_any_efficiency_is_read_from_the_sums(con, efficiency):
+    rng = np.random.default_rng(2)
+    rows = random_rows(rng, [f"P{i}" for i in range(50)])
+    # shared recycled fractions are summed into one row, products without recycled input have no infinite flow at E=0
+    rows += [(f"R{i}", 0.5, 0.25, 0.25, 0.0, "A", float(i + 1)) for i in range(5)]
+    rows += [(f"V{i}", 0.6, 0.4, 0.0, 0.0, "B", 2.0) for i in range(5)]
+    products.upsert_rows(con, rows)
+    assess(con, {"R1": 0.3, "V2": 0.9, "P4": 0.5})
+    assert_same_scores(*scores(con, efficiency, 0.8))
+
+
+@pytest.mark.parametrize("efficiency", [0.0, 0.95])
+def test_products_missing_a_fraction_have_no_mci(con, efficiency):
+    # P2 has recycled input, its linear flow index would be 1 at E=0 whatever its other fractions
+    products.upsert_rows(con, [("P1", 0.5, 0.5, 0.0, 0.0, "A", 1.0), ("P2", 0.5, None, 0.5, 0.0, "A", 3.0)])
+    assert_same_scores(*scores(con, efficiency))
+    assert ba.building_indicators(con, efficiency=efficiency).fetchone()[3] == pytest.approx(0.55*1/4)
+
+
+def test_writes_do_not_depend_on_the_efficiency(con):
+    products.upsert_rows(con, random_rows(np.random.default_rng(4), [f"P{i}" for i in range(20)]))
+    # one row per building and recycled fraction, no efficiency column
+    assert con.execute("SELECT count(*) FROM building_flow_sums").fetchone()[0] == 20
+    assert "efficiency" not in [row[0] for row in con.execute("DESCRIBE building_flow_sums").fetchall()]
+    products.delete_products(con)
+    assert con.execute("SELECT count(*) FROM building_flow_sums").fetchone()[0] == 0
+
+
+def test_rebuild_repairs_the_sums(con):
+    products.upsert_rows(con, random_rows(np.random.default_rng(3), [f"P{i}" for i in range(30)]))
+    con.execute("UPDATE building_aggregates SET mass = mass + 1")
+    con.execute("UPDATE building_flow_sums SET linear_mass = 0")
+    assert ba.check(con)
+    ba.rebuild(con)
+    ba.rebuild_flow_sums(con)
+    assert ba.check(con) == []
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import building_aggregates
+import MCI_calculations as mc
+import products
+from building_scores import building_scores, product_scores_sql
+
+ROWS = [
+    ("P1", 0.6, 0.2, 0.1, 0.1, "Building 1", 2.0),
+    ("P2", 1.0, 0.0, 0.0, 0.0, "Building 1", 5.0),
+    ("P3", 0.2, 0.3, 0.4, 0.1, "Building 1", 1500.0),
+    ("Q1", 0.0, 0.5, 0.5, 0.0, "Building 2", 3.0),
+]
+
+
+@pytest.fixture
+def con(con):
+    products.upsert_rows(con, ROWS)
+    con.execute(
+        """CREATE TEMP TABLE assessed AS SELECT * FROM (VALUES ('P3', 0.2, 0.3, 0.4, 0.1, 'Building 1', 1500.0, 0.5))
+           t("Product", "Virgin", "Reused", "Recycled", "Repurposed", "Building", "Mass", "Disassembly")"""
+    )
+    products.upsert_products(con, "assessed")
+    return con
+
+
+def batch_mci(rows, efficiency):
+    # the strategy fractions are both the input and the output fractions
+    _, _, reused, recycled, repurposed, _, mass = zip(*rows)
+    f_u = np.add(reused, repurposed)
+    return dict(zip([row[0] for row in rows], mc.MCI_batch(mass, recycled, f_u, recycled, f_u, efficiency)[3]))
+
+
+def product_scores(con, efficiency=0.95, dis_pot=1.0):
+    query = product_scores_sql(efficiency=efficiency, dis_pot=dis_pot)
+    rows = con.execute(f'SELECT * EXCLUDE ("Building") FROM ({query})')
+    return {row[0]: row[1:] for row in rows.fetchall()}
+
+
+@pytest.mark.parametrize("efficiency", [0.0, 0.5, 0.95, 1.0])
+def test_products_score_as_the_batch_engine(con, efficiency):
+    mci = {name: row[2] for name, row in product_scores(con, efficiency).items()}
+    assert mci == pytest.approx(batch_mci(ROWS, efficiency), rel=1e-12)
+
+
+def test_recycled_input_without_recovery_is_linear(con):
+    scores = product_scores(con, efficiency=0.0)
+    assert [scores[name][1] for name in ["P1", "P2", "P3", "Q1"]] == [1.0, 1.0, 1.0, 1.0]
+
+
+def test_unassessed_products_take_the_default_potential(con):
+    scores = product_scores(con, efficiency=0.8, dis_pot=0.7)
+    assert scores["P3"][3] == 0.5 and scores["P1"][3] == 0.7
+    assert scores["P3"][4] == pytest.approx(scores["P3"][2]*0.5)
+
+
+def test_buildings_are_mass_weighted(con):
+    mci = batch_mci(ROWS, 0.8)
+    mass = {row[0]: row[6] for row in ROWS[:3]}
+    disassembly = {"P1": 0.7, "P2": 0.7, "P3": 0.5}
+    total = sum(mass.values())
+    expected = [sum(mass[p]*score[p] for p in mass)/total
+                for score in [mci, disassembly, {p: mci[p]*disassembly[p] for p in mass}]]
+    scores = building_scores(con, efficiency=0.8, dis_pot=0.7).fetchall()
+    assert [row[:3] for row in scores] == [("Building 1", 3, total), ("Building 2", 1, 3.0)]
+    assert scores[0][3:] == pytest.approx(expected, rel=1e-12)
+    assert building_scores(con, "Building 2", efficiency=0.8).fetchall() == [
+        ("Building 2", 1, 3.0, pytest.approx(mci["Q1"]), 1.0, pytest.approx(mci["Q1"]))
+    ]
+
+
+def test_products_missing_a_fraction_have_no_scores(con):
+    products.upsert_rows(con, [("P1", 0.6, None, 0.1, 0.1, "Building 1", 2.0)])
+    assert product_scores(con)["P1"][1:] == (None, None, 1.0, None)
+    # the product keeps its mass in the building, as in the running aggregates
+    assert building_scores(con, "Building 1").fetchall() == [
+        tuple(pytest.approx(v) if isinstance(v, float) else v for v in row)
+        for row in building_aggregates.building_indicators(con, "Building 1").fetchall()
+    ]
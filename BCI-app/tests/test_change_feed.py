@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+from shiny import reactive
+
+import products
+from change_feed import ChangeFeed
+from database import BuildingDatabase
+from migrations import migrate
+
+
+def row(name):
+    return (name, 1.0, 0.0, 0.0, 0.0, "Building 1", 1.0)
+
+
+def test_writes_set_the_reactive_version():
+    db = BuildingDatabase(":memory:")
+    with db.write() as con:
+        migrate(con)
+
+    async def main():
+        # the cached version would hide the writes for a minute without the commit callback
+        feed = ChangeFeed(db, interval=60)
+        version = feed.reactive_version()
+        assert feed.reactive_version() is version
+        with reactive.isolate():
+            start = version()
+        with db.write() as con:
+            products.upsert_rows(con, [row("Session write")])
+        await asyncio.sleep(0.05)
+        with reactive.isolate():
+            after_session = version()
+        # writes of other threads, such as the write-behind queue, are set on the event loop
+        thread = threading.Thread(target=lambda: _write(db, "Queued write"))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.05)
+        with reactive.isolate():
+            return start, after_session, version()
+
+    start, after_session, after_thread = asyncio.run(main())
+    assert start < after_session < after_thread
+    db.close()
+
+
+def _write(db, name):
+    with db.write() as con:
+        products.upsert_rows(con, [row(name)])
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import ddf_scores as ddf
+
+CONNECTIONS = [
+    ["Accessible", "Direct connection with additional fixing devices", "Modular zoning", "Pre-made geometry",
+     "Three connections"],
+    ["Not accessible, total damage", "Direct chemical connection", "Total dependence",
+     "Geometry made on construction site", "Five or more connections"],
+]
+
+
+def test_table_keeps_the_file_order(tmp_path):
+    assert ddf.FACTORS == ["Accessibility", "Type", "Independency", "Method", "Pattern"]
+    assert ddf.DDF_TABLE["Method"] == {"name": "Method of fabrication", "scores": [1.0, 0.8, 0.6],
+                                       "labels": ["Pre-made geometry", "Half standardized geometry",
+                                                  "Geometry made on construction site"]}
+    path = tmp_path / "ddf.csv"
+    path.write_text('factor,name,label,score\nB,Second,"y, z",0.5\nA,First,x,1\nB,Second,w,0.2\n', encoding="utf-8")
+    table = ddf.load_ddf_table(path)
+    assert list(table) == ["B", "A"] and table["B"]["labels"] == ["y, z", "w"]
+
+
+def test_unknown_labels_score_zero():
+    assert ddf.encode("Pattern", [["Four connections", "Six connections"]]).tolist() == [[2, -1]]
+    codes = ddf.encode_connections([["Accessible", "Unknown", None, "Pre-made geometry", "Three connections"]])
+    assert codes.tolist() == [[0, -1, -1, 0, 1]]
+    assert ddf.factor_scores(codes).tolist() == [[1.0, 0.0, 0.0, 1.0, 0.8]]
+
+
+def test_rows_and_columns_encode_alike():
+    by_factor = {f: [row[i] for row in CONNECTIONS] for i, f in enumerate(ddf.FACTORS)}
+    assert np.array_equal(ddf.encode_connections(CONNECTIONS), ddf.encode_connections(by_factor))
+    assert ddf.encode_connections(CONNECTIONS[0]).shape == (1, 5)
+
+
+def test_stored_assessments_encode_as_the_table(con):
+    # ddf_assessments holds one label column per factor
+    con.execute("INSERT INTO ddf_assessments VALUES (1, ?, ?, ?, ?, ?, NULL), (2, ?, ?, ?, ?, ?, NULL)",
+                CONNECTIONS[0] + CONNECTIONS[1])
+    stored = con.execute("SELECT * FROM ddf_assessments ORDER BY product_id").fetchnumpy()
+    assert np.array_equal(ddf.encode_connections({f: stored[f] for f in ddf.FACTORS}),
+                          ddf.encode_connections(CONNECTIONS))
+
+
+def test_potential_averages_the_table_scores():
+    scores = [[1, 0.8, 1, 1, 0.8], [0.1, 0.1, 0.1, 0.6, 0.2]]
+    codes = ddf.encode_connections(CONNECTIONS)
+    assert ddf.disassembly_potential(codes) == pytest.approx(np.mean(scores, axis=1))
+    assert ddf.disassembly_potential(codes)[0] == pytest.approx(0.92)
+    weights = [2, 1, 1, 0, 0]
+    assert ddf.disassembly_potential(codes, weights) == pytest.approx([(2 + 0.8 + 1)/4, (0.2 + 0.1 + 0.1)/4])
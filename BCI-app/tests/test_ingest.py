@@ -0,0 +1,66 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import building_aggregates
+import ingest
+import products
+
+HEADER = "Product,Virgin,Reused,Recycled,Repurposed,Building,Mass"
+LINES = [
+    "P1,0.5,0.5,0,0,Building 1,2",
+    "P2,0.25,0.25,0.25,0.25,Building 2,1",
+    ",1,0,0,0,Building 1,1",
+    "P3,0.5,,0.5,0,Building 1,1",
+    "P4,1.5,-0.5,0,0,Building 1,1",
+    "P5,0.5,0.2,0,0,Building 1,1",
+    "P6,1,0,0,0,Building 1,-1",
+    "P1,0,1,0,0,Building 1,3",
+]
+
+
+def write_csv(path, lines, header=HEADER):
+    path.write_text("\n".join([header, *lines]) + "\n")
+    return path
+
+
+def test_rows_are_validated_and_upserted(con, tmp_path):
+    products.upsert_rows(con, [("P2", 1.0, 0.0, 0.0, 0.0, "Building 2", 1.0)])
+    messages = []
+    summary = ingest.import_products(con, write_csv(tmp_path / "products.csv", LINES), progress=messages.append)
+    assert (summary["read"], summary["inserted"], summary["updated"], summary["rejected"]) == (8, 1, 1, 5)
+    assert [reason for _, _, reason in summary["errors"]] == [
+        "missing product name", "missing strategy fraction", "fraction outside [0, 1]",
+        "fractions do not sum to 1", "invalid mass",
+    ]
+    assert messages == ["reading the file", "validating 8 rows", "writing 2 products"]
+    # the last row of a product wins
+    rows = con.execute("SELECT * EXCLUDE (\"Disassembly\") FROM r_strategies ORDER BY 1").fetchall()
+    assert rows == [("P1", 0.0, 1.0, 0.0, 0.0, "Building 1", 3.0), ("P2", 0.25, 0.25, 0.25, 0.25, "Building 2", 1.0)]
+    assert building_aggregates.check(con) == []
+
+
+def test_parquet_without_optional_columns(con, tmp_path):
+    path = tmp_path / "products.parquet"
+    pq.write_table(pa.table({"Product": ["A", "B"], "Virgin": [1.0, 0.0], "Reused": [0.0, 0.5],
+                             "Recycled": [0.0, 0.5], "Repurposed": [0, 0]}), path)
+    summary = ingest.import_products(con, path)
+    assert (summary["inserted"], summary["rejected"]) == (2, 0)
+    rows = con.execute('SELECT "Building", "Mass", "Disassembly" FROM r_strategies').fetchall()
+    assert rows == [("Building 1", 1.0, None)] * 2
+
+
+def test_dry_run_writes_nothing(con, tmp_path):
+    summary = ingest.import_products(con, write_csv(tmp_path / "products.csv", LINES[:2]), dry_run=True)
+    assert summary["inserted"] == 2
+    assert products.product_count(con) == 0
+
+
+def test_unreadable_files_are_rejected(con, tmp_path):
+    with pytest.raises(ValueError, match="Recycled"):
+        ingest.import_products(con, write_csv(tmp_path / "short.csv", ["P1,1,0,0"], "Product,Virgin,Reused,Repurposed"))
+    with pytest.raises(ValueError, match="Unsupported"):
+        ingest.import_products(con, tmp_path / "products.xlsx")
+    # the format given explicitly wins over the extension
+    summary = ingest.import_products(con, write_csv(tmp_path / "products.txt", LINES[:1]), file_format="csv")
+    assert summary["inserted"] == 1
@@ -0,0 +1,74 @@
+import duckdb
+import pytest
+
+import lca
+import products
+from migrations import migrate
+
+ROWS = [
+    ("P1", 0.5, 0.2, 0.3, 0.0, "Building 1", 2.0),
+    ("P2", 1.0, 0.0, 0.0, 0.0, "Building 2", 4.0),
+]
+COMPLETE = [("all", "", "Virgin", 2.0), ("all", "", "Reused", 0.1), ("all", "", "Recycled", 0.5),
+            ("all", "", "Repurposed", 0.2)]
+
+
+def gwp(con, dataset=lca.DEFAULT_DATASET):
+    return {row["Building"]: row["GWP"] for row in lca.building_impacts(con, dataset).to_pylist()}
+
+
+@pytest.fixture
+def con(con):
+    products.upsert_rows(con, ROWS)
+    return con
+
+
+def test_factors_of_the_dataset_and_the_product_apply(con):
+    assert gwp(con) == pytest.approx({"Building 1": 2*(0.5*1.0 + 0.2*0.05 + 0.3*0.4), "Building 2": 4.0})
+    lca.set_factors(con, COMPLETE + [("product", "P1", "Virgin", 3.0)], dataset="epd")
+    assert gwp(con, "epd") == pytest.approx({"Building 1": 2*(0.5*3.0 + 0.2*0.1 + 0.3*0.5), "Building 2": 8.0})
+    assert lca.datasets(con) == ["default", "epd"]
+
+
+def test_incomplete_datasets_are_rejected(con, tmp_path):
+    with pytest.raises(ValueError, match="Repurposed"):
+        lca.set_factors(con, COMPLETE[:3], dataset="partial")
+    # a product factor does not stand in for the 'all' scope
+    with pytest.raises(ValueError, match="Recycled"):
+        lca.set_factors(con, COMPLETE[:2] + [("all", "", "Repurposed", 0.2), ("product", "P1", "Recycled", 1.0)],
+                        dataset="partial")
+    # a stored dataset is completed by later rows
+    lca.set_factors(con, [("all", "", "Virgin", 5.0)])
+    path = tmp_path / "factors.csv"
+    path.write_text("scope,item,route,factor\nall,,Virgin,2\nall,,Reused,0.1\nproduct,P1,Recycled,1\n")
+    with pytest.raises(ValueError, match="Recycled, Repurposed"):
+        lca.load_factors(con, path, "ice")
+    assert lca.datasets(con) == ["default"]
+
+
+def test_stored_incomplete_datasets_warn_and_fall_back(con):
+    con.execute("INSERT INTO emission_factors (dataset, scope, route, factor) VALUES ('old', 'all', 'Virgin', 2.0)")
+    with pytest.warns(UserWarning, match="Reused, Recycled, Repurposed"):
+        impacts = gwp(con, "old")
+    assert impacts["Building 1"] == pytest.approx(2*(0.5*2.0 + 0.2*0.05 + 0.3*0.4))
+
+
+def test_lookups_are_cached_per_database_file(tmp_path):
+    # same file name, dataset, number of factors and update time, only the path tells them apart
+    cons = []
+    for directory, factor in [("a", 1.0), ("b", 3.0)]:
+        (tmp_path / directory).mkdir()
+        con = duckdb.connect(str(tmp_path / directory / "building_data.db"))
+        migrate(con)
+        products.upsert_rows(con, ROWS)
+        con.execute("UPDATE emission_factors SET updated_at = TIMESTAMP '2026-01-01'")
+        con.execute("UPDATE emission_factors SET factor = ? WHERE route = 'Virgin'", [factor])
+        cons.append(con)
+    assert gwp(cons[0])["Building 2"] == pytest.approx(4.0)
+    assert gwp(cons[1])["Building 2"] == pytest.approx(12.0)
+    assert lca.factor_lookup(cons[0]) is lca.factor_lookup(cons[0])
+    # a changed dataset is resolved again
+    lca.set_factors(cons[0], [("all", "", "Virgin", 2.0)])
+    assert gwp(cons[0])["Building 2"] == pytest.approx(8.0)
+    for con in cons:
+        con.close()
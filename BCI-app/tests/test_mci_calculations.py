@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import MCI_calculations as mc
+
+
+def scalar_mci(M, F_R, F_U, C_R, C_U, E, L=1, U=1):
+    # reactive chain of the original app: flows, LFI, utility L*U/M with M the ratio to the average and F = 0.9/X
+    V = M*(1-F_R-F_U)
+    W_0 = M*(1-C_R-C_U)
+    W_f = M*((1-E)/E)*F_R
+    W_c = M*(1-E)*C_R
+    W = W_0 + (W_f+W_c)/2
+    lfi = mc.LFI(V, W, M, W_f, W_c)
+    return lfi, mc.MCI(lfi, mc.F(mc.X(L, 1, U, 1, M, 1)))
+
+
+@pytest.fixture
+def inventory():
+    rng = np.random.default_rng(0)
+    n = 500
+    f_r, f_u = rng.dirichlet([1, 1, 1], n)[:, :2].T
+    c_r, c_u = rng.dirichlet([1, 1, 1], n)[:, :2].T
+    return {
+        "M": rng.uniform(0.01, 2, n), "F_R": f_r, "F_U": f_u, "C_R": c_r, "C_U": c_u,
+        "E": rng.uniform(0.05, 1, n), "L": rng.uniform(0.01, 2, n), "U": rng.uniform(0.01, 2, n),
+    }
+
+
+def test_batch_matches_scalar_functions(inventory):
+    lfi, x, f, mci = mc.MCI_batch(**inventory, M_av=1)
+    for i in range(len(lfi)):
+        row = {k: float(v[i]) for k, v in inventory.items()}
+        expected_lfi, expected_mci = scalar_mci(**row)
+        assert lfi[i] == pytest.approx(expected_lfi, rel=1e-12)
+        assert mci[i] == pytest.approx(expected_mci, rel=1e-12, abs=1e-12)
+        assert x[i] == pytest.approx(row["L"]*row["U"]/row["M"], rel=1e-12)
+        assert f[i] == pytest.approx(0.9/x[i], rel=1e-12)
+
+
+def test_scalars_broadcast_against_columns(inventory):
+    batch = mc.MCI_batch(inventory["M"], 0.3, 0.2, inventory["C_R"], 0.1, 0.9, M_av=1)
+    for i in [0, 17, 499]:
+        _, expected = scalar_mci(float(inventory["M"][i]), 0.3, 0.2, float(inventory["C_R"][i]), 0.1, 0.9)
+        assert batch[3][i] == pytest.approx(expected, rel=1e-12, abs=1e-12)
+
+
+def test_flows_of_one_product():
+    V, W_0, W_f, W_c, W = mc.flows(2.0, 0.25, 0.25, 0.5, 0.25, 0.5)
+    assert (V, W_0, W_f, W_c) == pytest.approx((1.0, 0.5, 0.5, 0.5))
+    assert W == pytest.approx(1.0)
+
+
+def test_zero_efficiency_with_recycled_input_makes_lfi_one():
+    V, W_0, W_f, W_c, W = mc.flows([1.0, 1.0], [0.5, 0.0], 0.2, 0.3, 0.1, 0.0)
+    assert np.isinf(W_f[0]) and W_f[1] == 0
+    lfi = mc.LFI_array(V, W, 1.0, W_f, W_c)
+    assert lfi[0] == 1.0
+    # without recycled input the waste of recycling is zero and the LFI stays finite
+    assert lfi[1] == pytest.approx(mc.LFI(V[1], W[1], 1.0, W_f[1], W_c[1]))
+
+
+def test_zero_efficiency_batch_is_finite():
+    lfi, _, _, mci = mc.MCI_batch([1.0, 2.0], [0.5, 0.0], [0.1, 0.1], [0.2, 0.2], [0.1, 0.1], 0.0)
+    assert np.all(np.isfinite(lfi)) and np.all(np.isfinite(mci))
+    assert mci[0] == pytest.approx(0.1)
+
+
+def test_zero_utility_masks():
+    x = mc.X_array([0.0, 0.0, 1.0], 1, 1, 1, 1, 1)
+    f = mc.F_array(x)
+    assert np.isinf(f[0]) and f[2] == pytest.approx(0.9)
+    # unbounded F gives an MCI of 0, or 1 for a product without linear flow
+    mci = mc.MCI_array([0.5, 0.0, 0.5], f)
+    assert list(mci) == pytest.approx([0.0, 1.0, 0.55])
+
+
+def test_mci_is_clamped_at_zero():
+    assert mc.MCI_array(1.0, 2.0) == 0.0
+    assert mc.MCI(1.0, 2.0) == 0
+
+
+def test_utility_uses_the_app_ratios():
+    # lifetime and functional units raise the utility, mass lowers it
+    assert mc.X_array(2.0, 1.0, 1.5, 1.0, 0.5, 1.0) == pytest.approx(2.0*1.5/0.5)
+    assert mc.X_array(2.0, 4.0, 1.0, 2.0, 1.0, 0.5) == pytest.approx(0.5*0.5/2.0)
+    for args in [(2.0, 1.0, 1.5, 1.0, 0.5, 1.0), (2.0, 4.0, 1.0, 2.0, 1.0, 0.5), (3.0, 2.0, 0.5, 1.0, 800.0, 1000.0)]:
+        assert mc.X_array(*args) == pytest.approx(mc.X(*args), rel=1e-12)
+
+
+def test_masses_in_kg_keep_a_unit_utility():
+    # the mass ratio of the utility defaults to 1, a 1000 kg product scores as a 1 kg one
+    lfi, x, f, mci = mc.MCI_batch([1000.0, 1.0], 0.5, 0.5, 0.5, 0.5, 0.95)
+    assert x.tolist() == [1.0, 1.0] and f.tolist() == pytest.approx([0.9, 0.9])
+    assert lfi[0] == pytest.approx(lfi[1]) and mci[0] == pytest.approx(mci[1])
+    assert mci[0] == pytest.approx(1 - 0.9*lfi[0]) and mci[0] > 0.9
+    # a product twice as heavy as the average halves the utility
+    _, x, _, _ = mc.MCI_batch(1000.0, 0.5, 0.5, 0.5, 0.5, 0.95, M_av=500.0)
+    assert x == pytest.approx(0.5)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import mfa
+import products
+
+SOURCES = ["Virgin extraction", "Scrap feedstock", "Reused components"]
+SINKS = ["Reuse & repurposing", "Secondary material", "Landfill & energy recovery"]
+
+
+def random_products(seed, n=200):
+    # about a quarter of the products recycle and reuse more than their mass
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.1, 10, n), rng.uniform(0, 0.8, n), rng.uniform(0, 0.8, n)
+
+
+def stage_totals(flows, stages, sign):
+    # summed outflows (sign=-1) or inflows (sign=1) of the stages
+    rows = [mfa.STAGES.index(stage) for stage in stages]
+    return (flows @ (sign*mfa.incidence()[rows]).clip(0).T).sum()
+
+
+def test_balance_scales_oversized_fractions():
+    recycled, reused, scaled = mfa.balance([0.6, 0.2, -0.1, 1.5], [0.6, 0.3, 0.4, 0.5])
+    assert recycled == pytest.approx([0.5, 0.2, 0.0, 0.75])
+    assert reused == pytest.approx([0.5, 0.3, 0.4, 0.25])
+    assert scaled.tolist() == [True, False, False, True]
+
+
+@pytest.mark.parametrize("efficiency", [0.0, 0.5, 0.95, 1.0])
+def test_transit_stages_conserve_mass(efficiency):
+    mass, recycled, reused = random_products(0)
+    flows, balanced = mfa.product_flows(mass, recycled, reused, efficiency)
+    assert balanced == np.sum(recycled + reused > 1) > 0
+    assert np.all(flows >= -1e-12)
+    assert np.abs(mfa.imbalance(flows)).max() < 1e-9
+    # every product passes through use with its own mass, sources and sinks carry the same total
+    assert flows[:, mfa.EDGES.index(("Manufacturing", "Use"))] == pytest.approx(mass)
+    assert stage_totals(flows, SOURCES, -1) == pytest.approx(stage_totals(flows, SINKS, 1))
+
+
+def test_aggregated_use_nodes_keep_the_mass():
+    mass, recycled, reused = random_products(1)
+    flows, _ = mfa.product_flows(mass, recycled, reused)
+    groups = np.minimum(np.arange(len(mass)) % 7, 4)
+    sources, targets, values = mfa.flow_matrix(flows, groups, list("ABCDE"))
+    for group in range(5):
+        node = len(mfa.STAGES) + group
+        assert values[targets == node].sum() == pytest.approx(mass[groups == group].sum())
+        assert values[sources == node].sum() == pytest.approx(mass[groups == group].sum())
+    assert mfa.STAGES.index("Use") not in np.concatenate([sources, targets])
+    assert values.sum() == pytest.approx(flows.sum())
+
+
+@pytest.mark.parametrize("building, top_n", [("Building 1", 3), (None, 2)])
+def test_sankey_nodes_are_bounded(con, building, top_n):
+    mass, recycled, reused = random_products(2, n=60)
+    rows = [(f"P{i}", max(1 - r - u, 0), u, r, 0.0, f"Building {i % 4 + 1}", m)
+            for i, (m, r, u) in enumerate(zip(mass, recycled, reused))]
+    products.upsert_rows(con, rows)
+    sankey, balanced = mfa.building_flows(con, building, top_n=top_n)
+    assert len(sankey["labels"]) <= len(mfa.STAGES) + top_n + 1
+    assert sum(label.startswith("Use: ") for label in sankey["labels"]) == top_n + 1
+    assert balanced == sum(r + u > 1 for _, _, u, r, _, b, _ in rows if building in (None, b))
+    assert len(sankey["source"]) == len(sankey["target"]) == len(sankey["value"])
@@ -0,0 +1,59 @@
+import duckdb
+
+import building_aggregates
+import lca
+import migrations
+import products
+from ddf_scores import FACTORS
+from scenarios import CHANGE_COLUMNS
+
+ROWS = [
+    ("P1", 0.6, 0.2, 0.1, 0.1, "Building 1", 2.0),
+    ("P2", 1.0, 0.0, 0.0, 0.0, "Building 2", 5.0),
+]
+
+
+def columns(con, table):
+    return [row[0] for row in con.execute(f"DESCRIBE {table}").fetchall()]
+
+
+def test_frozen_tables_match_the_modules(con):
+    # migrations hold their own SQL, the modules reading the tables must agree with it
+    assert columns(con, "building_aggregates") == ["building_id", *building_aggregates.AGGREGATES]
+    assert columns(con, "building_flow_sums") == ["building_id", "recycled", *building_aggregates.FLOW_SUMS]
+    assert columns(con, "scenario_changes") == ["scenario_id", "product", *CHANGE_COLUMNS.values(), "removed"]
+    assert columns(con, "ddf_assessments") == ["product_id", *FACTORS, "score"]
+    factors = con.execute("SELECT route, factor FROM emission_factors WHERE dataset = ? AND scope = 'all'",
+                          [lca.DEFAULT_DATASET]).fetchall()
+    assert dict(factors) == lca.DEFAULT_FACTORS
+
+
+def test_elements_are_dropped(con):
+    assert "element_id" not in columns(con, "products")
+    tables = {row[0] for row in con.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    assert "elements" not in tables
+    assert con.execute("SELECT count(*) FROM duckdb_sequences() WHERE sequence_name = 'element_ids'").fetchone()[0] == 0
+
+
+def test_stored_products_survive_the_migrations():
+    con = duckdb.connect()
+    migrations.migrate(con, 9)
+    products.upsert_rows(con, ROWS)
+    ids = con.execute("SELECT name, product_id FROM products ORDER BY 1").fetchall()
+    assert migrations.migrate(con) == list(range(10, migrations.LATEST + 1))
+    assert con.execute("SELECT name, product_id FROM products ORDER BY 1").fetchall() == ids
+    products.upsert_rows(con, [("P3", 0.0, 1.0, 0.0, 0.0, "Building 1", 1.0)])
+    assert con.execute("SELECT product_id FROM products WHERE name = 'P3'").fetchone()[0] > max(i for _, i in ids)
+    assert building_aggregates.check(con) == []
+    con.close()
+
+
+def test_legacy_flat_table_is_migrated():
+    con = duckdb.connect()
+    migrations.migrate(con, 2)
+    con.executemany("INSERT INTO r_strategies VALUES (?, ?, ?, ?, ?, ?, ?, NULL)", ROWS)
+    migrations.migrate(con)
+    rows = con.execute('SELECT * EXCLUDE ("Disassembly") FROM r_strategies ORDER BY 1').fetchall()
+    assert rows == ROWS
+    assert building_aggregates.check(con) == []
+    con.close()
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import optimizer
+
+
+def instance(seed, n=3):
+    rng = np.random.default_rng(seed)
+    mass, dis_pot = rng.uniform(0.5, 5, n), rng.uniform(0.2, 1, n)
+    return optimizer.pareto_front(mass, rng.uniform(2, 20, 4), dis_pot, step=0.25)
+
+
+def enumerate_mixes(front):
+    # cost and BCI of every combination of options
+    cost, bci = np.zeros(1), np.zeros(1)
+    for c, v in zip(front["product_cost"], front["product_bci"]):
+        cost, bci = (cost[:, None] + c).ravel(), (bci[:, None] + v).ravel()
+    return cost, bci
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_supported_points_are_optimal(seed):
+    front = instance(seed)
+    cost, bci = enumerate_mixes(front)
+    assert np.all(np.diff(front["cost"]) >= 0) and np.all(np.diff(front["bci"]) > 0)
+    for c, b in zip(front["cost"], front["bci"]):
+        assert bci[cost <= c + 1e-9].max() == pytest.approx(b, abs=1e-12)
+    assert front["bci"][-1] == pytest.approx(bci.max())
+    assert front["cost"][0] == pytest.approx(cost.min())
+
+
+def test_front_choices_reproduce_the_points():
+    front = instance(0, n=6)
+    for point in range(len(front["cost"])):
+        choice = optimizer.front_choice(front, point)
+        rows = np.arange(len(choice))
+        assert front["product_cost"][rows, choice].sum() == pytest.approx(front["cost"][point])
+        assert front["product_bci"][rows, choice].sum() == pytest.approx(front["bci"][point])
+        assert (front["weight"]*front["option_mci"][choice]).sum() == pytest.approx(front["mci"][point])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_budget_search_against_brute_force(seed):
+    front = instance(seed)
+    cost, bci = enumerate_mixes(front)
+    for budget in np.linspace(cost.min(), cost.max(), 20):
+        found = optimizer.best_under_budget(front, budget)
+        supported = front["bci"][np.flatnonzero(front["cost"] <= budget + 1e-9)[-1]]
+        assert found["cost"] <= budget + 1e-9
+        assert supported - 1e-12 <= found["bci"] <= bci[cost <= budget + 1e-9].max() + 1e-12
+    assert optimizer.best_under_budget(front, cost.min() - 1) is None
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_target_search_against_brute_force(seed):
+    front = instance(seed)
+    cost, bci = enumerate_mixes(front)
+    for target in np.linspace(0, bci.max(), 15):
+        found = optimizer.cheapest_for_target(front, target)
+        supported = front["cost"][np.flatnonzero(front["bci"] >= target - 1e-12)[0]]
+        assert found["bci"] >= target - 1e-12
+        assert cost[bci >= target - 1e-12].min() - 1e-9 <= found["cost"] <= supported + 1e-9
+    assert optimizer.cheapest_for_target(front, bci.max() + 0.01) is None
+
+
+def test_repair_spends_the_budget_between_supported_points():
+    # the repair reaches the brute-force optimum for more budgets than the supported points (189 vs 165 of 200)
+    exact = supported = 0
+    for seed in range(10):
+        front = instance(seed)
+        cost, bci = enumerate_mixes(front)
+        for budget in np.linspace(cost.min(), cost.max(), 20):
+            best = bci[cost <= budget + 1e-9].max()
+            exact += optimizer.best_under_budget(front, budget)["bci"] >= best - 1e-12
+            supported += front["bci"][np.flatnonzero(front["cost"] <= budget + 1e-9)[-1]] >= best - 1e-12
+    assert exact > supported
+
+
+def test_inventory_without_mass_has_zero_bci():
+    front = optimizer.pareto_front(np.zeros(3), [5.0, 15.0, 12.0, 14.0], 1.0)
+    assert np.all(np.isfinite(front["bci"])) and np.all(front["bci"] == 0) and np.all(front["mci"] == 0)
+    assert optimizer.best_under_budget(front, 0)["bci"] == 0
+
+
+def test_mix_table_of_a_found_mix():
+    mass, prices = np.array([1.0, 2.0]), np.array([[5.0, 15.0, 12.0, 14.0]]*2)
+    front = optimizer.pareto_front(mass, prices, 1.0, step=0.5)
+    point = optimizer.best_under_budget(front, front["cost"][-1])
+    rows = optimizer.mix_table(front, point, ["A", "B"], mass, prices)
+    assert [r["Product"] for r in rows] == ["A", "B"]
+    assert sum(r["Cost"] for r in rows) == pytest.approx(point["cost"])
+    assert all(sum(r[s] for s in optimizer.STRATEGIES) == pytest.approx(1) for r in rows)
@@ -0,0 +1,71 @@
+import pytest
+
+import portfolio
+import products
+from building_scores import building_scores
+
+ROWS = [
+    ("N1", 1.0, 0.0, 0.0, 0.0, "North", 2.0),
+    ("S1", 0.0, 1.0, 0.0, 0.0, "South", 3.0),
+    ("H1", 0.5, 0.0, 0.5, 0.0, "Harbour", 4.0),
+    ("G1", 0.2, 0.3, 0.3, 0.2, "Northgate", 1.0),
+    ("G2", 0.0, 0.0, 0.0, 1.0, "Northgate", 6.0),
+]
+PRICES = {"Virgin": 10.0, "Reused": 4.0, "Recycled": 6.0, "Repurposed": 3.0}
+
+
+@pytest.fixture
+def con(con):
+    products.upsert_rows(con, ROWS)
+    return con
+
+
+def scores(con):
+    return {row[0]: row for row in building_scores(con, efficiency=0.9, dis_pot=0.8).fetchall()}
+
+
+def page(con, **kwargs):
+    table = portfolio.ranking_page(con, efficiency=0.9, dis_pot=0.8, prices=PRICES, **kwargs)
+    return list(zip(table.column("Rank").to_pylist(), table.column("Building").to_pylist()))
+
+
+def test_buildings_are_ranked_by_score(con):
+    by_bci = sorted(scores(con).values(), key=lambda row: (-row[5], row[0]))
+    assert page(con) == list(enumerate([row[0] for row in by_bci], 1))
+    assert page(con, sort="Mass", descending=False) == [(1, "North"), (2, "South"), (3, "Harbour"), (4, "Northgate")]
+    with pytest.raises(ValueError):
+        page(con, sort='"BCI"; DROP TABLE buildings')
+
+
+def test_ranks_are_kept_through_search_and_paging(con):
+    ranked = page(con, sort="Building", descending=False)
+    assert [building for _, building in ranked] == ["Harbour", "North", "Northgate", "South"]
+    assert page(con, sort="Building", descending=False, search="NORTH") == [(2, "North"), (3, "Northgate")]
+    assert page(con, sort="Building", descending=False, page=2, page_size=3) == [(4, "South")]
+    assert page(con, page=3, page_size=3) == []
+    assert [portfolio.building_count(con, search) for search in ["", "north", "east"]] == [4, 2, 0]
+
+
+def test_costs_price_the_strategy_masses(con):
+    table = portfolio.ranking_page(con, sort="Building", descending=False, prices=PRICES).to_pylist()
+    cost = {row["Building"]: row["Cost"] for row in table}
+    assert cost == pytest.approx({"Harbour": 4*(0.5*10 + 0.5*6), "North": 2*10, "South": 3*4,
+                                  "Northgate": 1*(0.2*10 + 0.3*4 + 0.3*6 + 0.2*3) + 6*3})
+    # columns of the rollup follow building_scores()
+    assert {row["Building"]: tuple(row[c] for c in ["Products", "Mass", "MCI", "Disassembly", "BCI"])
+            for row in portfolio.ranking_page(con, efficiency=0.9, dis_pot=0.8).to_pylist()} == {
+        name: pytest.approx(row[1:]) for name, row in scores(con).items()}
+
+
+def test_summary_weights_the_buildings_by_mass(con):
+    rows = scores(con).values()
+    mass = sum(row[2] for row in rows)
+    summary = portfolio.summary(con, efficiency=0.9, dis_pot=0.8, prices=PRICES)
+    assert summary == pytest.approx({
+        "buildings": 4, "products": 5, "mass": 16.0, "cost": 32 + 20 + 12 + 23.6,
+        "MCI": sum(row[2]*row[3] for row in rows)/mass, "Disassembly": 0.8,
+        "BCI": sum(row[2]*row[5] for row in rows)/mass,
+    })
+    products.delete_products(con)
+    assert portfolio.summary(con) == {"buildings": 0, "products": 0, "mass": 0, "cost": 0, "MCI": None,
+                                      "Disassembly": None, "BCI": None}
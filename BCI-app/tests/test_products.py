@@ -0,0 +1,99 @@
+import pyarrow.parquet as pq
+import pytest
+
+import building_aggregates
+import change_feed
+import products
+
+ROWS = [
+    ("Beam", 0.6, 0.2, 0.1, 0.1, "Building 1", 2.0),
+    ("Column", 1.0, 0.0, 0.0, 0.0, "Building 1", 5.0),
+    ("Door", 0.2, 0.3, 0.4, 0.1, "Building 2", 1.5),
+    ("Facade", 0.5, 0.5, 0.0, 0.0, "Building 2", 3.0),
+]
+
+
+@pytest.fixture
+def con(con):
+    products.upsert_rows(con, ROWS)
+    return con
+
+
+def stored(con):
+    return con.execute('SELECT * EXCLUDE ("Disassembly") FROM r_strategies ORDER BY 1').fetchall()
+
+
+def test_upserts_insert_and_update_by_name(con):
+    products.upsert_rows(con, [("Beam", 0.0, 1.0, 0.0, 0.0, "Building 3", 4.0),
+                               ("Gate", 1.0, 0.0, 0.0, 0.0, None, None), ("Gate", 0.5, 0.5, 0.0, 0.0, None, None)])
+    assert stored(con) == sorted(ROWS[1:] + [("Beam", 0.0, 1.0, 0.0, 0.0, "Building 3", 4.0),
+                                             ("Gate", 0.5, 0.5, 0.0, 0.0, "Building 1", 1.0)])
+    assert con.execute("SELECT count(*) FROM products").fetchone()[0] == 5
+    _, changes = change_feed.changes_since(con, 0)
+    assert [op for _, op, _ in changes][-2:] == ["update", "insert"]
+    assert building_aggregates.check(con) == []
+
+
+def test_a_missing_assessment_keeps_the_stored_one(con):
+    con.execute(
+        """CREATE TEMP TABLE assessed AS SELECT * FROM (VALUES ('Beam', 0.6, 0.2, 0.1, 0.1, 'Building 1', 2.0, 0.7),
+                                                        ('Door', 0.2, 0.3, 0.4, 0.1, 'Building 2', 1.5, 0.4))
+           t("Product", "Virgin", "Reused", "Recycled", "Repurposed", "Building", "Mass", "Disassembly")"""
+    )
+    products.upsert_products(con, "assessed")
+    con.execute("""UPDATE assessed SET "Disassembly" = NULL WHERE "Product" = 'Beam'""")
+    con.execute("""UPDATE assessed SET "Disassembly" = 0.9 WHERE "Product" = 'Door'""")
+    products.upsert_products(con, "assessed")
+    scores = con.execute('SELECT "Product", "Disassembly" FROM r_strategies ORDER BY 1').fetchall()
+    assert scores == [("Beam", 0.7), ("Column", None), ("Door", 0.9), ("Facade", None)]
+    products.upsert_products(con, "assessed", assessments=False)
+    assert building_aggregates.check(con) == []
+
+
+def test_inserts_reject_stored_and_repeated_names(con):
+    rejected = products.insert_rows(con, [ROWS[0], ("Gate", 1, 0, 0, 0, "Building 1", 1.0),
+                                          ("Gate", 0, 1, 0, 0, "Building 1", 1.0)])
+    assert sorted(rejected) == [0, 2]
+    assert "already exists" in rejected[0] and "twice" in rejected[2]
+    assert products.product_strategies(con, "Gate") == {"Virgin": 1, "Reused": 0, "Recycled": 0, "Repurposed": 0}
+    assert products.product_strategies(con, "Missing") is None
+
+
+def test_deletes_follow_the_condition(con):
+    assert products.delete_products(con, '"Building" = ?', ["Building 2"]) == 2
+    assert [row[0] for row in stored(con)] == ["Beam", "Column"]
+    assert con.execute("SELECT count(*) FROM material_flows").fetchone()[0] == 2
+    assert change_feed.changes_since(con, 0)[1][-1][1:] == ("delete", "Facade")
+    assert building_aggregates.check(con) == []
+    assert products.delete_products(con) == 2
+    assert products.product_count(con) == 0
+
+
+@pytest.mark.parametrize("sort, descending, expected", [
+    ("Product", False, ["Beam", "Column"]),
+    ("Mass", True, ["Column", "Facade"]),
+    ("Virgin", False, ["Door", "Facade"]),
+    ("Building", True, ["Door", "Facade"]),
+])
+def test_pages_are_sorted_in_the_database(con, sort, descending, expected):
+    page = products.product_page(con, 1, 2, sort, descending)
+    assert page.column("Product").to_pylist() == expected
+    assert page.column_names == ["Product", "Virgin", "Reused", "Recycled", "Repurposed", "Building", "Mass",
+                                 "Disassembly"]
+
+
+def test_pages_and_search(con):
+    assert products.product_page(con, 2, 3).column("Product").to_pylist() == ["Facade"]
+    assert products.product_page(con, 5, 3).num_rows == 0
+    assert products.product_count(con, "building 2") == 2
+    assert products.product_page(con, search="OOR").column("Product").to_pylist() == ["Door"]
+    assert products.product_names(con, "o", limit=2) == ["Column", "Door"]
+    assert [products.page_count(n, 10) for n in [0, 10, 11]] == [1, 1, 2]
+    with pytest.raises(ValueError):
+        products.product_page(con, sort="Product; DROP TABLE products")
+
+
+def test_export_streams_the_matching_products(con, tmp_path):
+    path = tmp_path / "products.parquet"
+    assert products.export_products(con, path, search="Building 1", batch_size=1) == 2
+    assert pq.read_table(path).column("Product").to_pylist() == ["Beam", "Column"]
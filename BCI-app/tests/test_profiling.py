@@ -0,0 +1,33 @@
+import duckdb
+import pytest
+from shiny import reactive
+
+import profiling
+
+
+def test_unknown_internals_are_left_alone():
+    @reactive.calc
+    def known():
+        return 1
+
+    @reactive.calc
+    def changed():
+        return 2
+
+    # a shiny version with a synchronous _fn is not patched
+    original = changed._fn = lambda: 2
+    profiler = profiling.Profiler()
+    with pytest.warns(UserWarning, match="changed not timed"):
+        assert profiling.instrument({"known": known, "changed": changed, "other": 3}, profiler) == 1
+    assert changed._fn is original and not getattr(changed, "_bci_profiled", False)
+    assert known._bci_profiled
+
+
+def test_queries_are_timed_where_they_run():
+    profiler = profiling.Profiler()
+    cursor = profiling.ProfiledCursor(duckdb.connect(), profiler)
+    assert cursor.execute("SELECT 42").fetchone() == (42,)
+    assert cursor.sql("SELECT 1").fetchone() == (1,)
+    # the lazy relation of sql() is not recorded
+    assert [(row["kind"], row["calls"]) for row in profiler.stats()] == [("query", 1)]
+    assert profiler.stats()[0]["name"].endswith("test_queries_are_timed_where_they_run")
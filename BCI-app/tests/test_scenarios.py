@@ -0,0 +1,85 @@
+import duckdb
+import pytest
+
+import building_aggregates
+import products
+import scenarios
+from migrations import migrate
+
+BASE_ROWS = [
+    ("P1", 0.6, 0.2, 0.1, 0.1, "Building 1", 2.0),
+    ("P2", 1.0, 0.0, 0.0, 0.0, "Building 1", 5.0),
+    ("P3", 0.2, 0.3, 0.4, 0.1, "Building 1", 1.5),
+    ("Q1", 0.5, 0.5, 0.0, 0.0, "Building 2", 3.0),
+]
+# P1 changes its virgin and reused shares, P2 is removed, P3 is kept and P4 is added without a mass
+EDITED = [
+    ("P1", 0.3, 0.5, 0.1, 0.1, 2.0),
+    ("P3", 0.2, 0.3, 0.4, 0.1, 1.5),
+    ("P4", 0.0, 0.0, 1.0, 0.0, None),
+]
+EDITED_INVENTORY = [("P1", 0.3, 0.5, 0.1, 0.1, "Building 1", 2.0), ("P3", 0.2, 0.3, 0.4, 0.1, "Building 1", 1.5),
+                    ("P4", 0.0, 0.0, 1.0, 0.0, "Building 1", 1.0)]
+
+
+@pytest.fixture
+def con(con):
+    products.upsert_rows(con, BASE_ROWS)
+    con.execute(
+        """CREATE TEMP TABLE edited ("Product" VARCHAR, "Virgin" DOUBLE, "Reused" DOUBLE, "Recycled" DOUBLE,
+                                     "Repurposed" DOUBLE, "Mass" DOUBLE, "Disassembly" DOUBLE)"""
+    )
+    con.executemany("INSERT INTO edited VALUES (?, ?, ?, ?, ?, ?, NULL)", EDITED)
+    scenarios.save(con, "Building 1", "Reuse", "edited", settings={"E": 90})
+    return con
+
+
+def test_only_the_differences_are_stored(con):
+    rows = scenarios.changes(con, "Building 1", "Reuse").fetchall()
+    assert rows == [
+        ("P1", 0.3, 0.5, None, None, None, None, False),
+        ("P2", None, None, None, None, None, None, True),
+        ("P4", 0.0, 0.0, 1.0, 0.0, None, None, False),
+    ]
+    assert scenarios.settings(con, "Building 1", "Reuse") == {"E": 90}
+    assert scenarios.scenario_names(con, "Building 2") == []
+
+
+def test_materialization_overlays_the_changes(con):
+    query, params = scenarios.materialize_sql("Building 1", [scenarios.BASE, "Reuse"])
+    rows = con.execute(
+        f"""SELECT "Scenario", "Product", "Virgin", "Reused", "Recycled", "Repurposed", "Building", "Mass"
+            FROM ({query}) ORDER BY 1, 2""",
+        params,
+    ).fetchall()
+    base = [(scenarios.BASE, *row) for row in BASE_ROWS if row[5] == "Building 1"]
+    assert rows == base + [("Reuse", *row) for row in EDITED_INVENTORY]
+
+
+def test_saving_again_replaces_the_scenario(con):
+    con.execute("DELETE FROM edited WHERE \"Product\" = 'P4'")
+    assert scenarios.save(con, "Building 1", "Reuse", "edited") == 2
+    with pytest.raises(ValueError):
+        scenarios.save(con, "Building 1", scenarios.BASE, "edited")
+    scenarios.delete(con, "Building 1", "Reuse")
+    assert scenarios.scenario_names(con, "Building 1") == []
+
+
+@pytest.mark.parametrize("efficiency", [0.95, 0.8])
+def test_compare_scores_as_the_building_views(con, efficiency):
+    # the base row is the building score of Section 3 and the portfolio
+    compared = scenarios.compare(con, "Building 1", efficiency=efficiency, dis_pot=0.7).fetchall()
+    assert [row[0] for row in compared] == [scenarios.BASE, "Reuse"]
+    base = building_aggregates.building_indicators(con, "Building 1", efficiency, 0.7).fetchone()
+    assert compared[0][1:6] == pytest.approx(base[1:], rel=1e-12)
+    assert compared[0][6:] == (0.0, 0.0)
+
+    # the scenario row scores as the edited inventory stored for real
+    edited = duckdb.connect()
+    migrate(edited)
+    products.upsert_rows(edited, EDITED_INVENTORY)
+    expected = building_aggregates.building_indicators(edited, "Building 1", efficiency, 0.7).fetchone()
+    assert compared[1][1:6] == pytest.approx(expected[1:], rel=1e-12)
+    assert compared[1][6] == pytest.approx(expected[3] - base[3])
+    assert compared[1][7] == pytest.approx(expected[5] - base[5])
+    edited.close()
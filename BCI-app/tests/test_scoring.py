@@ -0,0 +1,57 @@
+import duckdb
+import pytest
+
+import building_aggregates
+import scoring
+from migrations import applied_version, create_r_strategies, migrate
+
+LEGACY_ROWS = [("Product 1", 0.5, 0.2, 0.2, 0.1), ("Product 2", 1.0, 0.0, 0.0, 0.0), ("Product 3", 0.1, 0.3, 0.5, 0.1)]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    # the flat table of the original dbsetup.py, never migrated
+    path = tmp_path / "legacy.db"
+    with duckdb.connect(str(path)) as con:
+        create_r_strategies(con)
+        con.executemany("INSERT INTO r_strategies VALUES (?, ?, ?, ?, ?)", LEGACY_ROWS)
+    return path
+
+
+def test_unmigrated_database_is_scored_as_migrated(legacy_db, tmp_path):
+    scoring.score([legacy_db], tmp_path / "scores", efficiency=0.9, dis_pot=0.8, workers=1)
+    scored = scoring.read_scores(tmp_path / "scores").fetchall()
+
+    # the source is read, not migrated
+    with duckdb.connect(str(legacy_db), read_only=True) as con:
+        assert applied_version(con) == 0
+    with duckdb.connect() as con:
+        create_r_strategies(con)
+        con.executemany("INSERT INTO r_strategies VALUES (?, ?, ?, ?, ?)", LEGACY_ROWS)
+        migrate(con)
+        expected = building_aggregates.building_indicators(con, efficiency=0.9, dis_pot=0.8).fetchall()
+    assert [row[:2] for row in scored] == [row[:2] for row in expected] == [("Building 1", 3)]
+    assert scored[0][2:] == pytest.approx(expected[0][2:], rel=1e-12)
+
+
+def test_interrupted_runs_resume_and_finished_runs_are_not_patched(tmp_path):
+    csv = tmp_path / "products.csv"
+    csv.write_text("Product,Virgin,Reused,Recycled,Repurposed,Building\n"
+                   + "".join(f"P{i},1,0,0,0,Building {i}\n" for i in range(4)))
+    output = tmp_path / "scores"
+
+    def interrupt(done, total):
+        if done == 2:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        scoring.score([csv], output, workers=1, chunk_size=1, progress=interrupt)
+    summary = scoring.score([csv], output, workers=1, chunk_size=1)
+    assert (summary["buildings"], summary["resumed"]) == (4, 2)
+    assert len(scoring.read_scores(output).fetchall()) == 4
+    assert not (output / scoring.SNAPSHOT).exists()
+
+    # the snapshot of a finished run is gone, its deleted parts cannot be scored again
+    scoring.part_path(output, 1).unlink()
+    with pytest.raises(ValueError, match="fresh output directory"):
+        scoring.score([csv], output, workers=1, chunk_size=1)
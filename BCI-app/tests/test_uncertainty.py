@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import uncertainty
+
+
+def test_sample_count_is_bounded():
+    assert uncertainty.sample_count(None) == 1_000_000
+    assert uncertainty.sample_count("") == 1_000_000
+    assert uncertainty.sample_count(10) == uncertainty.MIN_SAMPLES
+    assert uncertainty.sample_count(10**12) == uncertainty.MAX_SAMPLES
+    assert uncertainty.sample_count(250_000.0) == 250_000
+
+
+def test_pooled_run_matches_serial_run():
+    distributions = uncertainty.around({"F_R": 30, "C_R": 40}, 0.8, 0.2)
+    serial = list(uncertainty.run(distributions, 50_000, seed=3, chunk_size=10_000))[-1]
+    with ThreadPoolExecutor(2) as pool:
+        pooled = list(uncertainty.run(distributions, 50_000, seed=3, chunk_size=10_000, pool=pool))[-1]
+    assert pooled.n_done == serial.n_done == 50_000
+    assert np.array_equal(pooled.mci_counts, serial.mci_counts)
+    assert np.array_equal(pooled.bci_counts, serial.bci_counts)
+
+
+def test_infeasible_runs_have_no_percentiles():
+    # input fractions of 120% make every sample infeasible
+    distributions = uncertainty.around({"F_R": 60, "F_U": 60}, 0.8, 0.0)
+    summary = list(uncertainty.run(distributions, 20_000, chunk_size=10_000))[-1].summary()
+    assert (summary["samples"], summary["infeasible"]) == (20_000, 20_000)
+    assert summary["MCI"] is None and summary["BCI"] is None
+
+    summary = list(uncertainty.run(uncertainty.around({"F_R": 60}, 0.8, 0.1), 20_000))[-1].summary()
+    assert summary["infeasible"] == 0
+    assert 0 <= summary["BCI"][5] <= summary["BCI"][50] <= summary["BCI"][95] <= summary["MCI"][95] <= 1
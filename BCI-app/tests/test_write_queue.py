@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+import products
+from database import BuildingDatabase
+from migrations import migrate
+from write_queue import MAX_FAILED, QueueFull, WriteBehindQueue
+
+
+def row(name, virgin=1.0, mass=1.0):
+    return (name, virgin, 0.0, 0.0, 0.0, "Building 1", mass)
+
+
+@pytest.fixture
+def db():
+    db = BuildingDatabase(":memory:")
+    with db.write() as con:
+        migrate(con)
+        products.upsert_rows(con, [row("Stored", virgin=0.5, mass=2.0)])
+    yield db
+    db.close()
+
+
+def test_existing_and_repeated_names_are_rejected(db):
+    q = WriteBehindQueue(db)
+    new, stored, repeated = q.submit(row("New")), q.submit(row("Stored")), q.submit(row("New"))
+    q.flush()
+    assert new.result() is None
+    with pytest.raises(ValueError, match="already exists"):
+        stored.result()
+    with pytest.raises(ValueError, match="twice"):
+        repeated.result()
+    q.close()
+    with db.cursor() as con:
+        # the stored product is left untouched
+        assert con.execute("""SELECT "Virgin", "Mass" FROM r_strategies WHERE "Product" = 'Stored'""").fetchone() \
+            == (0.5, 2.0)
+        assert products.product_count(con) == 2
+    assert q.stats()["written"] == 1 and q.stats()["failed"] == 2
+
+
+def test_failed_rows_are_bounded(db):
+    q = WriteBehindQueue(db)
+    futures = [q.submit(row("Stored")) for _ in range(MAX_FAILED + 10)]
+    q.flush()
+    q.close()
+    assert all(isinstance(f.exception(), ValueError) for f in futures)
+    assert len(q.failed) == MAX_FAILED and q.stats()["failed"] == MAX_FAILED + 10
+
+
+def test_invalid_row_does_not_fail_its_batch(db):
+    q = WriteBehindQueue(db, flush_interval=0.2)
+    good, bad = q.submit(row("Good")), q.submit(("Bad", "not a number", 0, 0, 0, "Building 1", 1.0))
+    q.flush()
+    q.close()
+    assert good.result() is None
+    assert bad.exception() is not None
+
+
+def test_submit_does_not_block_when_full(db):
+    release = threading.Event()
+
+    def slow_write(con, rows):
+        release.wait(5)
+
+    q = WriteBehindQueue(db, write_rows=slow_write, maxsize=1)
+    first = q.submit(row("A"))
+    while q.pending:  # taken by the writer, which now waits
+        time.sleep(0.01)
+    q.submit(row("B"))
+    start = time.perf_counter()
+    with pytest.raises(QueueFull):
+        q.submit(row("C"))
+    assert time.perf_counter() - start < 0.1
+    release.set()
+    q.flush()
+    q.close()
+    assert first.result() is None
@@ -0,0 +1,220 @@
+#######################################################################################################################
+# Monte Carlo uncertainty propagation for the MCI and BCI
+# Each parameter takes a distribution, samples are drawn in chunks from a fixed seed and accumulated into fixed-width
+# histograms on [0, 1], so memory stays bounded whatever the number of samples. Large runs are spread over one process
+# pool shared by all runs of the process (BCI_MC_WORKERS processes, half the CPUs by default), and partial results are
+# available after every chunk. Runs are limited to BCI_MC_MAX_SAMPLES samples.
+#######################################################################################################################
+
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+
+from sensitivity import DEFAULTS, PARAMETERS, evaluate
+
+BINS = 10_000
+PERCENTILES = (5, 50, 95)
+CHUNK_SIZE = 250_000
+POOL_THRESHOLD = 4_000_000  # below this many samples the run stays in the calling process
+MIN_SAMPLES = 1_000
+MAX_SAMPLES = int(os.environ.get("BCI_MC_MAX_SAMPLES", 20_000_000))
+WORKERS = int(os.environ.get("BCI_MC_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+
+
+#%% Distributions
+# A distribution is a tuple in slider units (%), "DDF" is the disassembly potential on [0, 1]:
+#   ("fixed", value), ("uniform", low, high), ("normal", mean, sd), ("triangular", low, mode, high)
+def draw(distribution, n, rng):
+    kind, *args = distribution
+    if kind == "fixed":
+        return np.full(n, float(args[0]))
+    if kind == "uniform":
+        return rng.uniform(args[0], args[1], n)
+    if kind == "normal":
+        return rng.normal(args[0], args[1], n)
+    if kind == "triangular":
+        low, mode, high = args
+        if low == high:
+            return np.full(n, float(mode))
+        return rng.triangular(low, mode, high, n)
+    raise ValueError(f"Unknown distribution {kind!r}")
+
+
+def around(values, dis_pot, spread):
+    """Triangular distributions of +/- `spread` (relative) around slider values and a disassembly potential."""
+    distributions = {}
+    for p, (_, low, high) in PARAMETERS.items():
+        v = float(values.get(p, DEFAULTS[p]))
+        distributions[p] = ("triangular", max(low, v*(1-spread)), v, min(high, v*(1+spread)))
+    distributions["DDF"] = ("triangular", max(0.0, dis_pot*(1-spread)), dis_pot, min(1.0, dis_pot*(1+spread)))
+    return distributions
+
+
+def sample_chunk(distributions, n, rng):
+    samples = {}
+    for p, (_, low, high) in PARAMETERS.items():
+        samples[p] = np.clip(draw(distributions.get(p, ("fixed", DEFAULTS[p])), n, rng), low, high)
+    dis_pot = np.clip(draw(distributions.get("DDF", ("fixed", 1.0)), n, rng), 0, 1)
+    return samples, dis_pot
+
+
+def chunk_histograms(distributions, n, seed_sequence, bins=BINS):
+    """MCI and BCI histogram counts of one chunk, plus its number of infeasible samples."""
+    rng = np.random.default_rng(seed_sequence)
+    samples, dis_pot = sample_chunk(distributions, n, rng)
+    mci, bci = evaluate(samples, dis_pot)
+    feasible = ~np.isnan(mci)
+    return (
+        np.histogram(mci[feasible], bins=bins, range=(0, 1))[0],
+        np.histogram(bci[feasible], bins=bins, range=(0, 1))[0],
+        int(n - feasible.sum()),
+    )
+
+
+#%% Accumulated results
+class MonteCarloResult:
+
+    def __init__(self, n_total, bins=BINS):
+        self.n_total = n_total
+        self.n_done = 0
+        self.n_infeasible = 0
+        self.mci_counts = np.zeros(bins, dtype=np.int64)
+        self.bci_counts = np.zeros(bins, dtype=np.int64)
+
+    def add(self, n, mci_counts, bci_counts, n_infeasible):
+        self.n_done += n
+        self.n_infeasible += n_infeasible
+        self.mci_counts += mci_counts
+        self.bci_counts += bci_counts
+
+    @staticmethod
+    def _percentiles(counts, q):
+        total = counts.sum()
+        cumulative = np.cumsum(counts)
+        edges = np.linspace(0, 1, len(counts) + 1)
+        result = []
+        for p in q:
+            target = p/100 * total
+            i = min(int(np.searchsorted(cumulative, target)), len(counts) - 1)
+            below = cumulative[i-1] if i > 0 else 0
+            within = (target - below) / counts[i] if counts[i] else 0.0
+            result.append(float(edges[i] + within*(edges[i+1] - edges[i])))
+        return result
+
+    def summary(self, q=PERCENTILES):
+        """Sample counts and the MCI and BCI percentiles {q: value}, None while no sample is feasible."""
+        feasible = self.n_done - self.n_infeasible
+        return {
+            "samples": self.n_done,
+            "total": self.n_total,
+            "infeasible": self.n_infeasible,
+            "MCI": dict(zip(q, self._percentiles(self.mci_counts, q))) if feasible else None,
+            "BCI": dict(zip(q, self._percentiles(self.bci_counts, q))) if feasible else None,
+        }
+
+
+def chunk_sizes(n, chunk_size=CHUNK_SIZE):
+    return [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+
+
+def sample_count(value, default=1_000_000):
+    """Number of samples of a run, `value` clamped to [MIN_SAMPLES, MAX_SAMPLES], `default` if it is empty."""
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        n = default
+    return min(max(n, MIN_SAMPLES), MAX_SAMPLES)
+
+
+#%% Shared process pool
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool():
+    """The process pool of WORKERS processes used by every large run of the process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_pool)
+
+
+def run(distributions, n, seed=0, chunk_size=CHUNK_SIZE, pool=None, cancel=None):
+    """Yield the accumulated MonteCarloResult after every chunk.
+
+    Chunks are seeded from SeedSequence(seed).spawn(), so the final result does not depend on the number of workers.
+    Runs of n >= POOL_THRESHOLD samples go to `pool` (shared_pool() by default), their chunks queue behind those of
+    the other runs. `cancel` is an optional threading.Event stopping the run.
+    """
+    sizes = chunk_sizes(n, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    result = MonteCarloResult(n)
+    if pool is None and (n < POOL_THRESHOLD or WORKERS == 1):
+        for size, seed_sequence in zip(sizes, seeds):
+            if cancel is not None and cancel.is_set():
+                return
+            result.add(size, *chunk_histograms(distributions, size, seed_sequence))
+            yield result
+        return
+
+    pool = pool or shared_pool()
+    futures = {pool.submit(chunk_histograms, distributions, size, s): size for size, s in zip(sizes, seeds)}
+    try:
+        for future in as_completed(futures):
+            if cancel is not None and cancel.is_set():
+                return
+            result.add(futures[future], *future.result())
+            yield result
+    finally:
+        # chunks not started yet leave the pool to the other runs
+        for f in futures:
+            f.cancel()
+
+
+#%% Background runs for the app
+class BackgroundRun:
+    """Runs `run()` in a thread, the session polls latest() to stream partial results into the UI."""
+
+    def __init__(self, distributions, n, seed=0):
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._latest = None
+        self.error = None
+        self.done = False
+        self._thread = threading.Thread(target=self._work, args=(distributions, n, seed), daemon=True)
+        self._thread.start()
+
+    def _work(self, distributions, n, seed):
+        try:
+            for result in run(distributions, n, seed, cancel=self._cancel):
+                # summaries are small (percentiles only), the histograms stay in this thread
+                summary = result.summary()
+                with self._lock:
+                    self._latest = summary
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def cancel(self):
+        self._cancel.set()
@@ -0,0 +1,153 @@
+#######################################################################################################################
+# Write-behind queue for product inserts
+# Sessions submit rows and return immediately, a background thread batches the rows of all sessions into a single
+# insert transaction every `flush_interval` seconds or every `batch_size` rows. The queue is bounded: once `maxsize`
+# rows are waiting, submit() raises QueueFull at once (backpressure) rather than blocking the event loop. Every row
+# gets a future, resolved once its batch is committed or failed with the reason the row was rejected, e.g. a product
+# name that is already stored. Pending rows are flushed when the interpreter exits.
+#######################################################################################################################
+
+import atexit
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from queue import Full as QueueFull  # re-exported for callers
+
+from products import insert_rows
+
+MAX_FAILED = 100
+
+
+class WriteBehindQueue:
+    """Background writer of rows with `write_rows(con, rows)`.
+
+    write_rows returns {index in rows: reason} of the rows it rejected, the other rows are written.
+    """
+
+    def __init__(self, db, write_rows=insert_rows, name="products", flush_interval=0.05, batch_size=500,
+                 maxsize=10_000):
+        self.db = db
+        self.write_rows = write_rows
+        self.name = name
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.n_failed = 0
+        # the last MAX_FAILED rejected rows with their reason, for inspection
+        self.failed = collections.deque(maxlen=MAX_FAILED)
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, row):
+        """Queue one row for write_rows (in products.PRODUCT_COLUMNS order by default), never blocks.
+
+        Returns a concurrent.futures.Future resolved when the row is written, or failed with the error rejecting it.
+        Raises QueueFull if `maxsize` rows are already waiting.
+        """
+        if self._stop.is_set():
+            raise RuntimeError("The write-behind queue is closed")
+        future = Future()
+        self._queue.put_nowait((tuple(row), future))
+        self.submitted += 1
+        return future
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, items):
+        with self.db.write() as con:
+            rejected = self.write_rows(con, [row for row, _ in items]) or {}
+        for i, (row, future) in enumerate(items):
+            if i in rejected:
+                self._fail(row, future, ValueError(rejected[i]))
+            else:
+                self.written += 1
+                future.set_result(None)
+
+    def _fail(self, row, future, error):
+        print(f"Write-behind insert of {row[0]!r} failed: {error}")
+        self.n_failed += 1
+        self.failed.append((row, str(error)))
+        future.set_exception(error)
+
+    def _write(self, batch):
+        try:
+            self._insert(batch)
+        except Exception:
+            # the transaction was rolled back, retry row by row so that one invalid row does not take the rest of the
+            # batch with it
+            for item in batch:
+                try:
+                    self._insert([item])
+                except Exception as e:
+                    self._fail(*item, e)
+        finally:
+            self.batches += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Block until every submitted row has been written (or has failed)."""
+        self._queue.join()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def stats(self):
+        return {"submitted": self.submitted, "written": self.written, "pending": self.pending,
+                "batches": self.batches, "failed": self.n_failed}
+
+
+#%% One queue per database and name in the process
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(db, name="products", **options):
+    with _queues_lock:
+        key = (id(db), name)
+        if key not in _queues:
+            _queues[key] = WriteBehindQueue(db, name=name, **options)
+        return _queues[key]
+
+
+def close_all():
+    with _queues_lock:
+        for q in _queues.values():
+            q.close()
+        _queues.clear()
+
+
+# atexit handlers run in reverse order, this module is imported after database.py so pending rows are written before
+# the connections close
+atexit.register(close_all)